@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Run a historical backfill from the command line, without the Functions timeout
+
+Uses the Function App settings (GITHUB_*, SQL_*, BACKFILL_*), read from the environment or
+from local.settings.json, e.g.:
+
+    python backfill.py --from 2024-01-01 --to 2024-07-01
+    python backfill.py --from 2024-01-01 --entities deployments,pull_requests --repos org/api,org/web
+
+Checkpoints are written after every page; running the same command again after a crash
+resumes where it stopped.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+
+def load_settings(path):
+    """Export local.settings.json Values that are not already set in the environment"""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        values = json.load(f).get("Values", {})
+    for name, value in values.items():
+        os.environ.setdefault(name, value)
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill DORA history for a date range")
+    parser.add_argument("--from", dest="start", required=True, type=parse_date, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", type=parse_date, help="Day after the last one (default: now)")
+    parser.add_argument("--entities", help="Comma-separated subset of deployments,pull_requests,incidents")
+    parser.add_argument("--repos", help="Comma-separated owner/name list (default: whole org)")
+    parser.add_argument("--settings", default="local.settings.json")
+    args = parser.parse_args()
+
+    load_settings(args.settings)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Imported after the settings are exported, since function_app reads them at import time
+    import function_app
+
+    summary = function_app.run_backfill(
+        args.start,
+        args.end or datetime.now(timezone.utc),
+        args.entities.split(",") if args.entities else None,
+        args.repos.split(",") if args.repos else None
+    )
+    print(json.dumps(summary, indent=2))
+    sys.exit(0 if summary["complete"] else 1)
+
+
+if __name__ == "__main__":
+    main()
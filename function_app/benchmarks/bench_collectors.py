@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark: end-to-end GitHub collection against the local fake GitHub (benchmarks/fake_github.py)
+For each organization size, starts the fake in a separate process and runs
+collect_github_deployments, collect_github_pull_requests and collect_github_incidents (and
+optionally collect_github_all) through the real token provider, rate-limit governor, query
+builders, concurrency and pagination. Reports pages/s, items/s, peak Python heap (tracemalloc,
+whose overhead is included in the timings), GraphQL points and bytes received.
+
+--save writes the results as JSON; --compare fails (exit 1) when a later run regresses beyond
+--tolerance against such a file, so it can gate a deploy.
+
+Usage: python benchmarks/bench_collectors.py --repos 10,1000,20000 --latency-ms 120 --concurrency 8 --save baseline.json
+       python benchmarks/bench_collectors.py --repos 10,1000,20000 --latency-ms 120 --concurrency 8 --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, ".."))
+
+import fake_github  # noqa: E402
+
+COLLECTORS = {
+    "deployments": "collect_github_deployments",
+    "pull_requests": "collect_github_pull_requests",
+    "incidents": "collect_github_incidents",
+    "all": "collect_github_all"
+}
+
+
+def start_fake(repo_count: int, args):
+    """Fake GitHub in its own process (so it does not compete for the collector's GIL); returns (process, url)"""
+    context = multiprocessing.get_context("spawn")
+    port = context.Value("i", 0)
+    process = context.Process(target=run_fake, args=(repo_count, args, port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 120
+    while not port.value:
+        if time.monotonic() > deadline or not process.is_alive():
+            raise RuntimeError("Fake GitHub did not start")
+        time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port.value}"
+
+
+def run_fake(repo_count: int, args, port) -> None:
+    fake_github.serve(fake_github.build_fake(repo_count, args), 0, port)
+
+
+def configure_environment(args) -> None:
+    """Function App settings for the fake; must run before function_app is imported"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    os.environ.update({
+        "GITHUB_ORG_NAME": fake_github.ORG,
+        "GITHUB_APP_ID": "1",
+        "GITHUB_APP_INSTALLATION_ID": "1",
+        "GITHUB_APP_PRIVATE_KEY": key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                                    serialization.NoEncryption()).decode(),
+        "GITHUB_API_URL": "http://127.0.0.1:0",  # Replaced per organization size
+        "WATERMARK_STORE": "none",
+        "SHARDING_ENABLED": "false",
+        "GITHUB_FETCH_CONCURRENCY": str(args.concurrency),
+        "GITHUB_REQUESTS_PER_SECOND": str(args.requests_per_second)
+    })
+
+
+def run_collector(function_app, url: str, collector: str, measure_memory: bool) -> dict:
+    """Run one collector from a cold token/governor state and return its metrics"""
+    requests.post(f"{url}/_reset", timeout=10)
+    function_app.GITHUB_API_URL = url
+    function_app.GITHUB_GRAPHQL_URL = f"{url}/graphql"
+    function_app._github_token_provider.invalidate()
+    function_app.github_rate_limiter = function_app.GitHubRateLimitGovernor(
+        requests_per_second=function_app.GITHUB_REQUESTS_PER_SECOND,
+        burst=function_app.GITHUB_FETCH_CONCURRENCY,
+        reserve_points=function_app.GITHUB_RATE_LIMIT_RESERVE_POINTS,
+        max_wait_seconds=function_app.GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS
+    )
+
+    if measure_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    result = getattr(function_app, COLLECTORS[collector])(function_app.get_github_app_token(), None)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if measure_memory else 0
+    if measure_memory:
+        tracemalloc.stop()
+
+    stats = requests.get(f"{url}/_stats", timeout=10).json()
+    items = sum(len(records) for records in result.values()) if isinstance(result, dict) else len(result)
+    pages = sum(stats["requests"].values())
+    return {
+        "seconds": round(elapsed, 3),
+        "items": items,
+        "pages": pages,
+        "pages_per_second": round(pages / elapsed, 2),
+        "items_per_second": round(items / elapsed, 1),
+        "peak_memory_mb": round(peak / 1048576, 2),
+        "graphql_points": stats["points"],
+        "bytes_received": stats["bytes"],
+        "rate_limited": stats["rate_limited"] + stats["secondary_limited"],
+        "throttled_seconds": function_app.github_rate_limiter.get_stats()["throttled_seconds"]
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of results against baseline"""
+    problems = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        if current["items"] != previous["items"]:
+            problems.append(f"{key}: collected {current['items']} items, baseline {previous['items']}")
+        if current["items_per_second"] < previous["items_per_second"] * (1 - tolerance):
+            problems.append(f"{key}: {current['items_per_second']} items/s, baseline {previous['items_per_second']}")
+        for metric in ("graphql_points", "peak_memory_mb"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                problems.append(f"{key}: {metric} {current[metric]}, baseline {previous[metric]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", default="10,1000", help="Comma-separated organization sizes")
+    parser.add_argument("--collectors", default="deployments,pull_requests,incidents", help=f"Comma-separated subset of {','.join(COLLECTORS)}")
+    parser.add_argument("--concurrency", type=int, default=4, help="GITHUB_FETCH_CONCURRENCY")
+    parser.add_argument("--requests-per-second", type=float, default=50, help="GITHUB_REQUESTS_PER_SECOND (client-side pacing)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (faster, no peak memory)")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON from --save; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression for --compare")
+    fake_github.add_arguments(parser)
+    args = parser.parse_args()
+
+    configure_environment(args)
+    logging.basicConfig(level=logging.WARNING)
+    import function_app
+
+    collectors = args.collectors.split(",")
+    print("=" * 104)
+    print(f"Collector benchmark: {args.latency_ms:.0f} ms/request, concurrency {args.concurrency}, "
+          f"{args.requests_per_second:g} req/s, {args.points_per_hour} points/h")
+    print("=" * 104)
+    print(f"{'repos':>6} {'collector':<14} {'seconds':>8} {'items':>7} {'pages':>6} {'pages/s':>8} {'items/s':>9} "
+          f"{'peak MB':>8} {'points':>7} {'KB in':>8} {'limited':>8}")
+
+    results = {}
+    for repo_count in [int(count) for count in args.repos.split(",")]:
+        process, url = start_fake(repo_count, args)
+        try:
+            for collector in collectors:
+                metrics = run_collector(function_app, url, collector, not args.no_memory)
+                results[f"{repo_count}/{collector}"] = metrics
+                print(f"{repo_count:>6} {collector:<14} {metrics['seconds']:>8.2f} {metrics['items']:>7} {metrics['pages']:>6} "
+                      f"{metrics['pages_per_second']:>8.1f} {metrics['items_per_second']:>9.1f} {metrics['peak_memory_mb']:>8.1f} "
+                      f"{metrics['graphql_points']:>7} {metrics['bytes_received'] / 1024:>8.0f} {metrics['rate_limited']:>8}")
+        finally:
+            process.terminate()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Benchmark: NumPy metrics engine vs. the SQL view logic on synthetic data
+Generates deployments, PRs and incidents, loads them into an in-memory SQLite database with the
+schema.sql indexes and runs the vw_lead_time_analysis / vw_cfr_analysis joins (first deployment
+per commit, incident range join) plus the daily GROUP BYs, then computes the same metrics with
+MetricsEngine and checks both agree. SQLite stands in for Azure SQL so the benchmark runs
+anywhere; absolute SQL timings on a provisioned database will differ, the join shapes do not.
+
+Usage: python benchmarks/bench_metrics_engine.py --deployments 1000000 --prs 500000 --incidents 50000 --sql-max-rows 200000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from metrics_engine import MetricsEngine, UNASSIGNED_TEAM  # noqa: E402
+
+START = int(np.datetime64("2024-01-01T00:00:00", "s").astype(np.int64))
+
+
+def generate(repos: int, deployments: int, prs: int, incidents: int, days: int, seed: int):
+    """Synthetic tables as column dicts with int64 epoch-second timestamps"""
+    rng = np.random.default_rng(seed)
+    repo_names = np.array([f"bench/repo-{i:05d}" for i in range(repos)], dtype=object)
+    span = days * 86400
+
+    deploy_repo = rng.integers(0, repos, deployments)
+    deploy_time = START + rng.integers(0, span, deployments)
+    commit_ids = rng.integers(0, max(deployments // 2, 1), deployments)  # Redeploys share commits
+    deployment_columns = {
+        "repository": repo_names[deploy_repo],
+        "environment": np.where(rng.random(deployments) < 0.6, "production", "staging").astype(object),
+        "status": np.where(rng.random(deployments) < 0.9, "SUCCESS", "FAILURE").astype(object),
+        "commit_sha": np.char.add("c", commit_ids.astype(str)).astype(object),
+        "created_at": deploy_time
+    }
+
+    # Most PRs merge a deployed commit (same repository); the rest never reach a deployment
+    source = rng.integers(0, deployments, prs)
+    deployed = rng.random(prs) < 0.8
+    merged = np.where(deployed, deploy_time[source] - rng.integers(60, 86400, prs), START + rng.integers(0, span, prs))
+    created = merged - rng.integers(600, 5 * 86400, prs)
+    first_commit = np.where(rng.random(prs) < 0.7, created - rng.integers(0, 3 * 86400, prs), np.iinfo(np.int64).min)
+    pr_columns = {
+        "repository": np.where(deployed, repo_names[deploy_repo[source]], repo_names[rng.integers(0, repos, prs)]),
+        "merge_commit_sha": np.where(deployed, deployment_columns["commit_sha"][source],
+                                     np.char.add("u", np.arange(prs).astype(str)).astype(object)),
+        "created_at": created,
+        "merged_at": merged,
+        "first_commit_date": first_commit
+    }
+
+    incident_created = START + rng.integers(0, span, incidents)
+    closed = rng.random(incidents) < 0.85
+    incident_columns = {
+        "repository": repo_names[rng.integers(0, repos, incidents)],
+        "product": np.where(rng.random(incidents) < 0.7, np.array(["checkout", "search", "payments"], dtype=object)[rng.integers(0, 3, incidents)], None),
+        "state": np.where(closed, "closed", "open").astype(object),
+        "created_at": incident_created,
+        "closed_at": np.where(closed, incident_created + rng.integers(300, 3 * 86400, incidents), np.iinfo(np.int64).min)
+    }
+
+    repository_columns = {
+        "name": repo_names,
+        "team": np.where(np.arange(repos) % 10 == 0, None, np.char.add("team-", (np.arange(repos) % 40).astype(str)).astype(object)),
+        "product": np.array(["checkout", "search", "payments", None], dtype=object)[np.arange(repos) % 4]
+    }
+    return deployment_columns, pr_columns, incident_columns, repository_columns
+
+
+def nullable(values):
+    return [None if value == np.iinfo(np.int64).min else int(value) for value in values]
+
+
+def load_sqlite(deployment_columns, pr_columns, incident_columns, repository_columns):
+    """In-memory copy of the tables and indexes the views use (timestamps as epoch seconds)"""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE deployments (deployment_id INTEGER PRIMARY KEY, repository TEXT, environment TEXT, status TEXT, commit_sha TEXT, created_at INTEGER);
+        CREATE TABLE pull_requests (id INTEGER PRIMARY KEY, repository TEXT, merge_commit_sha TEXT, created_at INTEGER, merged_at INTEGER, first_commit_date INTEGER);
+        CREATE TABLE incidents (id INTEGER PRIMARY KEY, repository TEXT, product TEXT, state TEXT, created_at INTEGER, closed_at INTEGER);
+        CREATE TABLE repositories (name TEXT PRIMARY KEY, team TEXT, product TEXT);
+    """)
+    conn.executemany("INSERT INTO deployments (repository, environment, status, commit_sha, created_at) VALUES (?, ?, ?, ?, ?)",
+                     zip(deployment_columns["repository"], deployment_columns["environment"], deployment_columns["status"],
+                         deployment_columns["commit_sha"], deployment_columns["created_at"].tolist()))
+    conn.executemany("INSERT INTO pull_requests (repository, merge_commit_sha, created_at, merged_at, first_commit_date) VALUES (?, ?, ?, ?, ?)",
+                     zip(pr_columns["repository"], pr_columns["merge_commit_sha"], pr_columns["created_at"].tolist(),
+                         pr_columns["merged_at"].tolist(), nullable(pr_columns["first_commit_date"])))
+    conn.executemany("INSERT INTO incidents (repository, product, state, created_at, closed_at) VALUES (?, ?, ?, ?, ?)",
+                     zip(incident_columns["repository"], incident_columns["product"], incident_columns["state"],
+                         incident_columns["created_at"].tolist(), nullable(incident_columns["closed_at"])))
+    conn.executemany("INSERT INTO repositories VALUES (?, ?, ?)",
+                     zip(repository_columns["name"], repository_columns["team"], repository_columns["product"]))
+    conn.executescript("""
+        CREATE INDEX IX_deployments_repo_env_created ON deployments (repository, environment, created_at);
+        CREATE INDEX IX_deployments_commit ON deployments (repository, commit_sha, environment, created_at);
+        CREATE INDEX IX_pull_requests_merge_commit ON pull_requests (merge_commit_sha);
+        CREATE INDEX IX_incidents_repo_created ON incidents (repository, created_at);
+    """)
+    return conn
+
+
+SQL_QUERIES = {
+    # deployment_metrics_daily / DF
+    "deployment_frequency": """
+        SELECT repository, created_at / 86400, COUNT(*), SUM(status = 'SUCCESS')
+        FROM deployments WHERE environment = 'production'
+        GROUP BY repository, created_at / 86400""",
+    # vw_lead_time_analysis restricted to the first production deployment, as lead_time_facts
+    "lead_time": """
+        WITH first_deployments AS (
+            SELECT repository, commit_sha, created_at,
+                   ROW_NUMBER() OVER (PARTITION BY repository, commit_sha ORDER BY created_at, deployment_id) as deploy_rank
+            FROM deployments WHERE environment = 'production'
+        )
+        SELECT pr.repository, fd.created_at / 86400, COUNT(*),
+               AVG(fd.created_at / 60 - COALESCE(pr.first_commit_date, pr.created_at) / 60)
+        FROM pull_requests pr
+        JOIN first_deployments fd ON fd.repository = pr.repository AND fd.commit_sha = pr.merge_commit_sha AND fd.deploy_rank = 1
+        GROUP BY pr.repository, fd.created_at / 86400""",
+    # vw_cfr_analysis with the "all" attribution rule as a range join
+    "change_failure_rate": """
+        SELECT d.repository, d.created_at / 86400, COUNT(*),
+               SUM(EXISTS (SELECT 1 FROM incidents i WHERE i.repository = d.repository
+                           AND i.created_at >= d.created_at AND i.created_at <= d.created_at + 86400))
+        FROM deployments d WHERE d.environment = 'production' AND d.status = 'SUCCESS'
+        GROUP BY d.repository, d.created_at / 86400""",
+    # incident_restore_daily
+    "time_to_restore": """
+        SELECT repository, closed_at / 86400, COUNT(*), AVG(closed_at / 60 - created_at / 60)
+        FROM incidents WHERE state = 'closed' AND closed_at IS NOT NULL
+        GROUP BY repository, closed_at / 86400"""
+}
+
+ENGINE_COLUMNS = {
+    "deployment_frequency": ("deployments", "successful_deployments"),
+    "lead_time": ("changes", "mean_lead_time_minutes"),
+    "change_failure_rate": ("deployments", "failed_deployments"),
+    "time_to_restore": ("restored_incidents", "mean_restore_minutes")
+}
+
+
+def compare(metric: str, engine_result, sql_rows) -> bool:
+    """Same (repository, day) groups with the same count and second column"""
+    first, second = ENGINE_COLUMNS[metric]
+    days = engine_result["period"].astype(np.int64)
+    engine = {(group, int(day)): (int(count), float(value))
+              for group, day, count, value in zip(engine_result["group"], days, engine_result[first], engine_result[second])}
+    sql = {(repository, int(day)): (int(count), float(value)) for repository, day, count, value in sql_rows}
+    if engine.keys() != sql.keys():
+        return False
+    return all(engine[key][0] == sql[key][0] and abs(engine[key][1] - sql[key][1]) < 1e-6 for key in engine)
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, default=2000)
+    parser.add_argument("--deployments", type=int, default=1000000)
+    parser.add_argument("--prs", type=int, default=500000)
+    parser.add_argument("--incidents", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sql-max-rows", type=int, default=200000,
+                        help="Skip the SQLite comparison above this many deployments (the range join is the slow part)")
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"Metrics engine benchmark: {args.deployments} deployments, {args.prs} PRs, {args.incidents} incidents, {args.repos} repos")
+    print("=" * 72)
+    tables, generate_seconds = timed(lambda: generate(args.repos, args.deployments, args.prs, args.incidents, args.days, args.seed))
+    print(f"generate: {generate_seconds:.2f}s")
+
+    engine, load_seconds = timed(lambda: MetricsEngine(*tables))
+    print(f"engine load (factorize + convert): {load_seconds:.2f}s  {engine.size}")
+
+    engine_results = {}
+    print(f"{'metric':<22} {'by':<11} {'period':<7} {'groups':>8} {'engine (s)':>11}")
+    for metric in ENGINE_COLUMNS:
+        for by, period in (("repository", "day"), ("team", "week"), ("product", "month")):
+            result, seconds = timed(lambda: engine.compute(metric, by, period))
+            if by == "repository":
+                engine_results[metric] = result
+            print(f"{metric:<22} {by:<11} {period:<7} {len(result['group']):>8} {seconds:>11.3f}")
+    assert UNASSIGNED_TEAM in set(engine.deployment_frequency("team", "month")["group"]), "repositories without a team must be grouped"
+
+    if args.deployments > args.sql_max_rows:
+        print(f"\nSQL comparison skipped (--sql-max-rows {args.sql_max_rows})")
+        return
+
+    conn, sql_load_seconds = timed(lambda: load_sqlite(*tables))
+    print(f"\nsqlite load + indexes: {sql_load_seconds:.2f}s")
+    print(f"{'metric':<22} {'sql (s)':>9} {'engine (s)':>11} {'speedup':>8} {'match':>6}")
+    for metric, query in SQL_QUERIES.items():
+        rows, sql_seconds = timed(lambda: conn.execute(query).fetchall())
+        _, engine_seconds = timed(lambda: engine.compute(metric, "repository", "day"))
+        match = compare(metric, engine_results[metric], rows)
+        print(f"{metric:<22} {sql_seconds:>9.3f} {engine_seconds:>11.3f} {sql_seconds / engine_seconds:>7.0f}x {str(match):>6}")
+        assert match, f"{metric}: engine and SQL results differ"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Benchmark: write path (store_deployments / store_pull_requests / store_incidents) per data store
+For each size, writes synthetic deployments, then the PRs merging their commits, then incidents
+following them, through the same store functions the collectors call (upserts plus the incremental
+daily metrics, lead time facts, deployment/incident links and restore-time aggregates). Each entity
+is written twice: one record per call (webhook deliveries) and batches of --batch-size (collector
+pages, PIPELINE_WRITE_BATCH_SIZE). Reports rows/s and per-call latency percentiles.
+
+Per-row runs stop after --per-row-max records (the rate is measured on that prefix and marked
+"sampled"), since a million single-record transactions only restate the per-call cost.
+DATA_STORE=sqlite (default) uses a fresh database file per run; --store sql writes to the Azure SQL
+database configured by SQL_SERVER/SQL_DATABASE, so point it at a scratch database.
+
+Usage: python benchmarks/bench_storage.py --rows 1000,100000,1000000 --batch-size 500
+       python benchmarks/bench_storage.py --store sql --rows 1000,10000 --per-row-max 1000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+START = datetime(2024, 1, 1)
+ENTITIES = ("deployments", "pull_requests", "incidents")
+
+
+def iso(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def deployment(i: int, run: str, repos: int) -> dict:
+    """Every other deployment redeploys a commit; roughly 60% production, 90% successful"""
+    created = START + timedelta(seconds=i * 37)
+    return {
+        "deployment_id": f"{run}-D{i}",
+        "repository": f"bench/repo-{i % repos:05d}",
+        "environment": "production" if i % 5 < 3 else "staging",
+        "commit_sha": f"{i // 2:040x}",
+        "created_at": iso(created),
+        "creator": "bench",
+        "status": "FAILURE" if i % 10 == 9 else "SUCCESS",
+        "status_updated_at": iso(created + timedelta(minutes=3))
+    }
+
+
+def pull_request(i: int, run: str, repos: int) -> dict:
+    """Merges the commit of deployment 2 * i (same repository) an hour before it"""
+    deployed = START + timedelta(seconds=2 * i * 37)
+    return {
+        "repository": f"bench/repo-{(2 * i) % repos:05d}",
+        "pr_number": i,
+        "title": f"{run} change {i}",
+        "author": "bench",
+        "created_at": iso(deployed - timedelta(hours=5)),
+        "merged_at": iso(deployed - timedelta(hours=1)),
+        "merge_commit_sha": f"{i:040x}",
+        "base_branch": "main",
+        "first_commit_date": iso(deployed - timedelta(hours=9)) if i % 3 else None
+    }
+
+
+def incident(i: int, run: str, repos: int) -> dict:
+    """Opened shortly after a deployment of its repository; 80% closed 90 minutes later"""
+    created = START + timedelta(seconds=i * 10 * 37 + 600)
+    closed = i % 5 != 0
+    return {
+        "repository": f"bench/repo-{(i * 10) % repos:05d}",
+        "issue_number": i,
+        "title": f"{run} incident {i}",
+        "created_at": iso(created),
+        "closed_at": iso(created + timedelta(minutes=90)) if closed else None,
+        "state": "closed" if closed else "open",
+        "labels": "incident, production",
+        "product": ("checkout", "search", None)[i % 3],
+        "creator": "bench",
+        "url": f"https://github.com/bench/issues/{i}"
+    }
+
+
+GENERATORS = {"deployments": deployment, "pull_requests": pull_request, "incidents": incident}
+
+
+def entity_rows(entity: str, rows: int) -> int:
+    """Records per entity for a size: all deployments, a PR per two deployments, an incident per ten"""
+    return {"deployments": rows, "pull_requests": max(rows // 2, 1), "incidents": max(rows // 10, 1)}[entity]
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+def open_store(function_app, store: str, path: str):
+    """Fresh data store for one run (a new file for SQLite)"""
+    function_app.DATA_STORE = store
+    if store == "sqlite":
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        function_app.DATA_STORE_PATH = path
+    function_app._data_store = None
+    return function_app.get_data_store()
+
+
+def run(function_app, store: str, path: str, rows: int, mode: str, batch_size: int, per_row_max: int, entities: list) -> dict:
+    """Write every entity for one size and mode; returns metrics per entity"""
+    data_store = open_store(function_app, store, path)
+    run_id = f"{mode[0]}{rows}-{int(time.time())}"
+    repos = max(min(rows // 20, 2000), 1)
+    size = 1 if mode == "per-row" else batch_size
+    writers = {
+        "deployments": data_store.store_deployments,
+        "pull_requests": data_store.store_pull_requests,
+        "incidents": data_store.store_incidents
+    }
+
+    results = {}
+    for entity in entities:
+        total = entity_rows(entity, rows)
+        limit = min(total, per_row_max) if mode == "per-row" else total
+        generate = GENERATORS[entity]
+        latencies = []
+        written = 0
+        while written < limit:
+            batch = [generate(i, run_id, repos) for i in range(written, min(written + size, limit))]
+            started = time.perf_counter()
+            writers[entity](batch)
+            latencies.append(time.perf_counter() - started)
+            written += len(batch)
+        seconds = sum(latencies)
+        results[entity] = {
+            "rows": written,
+            "sampled": written < total,
+            "calls": len(latencies),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(written / seconds, 1) if seconds else 0.0,
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", default="sqlite", choices=["sqlite", "sql"], help="DATA_STORE to benchmark")
+    parser.add_argument("--path", default=os.path.join(tempfile.gettempdir(), "dora_bench_storage.db"), help="SQLite file (recreated per run)")
+    parser.add_argument("--rows", default="1000,100000,1000000", help="Comma-separated deployment counts (PRs = rows/2, incidents = rows/10)")
+    parser.add_argument("--entities", default=",".join(ENTITIES), help=f"Comma-separated subset of {','.join(ENTITIES)} (in write order)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Records per store call in batched mode")
+    parser.add_argument("--per-row-max", type=int, default=20000, help="Records written one per call before the per-row rate is taken as sampled")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("WATERMARK_STORE", "none")
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    import function_app
+
+    entities = args.entities.split(",")
+    print("=" * 96)
+    print(f"Write path benchmark: DATA_STORE={args.store}, batch size {args.batch_size}, per-row max {args.per_row_max}")
+    print("=" * 96)
+    print(f"{'rows':>8} {'mode':<8} {'entity':<14} {'written':>8} {'calls':>7} {'seconds':>8} {'rows/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+
+    results = {}
+    for rows in [int(count) for count in args.rows.split(",")]:
+        for mode in ("per-row", "batched"):
+            metrics = run(function_app, args.store, args.path, rows, mode, args.batch_size, args.per_row_max, entities)
+            for entity, entity_metrics in metrics.items():
+                results[f"{rows}/{mode}/{entity}"] = entity_metrics
+                written = f"{entity_metrics['rows']}{'*' if entity_metrics['sampled'] else ''}"
+                print(f"{rows:>8} {mode:<8} {entity:<14} {written:>8} {entity_metrics['calls']:>7} {entity_metrics['seconds']:>8.2f} "
+                      f"{entity_metrics['rows_per_second']:>10.1f} {entity_metrics['p50_ms']:>8.2f} {entity_metrics['p99_ms']:>8.2f}")
+    print("* per-row run stopped at --per-row-max; rows/s measured on that prefix")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the GitHub API used by the collectors
+Serves the GraphQL shapes the Function App queries (organization.repositories, nodes(ids:),
+repository(owner:, name:) follow-up pages, organization.teams) over a synthetic organization,
+plus the GitHub App installation-token endpoint. Latency, the GraphQL point budget and the
+secondary (concurrency) limit are configurable, so collector throughput and API cost can be
+measured without a real org.
+
+Point the Function App at it with GITHUB_API_URL=http://127.0.0.1:<port>; any GITHUB_APP_* values work.
+
+Usage: python benchmarks/fake_github.py --repos 20000 --latency-ms 120 --points-per-hour 5000 --port 8765
+
+GET /_stats returns request, node, byte and point counters; POST /_reset clears them and refills the budget.
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ORG = "bench-org"
+INCIDENT_WINDOW_HOURS = 24  # Active repositories' incidents are updated within this window (the collectors' default INCIDENT_LOOKBACK_HOURS)
+
+
+def iso(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.b64encode(f"cursor:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor) -> int:
+    return int(base64.b64decode(cursor).decode().split(":")[1]) if cursor else 0
+
+
+class SyntheticOrganization:
+    """
+    Deterministic organization: repositories are created up front, their deployments, PRs and
+    incident issues lazily (and cached) the first time a repository is queried
+    Activity is skewed like real orgs: active_fraction of the repositories were pushed within the
+    last day and carry most of the recent deployments/PRs, and their incidents were updated within
+    INCIDENT_WINDOW_HOURS so the incident collector has work; the rest are increasingly dormant.
+    """
+
+    def __init__(self, repo_count: int, seed: int = 1, active_fraction: float = 0.3, history_days: int = 14,
+                 deployments_per_repo: float = 12, prs_per_repo: float = 10, incidents_per_repo: float = 1,
+                 team_count: int = 50):
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.seed = seed
+        self.history_days = history_days
+        self.deployments_per_repo = deployments_per_repo
+        self.prs_per_repo = prs_per_repo
+        self.incidents_per_repo = incidents_per_repo
+        rng = random.Random(seed)
+        repos = []
+        for index in range(repo_count):
+            if rng.random() < active_fraction:
+                pushed_at = self.now - timedelta(seconds=rng.randint(0, 86400))
+            else:
+                pushed_at = self.now - timedelta(days=1 + rng.expovariate(1 / 60))
+            repos.append({"index": index, "id": f"R_{index:08d}", "name": f"repo-{index:05d}", "pushed_at": pushed_at})
+        # organization.repositories is paged newest activity first
+        self.repositories = sorted(repos, key=lambda repo: repo["pushed_at"], reverse=True)
+        self.by_id = {repo["id"]: repo for repo in repos}
+        self.by_name = {repo["name"]: repo for repo in repos}
+        self._items = {}
+        self.teams = [{"name": f"Team {t}", "slug": f"team-{t}",
+                       "repositories": [f"{ORG}/{repo['name']}" for repo in repos if repo["index"] % team_count == t]}
+                      for t in range(min(team_count, repo_count))]
+
+    def items(self, index: int):
+        """(deployments, pull requests, issues) of one repository, each newest first by its order field"""
+        cached = self._items.get(index)
+        if cached is None:
+            # Generation is deterministic, so concurrent requests racing here produce the same lists
+            cached = self._items[index] = self._generate(index)
+        return cached
+
+    def _generate(self, index: int):
+        repo = self.by_id[f"R_{index:08d}"]
+        rng = random.Random(self.seed * 1_000_003 + index)
+        age_days = (self.now - repo["pushed_at"]).total_seconds() / 86400
+        # Dormant repositories have had little recent activity, and none after their last push
+        scale = 1.0 if age_days < 1 else max(0.0, 1 - age_days / self.history_days)
+        latest = repo["pushed_at"]
+        earliest = self.now - timedelta(days=self.history_days)
+
+        def moments(mean: float, since: datetime = earliest):
+            count = int(rng.expovariate(1 / mean) * scale) if mean > 0 else 0
+            span = max((latest - since).total_seconds(), 1)
+            return sorted((latest - timedelta(seconds=rng.uniform(0, span)) for _ in range(count)), reverse=True)
+
+        name = f"{ORG}/{repo['name']}"
+        deployments = []
+        for number, created_at in enumerate(moments(self.deployments_per_repo)):
+            environment = "production" if rng.random() < 0.6 else "staging"
+            deployments.append({
+                "id": f"DE_{index:08d}_{number:05d}",
+                "createdAt": iso(created_at),
+                "environment": environment,
+                "commit": {"oid": f"{index:08x}{number:032x}", "author": {"user": {"login": f"dev{rng.randint(0, 200)}"}}},
+                "creator": {"login": "github-actions[bot]"},
+                "latestStatus": {"state": "SUCCESS" if rng.random() < 0.9 else "FAILURE", "createdAt": iso(created_at + timedelta(minutes=3))}
+            })
+        pull_requests = []
+        for number, merged_at in enumerate(moments(self.prs_per_repo), start=1):
+            created_at = merged_at - timedelta(hours=rng.uniform(1, 72))
+            pull_requests.append({
+                "number": number,
+                "title": f"Change {number}",
+                "createdAt": iso(created_at),
+                "updatedAt": iso(merged_at + timedelta(minutes=1)),
+                "mergedAt": iso(merged_at),
+                "baseRefName": "main" if rng.random() < 0.9 else "develop",
+                "mergeCommit": {"oid": f"{index:08x}{number:032x}"},
+                "author": {"login": f"dev{rng.randint(0, 200)}"},
+                "commits": {"nodes": [{"commit": {"authoredDate": iso(created_at - timedelta(hours=rng.uniform(0, 48)))}}]}
+            })
+        issues = []
+        incidents_since = self.now - timedelta(hours=INCIDENT_WINDOW_HOURS) if age_days < 1 else earliest
+        for number, updated_at in enumerate(moments(self.incidents_per_repo, incidents_since), start=1000):
+            closed = rng.random() < 0.8
+            created_at = updated_at - timedelta(hours=rng.uniform(0.5, 24))
+            issues.append({
+                "number": number,
+                "title": f"Incident {number}",
+                "bodyText": f"### Product Affected\n\nproduct-{index % 7}\n",
+                "createdAt": iso(created_at),
+                "updatedAt": iso(updated_at),
+                "closedAt": iso(updated_at) if closed else None,
+                "state": "CLOSED" if closed else "OPEN",
+                "labels": {"nodes": [{"name": "incident"}, {"name": "production"}]},
+                "author": {"login": f"oncall{rng.randint(0, 20)}"},
+                "url": f"https://github.example/{name}/issues/{number}"
+            })
+        return deployments, pull_requests, issues
+
+
+CONNECTION_PATTERN = re.compile(r"(deployments|pullRequests|issues): \w+\(([^)]*)\)")
+ALIAS_INDEX = {"deployments": 0, "pullRequests": 1, "issues": 2}
+# Nested connections inside each item (commits(first: 1), labels(first: 20)) count towards the cost
+NESTED_FIRST = {"deployments": 0, "pullRequests": 1, "issues": 20}
+
+
+def query_connections(query: str):
+    """[(alias, first, arguments)] for the deployments/pullRequests/issues connections in a query"""
+    connections = []
+    for alias, arguments in CONNECTION_PATTERN.findall(query):
+        first = int(re.search(r"first: (\d+)", arguments).group(1))
+        connections.append((alias, first, arguments))
+    return connections
+
+
+def query_cost(parents: int, connections) -> int:
+    """GitHub's point formula: requests needed for every connection / 100, at least 1"""
+    requests_needed = 1
+    for alias, first, _ in connections:
+        requests_needed += parents
+        if NESTED_FIRST[alias]:
+            requests_needed += parents * first
+    return max(1, round(requests_needed / 100))
+
+
+class FakeGitHub:
+    """Request handling, latency, budgets and counters; HTTP-agnostic so it can be driven directly"""
+
+    def __init__(self, org: SyntheticOrganization, latency_ms: float = 100, per_node_ms: float = 0.05,
+                 jitter_ms: float = 0, points_per_hour: int = 5000, reset_seconds: float = 3600,
+                 max_concurrent: int = 0, secondary_retry_after: float = 1):
+        self.org = org
+        self.latency_ms = latency_ms
+        self.per_node_ms = per_node_ms
+        self.jitter_ms = jitter_ms
+        self.points_per_hour = points_per_hour
+        self.reset_seconds = reset_seconds
+        self.max_concurrent = max_concurrent
+        self.secondary_retry_after = secondary_retry_after
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.remaining = self.points_per_hour
+            self.reset_at = time.time() + self.reset_seconds
+            self.stats = {"requests": {}, "nodes": 0, "bytes": 0, "points": 0, "tokens_issued": 0,
+                          "rate_limited": 0, "secondary_limited": 0}
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = json.loads(json.dumps(self.stats))
+            stats["remaining"] = self.remaining
+            return stats
+
+    def _rate_limit_headers(self) -> dict:
+        return {
+            "x-ratelimit-resource": "graphql",
+            "x-ratelimit-limit": str(self.points_per_hour),
+            "x-ratelimit-remaining": str(max(self.remaining, 0)),
+            "x-ratelimit-used": str(self.points_per_hour - max(self.remaining, 0)),
+            "x-ratelimit-reset": str(int(self.reset_at))
+        }
+
+    def installation_token(self, authorization: str):
+        if not authorization.startswith("Bearer "):
+            return 401, {}, {"message": "A JSON web token could not be decoded"}
+        with self._lock:
+            self.stats["tokens_issued"] += 1
+            number = self.stats["tokens_issued"]
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        return 201, {}, {"token": f"ghs_fake{number:06d}", "expires_at": iso(expires_at)}
+
+    def graphql(self, authorization: str, payload: dict):
+        if not authorization.startswith("Bearer ghs_"):
+            return 401, {}, {"message": "Bad credentials"}
+        with self._lock:
+            if self.max_concurrent and self._in_flight >= self.max_concurrent:
+                self.stats["secondary_limited"] += 1
+                return 403, {"retry-after": str(self.secondary_retry_after)}, {"message": "You have exceeded a secondary rate limit."}
+            self._in_flight += 1
+        try:
+            return self._graphql(payload)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _graphql(self, payload: dict):
+        query = payload["query"]
+        variables = payload.get("variables") or {}
+        kind, data, parents, connections, nodes = self._resolve(query, variables)
+        cost = query_cost(parents, connections)
+
+        with self._lock:
+            if time.time() >= self.reset_at:
+                self.remaining = self.points_per_hour
+                self.reset_at = time.time() + self.reset_seconds
+            if cost > self.remaining:
+                self.stats["rate_limited"] += 1
+                self.remaining = 0
+                return 200, self._rate_limit_headers(), {"errors": [{"type": "RATE_LIMITED", "message": "API rate limit exceeded"}]}
+            self.remaining -= cost
+            self.stats["points"] += cost
+            self.stats["nodes"] += nodes
+            self.stats["requests"][kind] = self.stats["requests"].get(kind, 0) + 1
+            headers = self._rate_limit_headers()
+        if "rateLimit" in query:
+            data["rateLimit"] = {"cost": cost, "remaining": int(headers["x-ratelimit-remaining"]),
+                                 "resetAt": iso(datetime.fromtimestamp(self.reset_at, timezone.utc))}
+
+        delay = self.latency_ms + self.per_node_ms * nodes + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        time.sleep(delay / 1000)
+        return 200, headers, {"data": data}
+
+    def _connection(self, repo: dict, alias: str, first: int, arguments: str, cursor, variables: dict):
+        items = self.org.items(repo["index"])[ALIAS_INDEX[alias]]
+        environments = re.search(r"environments: \[([^\]]*)\]", arguments)
+        if environments:
+            allowed = set(re.findall(r'"([^"]+)"', environments.group(1)))
+            items = [item for item in items if item["environment"] in allowed]
+        if alias == "issues" and variables.get("since"):
+            items = [item for item in items if item["updatedAt"] >= variables["since"]]
+        offset = decode_cursor(cursor)
+        page = items[offset:offset + first]
+        has_next_page = offset + first < len(items)
+        return {"pageInfo": {"hasNextPage": has_next_page, "endCursor": encode_cursor(offset + len(page)) if page else None},
+                "nodes": page}
+
+    def _repository_node(self, repo: dict, connections, variables: dict):
+        node = {"id": repo["id"], "name": repo["name"], "owner": {"login": ORG},
+                "pushedAt": iso(repo["pushed_at"]), "updatedAt": iso(repo["pushed_at"])}
+        count = 1
+        for alias, first, arguments in connections:
+            node[alias] = self._connection(repo, alias, first, arguments, None, variables)
+            count += len(node[alias]["nodes"])
+        return node, count
+
+    def _resolve(self, query: str, variables: dict):
+        """(kind, data, parent count, connections, nodes returned) for a query"""
+        connections = query_connections(query)
+        if "nodes(ids:" in query:
+            nodes, total = [], 0
+            for repo_id in variables["ids"]:
+                repo = self.org.by_id.get(repo_id)
+                node, count = self._repository_node(repo, connections, variables) if repo else (None, 0)
+                nodes.append(node)
+                total += count
+            return "nodes", {"nodes": nodes}, len(variables["ids"]), connections, total
+
+        if "repository(owner:" in query:
+            repo = self.org.by_name[variables["name"]]
+            alias, first, arguments = connections[0]
+            connection = self._connection(repo, alias, first, arguments, variables.get("cursor"), variables)
+            return "repository", {"repository": {alias: connection}}, 1, connections, len(connection["nodes"])
+
+        if "team(slug:" in query:
+            team = next(team for team in self.org.teams if team["slug"] == variables["slug"])
+            offset = decode_cursor(variables.get("cursor"))
+            page = team["repositories"][offset:offset + 100]
+            repositories = {"pageInfo": {"hasNextPage": offset + 100 < len(team["repositories"]), "endCursor": encode_cursor(offset + 100)},
+                            "nodes": [{"nameWithOwner": name} for name in page]}
+            return "team", {"organization": {"team": {"repositories": repositories}}}, 1, [], len(page)
+
+        if "teams(" in query:
+            offset = decode_cursor(variables.get("cursor"))
+            page = self.org.teams[offset:offset + 100]
+            nodes = [{"name": team["name"], "slug": team["slug"], "repositories": {
+                "pageInfo": {"hasNextPage": len(team["repositories"]) > 100, "endCursor": encode_cursor(100)},
+                "nodes": [{"nameWithOwner": name} for name in team["repositories"][:100]]}} for team in page]
+            teams = {"pageInfo": {"hasNextPage": offset + 100 < len(self.org.teams), "endCursor": encode_cursor(offset + 100)}, "nodes": nodes}
+            return "teams", {"organization": {"teams": teams}}, len(page), [], sum(1 + len(node["repositories"]["nodes"]) for node in nodes)
+
+        first = int(re.search(r"repositories\(first: (\d+)", query).group(1))
+        offset = decode_cursor(variables.get("cursor"))
+        page = self.org.repositories[offset:offset + first]
+        nodes, total = [], 0
+        for repo in page:
+            node, count = self._repository_node(repo, connections, variables)
+            nodes.append(node)
+            total += count
+        has_next_page = offset + first < len(self.org.repositories)
+        repositories = {"pageInfo": {"hasNextPage": has_next_page, "endCursor": encode_cursor(offset + first) if has_next_page else None},
+                        "nodes": nodes}
+        kind = "repositories" if connections else "repository_ids"
+        return kind, {"organization": {"repositories": repositories}}, len(page), connections, total
+
+
+def make_handler(fake: FakeGitHub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, headers: dict, body: dict) -> None:
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+            with fake._lock:
+                fake.stats["bytes"] += len(payload)
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                self._send(200, {}, fake.get_stats())
+            else:
+                self._send(404, {}, {"message": "Not Found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            authorization = self.headers.get("Authorization", "")
+            if self.path == "/graphql":
+                self._send(*fake.graphql(authorization, json.loads(body)))
+            elif re.fullmatch(r"/app/installations/[^/]+/access_tokens", self.path):
+                self._send(*fake.installation_token(authorization))
+            elif self.path == "/_reset":
+                fake.reset()
+                self._send(200, {}, {"status": "reset"})
+            else:
+                self._send(404, {}, {"message": "Not Found"})
+
+    return Handler
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Organization and server behaviour options (shared with bench_collectors.py)"""
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--active-fraction", type=float, default=0.3, help="Share of repositories pushed within the last day")
+    parser.add_argument("--deployments-per-repo", type=float, default=12, help="Mean deployments per active repository over the history")
+    parser.add_argument("--prs-per-repo", type=float, default=10)
+    parser.add_argument("--incidents-per-repo", type=float, default=1)
+    parser.add_argument("--latency-ms", type=float, default=100, help="Fixed latency per GraphQL request")
+    parser.add_argument("--per-node-ms", type=float, default=0.05, help="Extra latency per returned node")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--points-per-hour", type=int, default=5000, help="GraphQL point budget (GitHub Apps get 5000-12500)")
+    parser.add_argument("--reset-seconds", type=float, default=3600, help="Budget window length")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Concurrent requests above this get a secondary rate limit 403 (0 = off)")
+
+
+def build_fake(repo_count: int, args) -> FakeGitHub:
+    org = SyntheticOrganization(repo_count, args.seed, args.active_fraction, deployments_per_repo=args.deployments_per_repo,
+                                prs_per_repo=args.prs_per_repo, incidents_per_repo=args.incidents_per_repo)
+    return FakeGitHub(org, args.latency_ms, args.per_node_ms, args.jitter_ms, args.points_per_hour, args.reset_seconds,
+                      args.max_concurrent)
+
+
+def serve(fake: FakeGitHub, port: int = 0, ready=None, host: str = "127.0.0.1") -> None:
+    """Serve fake until the process exits; ready (a multiprocessing.Value or None) receives the bound port"""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.value = server.server_address[1]
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = build_fake(args.repos, args)
+    print(f"Fake GitHub for org '{ORG}' ({args.repos} repos) on http://127.0.0.1:{args.port}")
+    serve(fake, args.port)
+
+
+if __name__ == "__main__":
+    main()
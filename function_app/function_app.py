@@ -6,14 +6,31 @@ Collects deployment data from GitHub organization and stores in Azure SQL Databa
 import azure.functions as func
 import logging
 import os
+import json
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import pyodbc
 from azure.identity import DefaultAzureCredential
 import requests
 import jwt
 import time
 import struct
+import base64
+import hmac
+import hashlib
+import threading
+import queue
+import tempfile
+import socket
+import re
+import itertools
+import functools
+import contextvars
+import sqlite3
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from cryptography.hazmat.primitives import serialization
 
 app = func.FunctionApp()
 
@@ -22,1220 +39,5258 @@ GITHUB_ORG = os.environ.get("GITHUB_ORG_NAME")
 GITHUB_APP_ID = os.environ.get("GITHUB_APP_ID")
 GITHUB_APP_INSTALLATION_ID = os.environ.get("GITHUB_APP_INSTALLATION_ID")
 GITHUB_APP_PRIVATE_KEY = os.environ.get("GITHUB_APP_PRIVATE_KEY")
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")  # REST base URL (GitHub Enterprise Server, or the local fake in benchmarks/fake_github.py)
+GITHUB_GRAPHQL_URL = os.environ.get("GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")  # On GitHub Enterprise Server: https://<host>/api/graphql (REST is https://<host>/api/v3)
 GITHUB_DEPLOYMENT_ENVIRONMENTS = os.environ.get("GITHUB_DEPLOYMENT_ENVIRONMENTS", "")  # Comma-separated list, e.g., "production,staging"
 BASE_BRANCH = os.environ.get("BASE_BRANCH", "main")  # Branch to track for PR merges
+DEPLOYMENT_LOOKBACK_HOURS = int(os.environ.get("DEPLOYMENT_LOOKBACK_HOURS", "24"))  # Hours to look back for deployments (when no watermark exists)
 PR_LOOKBACK_HOURS = int(os.environ.get("PR_LOOKBACK_HOURS", "48"))  # Hours to look back for merged PRs
 INCIDENT_LOOKBACK_HOURS = int(os.environ.get("INCIDENT_LOOKBACK_HOURS", "24"))  # Hours to look back for incidents
+WATERMARK_STORE = os.environ.get("WATERMARK_STORE", "sql").lower()  # "sql", "local" or "none" (always scan the full lookback window)
+WATERMARK_LOCAL_PATH = os.environ.get("WATERMARK_LOCAL_PATH", os.path.join(tempfile.gettempdir(), "dora_watermarks.json"))
+WATERMARK_OVERLAP_MINUTES = int(os.environ.get("WATERMARK_OVERLAP_MINUTES", "60"))  # Re-read this much before each watermark to catch late-arriving items
+GITHUB_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get("GITHUB_TOKEN_REFRESH_MARGIN_SECONDS", "300"))  # Refresh installation token this long before it expires
+GITHUB_FETCH_CONCURRENCY = int(os.environ.get("GITHUB_FETCH_CONCURRENCY", "4"))  # Parallel GraphQL requests per collection run (1 = serial org pagination)
+GITHUB_REPO_BATCH_SIZE = int(os.environ.get("GITHUB_REPO_BATCH_SIZE", "50"))  # Repositories per nodes(ids:) request when fetching concurrently (max 100)
+GITHUB_REQUESTS_PER_SECOND = float(os.environ.get("GITHUB_REQUESTS_PER_SECOND", "5"))  # Token-bucket pacing shared by all collectors in a worker
+GITHUB_RATE_LIMIT_RESERVE_POINTS = int(os.environ.get("GITHUB_RATE_LIMIT_RESERVE_POINTS", "200"))  # GraphQL points left untouched for other consumers of the installation
+GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get("GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS", "90"))  # Longer waits abort the run instead of hitting functionTimeout
+GITHUB_MAX_RETRIES = int(os.environ.get("GITHUB_MAX_RETRIES", "3"))  # Retries for rate-limited, 5xx and connection-failed GitHub requests
+GITHUB_INNER_FIRST_PAGE_SIZE = int(os.environ.get("GITHUB_INNER_FIRST_PAGE_SIZE", "20"))  # Deployments/PRs/issues per repository on the first (org-wide) page
+GITHUB_INNER_PAGE_SIZE = int(os.environ.get("GITHUB_INNER_PAGE_SIZE", "100"))  # Items per follow-up page for busy repositories
+GITHUB_INNER_MAX_PAGES = int(os.environ.get("GITHUB_INNER_MAX_PAGES", "50"))  # Safety cap on follow-up pages per repository connection
+COLLECTION_MODE = os.environ.get("COLLECTION_MODE", "unified").lower()  # "unified" (one org traversal for all metrics) or "per_metric" (three collectors)
+REPOSITORY_ORDER_FIELD = os.environ.get("REPOSITORY_ORDER_FIELD", "PUSHED_AT").upper()  # Organization repositories are paged newest-first by this field: PUSHED_AT or UPDATED_AT
+INCLUDE_ARCHIVED_REPOS = os.environ.get("INCLUDE_ARCHIVED_REPOS", "false").lower() == "true"  # Archived repositories are read-only and skipped by default
+INCLUDE_FORK_REPOS = os.environ.get("INCLUDE_FORK_REPOS", "false").lower() == "true"  # Forks are skipped by default
+SKIP_DORMANT_REPOS = os.environ.get("SKIP_DORMANT_REPOS", "true").lower() == "true"  # Stop paging once repositories were last active before the collection window
+DORMANT_REPO_GRACE_HOURS = int(os.environ.get("DORMANT_REPO_GRACE_HOURS", "72"))  # Extra margin before the window, e.g. for deployments promoted days after the push
+INCIDENT_SCAN_DORMANT_REPOS = os.environ.get("INCIDENT_SCAN_DORMANT_REPOS", "true").lower() == "true"  # Issues do not move pushedAt, so dormant repositories are still scanned for incidents
+COLLECTOR_SCHEDULE = os.environ.get("COLLECTOR_SCHEDULE", "0 */5 * * * *")  # NCRONTAB for the polling collectors; with webhooks enabled they only need to reconcile, e.g. "0 0 * * * *"
+GITHUB_WEBHOOK_SECRET = os.environ.get("GITHUB_WEBHOOK_SECRET")  # Secret configured on the GitHub App / org webhook; the webhook endpoint rejects every delivery without it
+TEAM_MAP_TTL_SECONDS = int(os.environ.get("TEAM_MAP_TTL_SECONDS", "21600"))  # Age after which the cached org team -> repository map is rebuilt
+PIPELINE_QUEUE_DEPTH = int(os.environ.get("PIPELINE_QUEUE_DEPTH", "4"))  # Parsed repository pages buffered between the GitHub fetch and SQL write stages
+PIPELINE_WRITE_BATCH_SIZE = int(os.environ.get("PIPELINE_WRITE_BATCH_SIZE", "500"))  # Records accumulated before each store call (repository pages are never split)
+INCIDENT_ATTRIBUTION_WINDOW_HOURS = int(os.environ.get("INCIDENT_ATTRIBUTION_WINDOW_HOURS", "24"))  # Incidents opened this long after a deployment are attributed to it (CFR)
+INCIDENT_ATTRIBUTION_RULE = os.environ.get("INCIDENT_ATTRIBUTION_RULE", "all").lower()  # "all" deployments in the window or only the "latest" one before the incident
+INCIDENT_ATTRIBUTION_ENVIRONMENT = os.environ.get("INCIDENT_ATTRIBUTION_ENVIRONMENT", "production")  # Only successful deployments to this environment are linked
+SHARDING_ENABLED = os.environ.get("SHARDING_ENABLED", "false").lower() == "true"  # Split repositories across collector instances through partition leases
+SHARD_PARTITIONS = int(os.environ.get("SHARD_PARTITIONS", "16"))  # Consistent-hash partitions of the org's repositories (keep it a few times the instance count)
+SHARD_LEASE_STORE = os.environ.get("SHARD_LEASE_STORE", "sql").lower()  # "sql" (collector_leases table) or "local" (JSON file shared by processes on one host)
+SHARD_LEASE_PATH = os.environ.get("SHARD_LEASE_PATH", os.path.join(tempfile.gettempdir(), "dora_leases.json"))
+SHARD_LEASE_SECONDS = int(os.environ.get("SHARD_LEASE_SECONDS", "900"))  # Lease lifetime; must exceed the collector interval, leases are renewed at the start of every run
+SHARD_INSTANCE_ID = os.environ.get("SHARD_INSTANCE_ID") or os.environ.get("WEBSITE_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+BACKFILL_CHECKPOINT_STORE = os.environ.get("BACKFILL_CHECKPOINT_STORE", "sql").lower()  # "sql" (backfill_checkpoints table) or "local" (JSON file)
+BACKFILL_CHECKPOINT_PATH = os.environ.get("BACKFILL_CHECKPOINT_PATH", os.path.join(tempfile.gettempdir(), "dora_backfill_checkpoints.json"))
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", "4"))  # Repositories backfilled in parallel (GitHub calls still share the rate-limit governor)
+BACKFILL_MAX_RUNTIME_SECONDS = float(os.environ.get("BACKFILL_MAX_RUNTIME_SECONDS", "200"))  # Per HTTP call; Azure cuts HTTP responses at 230 s, the next call resumes from the checkpoints
+BACKFILL_PROGRESS_INTERVAL_SECONDS = float(os.environ.get("BACKFILL_PROGRESS_INTERVAL_SECONDS", "15"))  # How often throughput is logged while a backfill runs
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "0"))  # Raw deployments/PRs/incidents older than this are rolled up, archived to Parquet and deleted (0 = keep forever)
+RETENTION_SCHEDULE = os.environ.get("RETENTION_SCHEDULE", "0 30 2 * * *")  # NCRONTAB for the retention job (daily at 02:30 UTC)
+RETENTION_ARCHIVE_LOCATION = os.environ.get("RETENTION_ARCHIVE_LOCATION", "")  # Local directory or Blob container URL (https://<account>.blob.core.windows.net/<container>)
+RETENTION_ARCHIVE_COMPRESSION = os.environ.get("RETENTION_ARCHIVE_COMPRESSION", "zstd")  # Parquet codec: zstd, snappy, gzip or none
+RETENTION_DELETE_BATCH_SIZE = int(os.environ.get("RETENTION_DELETE_BATCH_SIZE", "2000"))  # Rows per DELETE + commit; stays below SQL Server's 5000-lock escalation threshold
+RETENTION_MAX_DAYS_PER_RUN = int(os.environ.get("RETENTION_MAX_DAYS_PER_RUN", "31"))  # Days archived per table per run, so a first run on a large database fits the function timeout
+METRICS_CACHE_TTL_SECONDS = int(os.environ.get("METRICS_CACHE_TTL_SECONDS", "300"))  # Metrics API results are reused this long; local collector writes invalidate them sooner
+METRICS_CACHE_MAX_ENTRIES = int(os.environ.get("METRICS_CACHE_MAX_ENTRIES", "512"))  # Least recently used results beyond this are evicted
+METRICS_DEFAULT_RANGE_DAYS = int(os.environ.get("METRICS_DEFAULT_RANGE_DAYS", "90"))  # Range served when the request has no "from"
+TELEMETRY_EXPORTER = os.environ.get("TELEMETRY_EXPORTER", "appinsights").lower()  # Per-run stage metrics: "appinsights" (custom metrics), "local" (JSON lines file) or "none"
+TELEMETRY_LOCAL_PATH = os.environ.get("TELEMETRY_LOCAL_PATH", os.path.join(tempfile.gettempdir(), "dora_telemetry.jsonl"))
+APPLICATIONINSIGHTS_CONNECTION_STRING = os.environ.get("APPLICATIONINSIGHTS_CONNECTION_STRING")  # Set by Azure when Application Insights is enabled on the Function App
 SQL_SERVER = os.environ.get("SQL_SERVER")
 SQL_DATABASE = os.environ.get("SQL_DATABASE")
+SQL_POOL_SIZE = int(os.environ.get("SQL_POOL_SIZE", "4"))  # Idle connections kept open per worker
+SQL_BULK_BATCH_SIZE = int(os.environ.get("SQL_BULK_BATCH_SIZE", "1000"))  # Rows staged per fast_executemany round trip / MERGE
+SQL_TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get("SQL_TOKEN_REFRESH_MARGIN_SECONDS", "300"))  # Refresh Entra ID token (and retire its connections) this long before expiry
+DATA_STORE = os.environ.get("DATA_STORE", "sql").lower()  # Where collected deployments/PRs/incidents are written: "sql" (Azure SQL) or "sqlite" (embedded file, for local runs, CI and benchmarks)
+DATA_STORE_PATH = os.environ.get("DATA_STORE_PATH", os.path.join(tempfile.gettempdir(), "dora_metrics.db"))  # SQLite database file for DATA_STORE=sqlite
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")  # Per-subsystem verbosity of the ingestion loggers, e.g. "collect=DEBUG,store=WARNING" (github, collect, store, sql, watermarks)
+LOG_RATE_LIMIT_PER_MINUTE = int(os.environ.get("LOG_RATE_LIMIT_PER_MINUTE", "20"))  # Lines of one message kind per subsystem logger per minute; repeats beyond it are dropped and counted (0 = no limit)
 
 
-@app.schedule(schedule="0 */5 * * * *", arg_name="timer", run_on_startup=False,
+@app.schedule(schedule=COLLECTOR_SCHEDULE, arg_name="timer", run_on_startup=False,
               use_monitor=False) 
 def deployment_frequency_collector(timer: func.TimerRequest) -> None:
     """
-    Timer trigger function that runs every 5 minutes
+    Timer trigger function that runs on COLLECTOR_SCHEDULE (every 5 minutes by default)
     Collects deployment data from GitHub and stores in SQL Database
     """
-    try:
-        logging.info('Python timer trigger function started.')
+    if COLLECTION_MODE == "unified":
+        logging.debug("[deployment_frequency_collector] Skipped - COLLECTION_MODE=unified (dora_unified_collector handles this metric)")
+        return
+    if not claim_collection_shards("deployment_frequency_collector"):
+        return
+    
+    with telemetry_run("deployment_frequency_collector"):
+        try:
+            logging.info('Python timer trigger function started.')
         
-        if timer.past_due:
-            logging.info('The timer is past due!')
+            if timer.past_due:
+                logging.info('The timer is past due!')
         
-        try:
-            # Get GitHub access token
-            logging.info('[MAIN] Getting GitHub access token...')
-            github_token = get_github_app_token()
-            logging.info('[MAIN] GitHub token acquired')
-            
-            # Collect deployment data
-            logging.info('[MAIN] Collecting deployment data from GitHub...')
-            deployments = collect_github_deployments(github_token)
-            logging.info(f"[MAIN] Collected {len(deployments)} deployments")
-            
-            # Store in SQL Database
-            logging.info('[MAIN] Storing deployments in database...')
-            store_deployments(deployments, github_token)
-            logging.info("[MAIN] Deployments stored successfully")
+            try:
+                # Get GitHub access token
+                logging.info('[MAIN] Getting GitHub access token...')
+                github_token = get_github_app_token()
+                logging.info('[MAIN] GitHub token acquired')
             
-            # Generate summary
-            logging.info('[MAIN] Generating summary...')
-            summary = generate_summary(deployments)
-            logging.info(f"[MAIN] Summary: {summary}")
-            logging.info('[MAIN] Function completed successfully')
+                # Stream deployments newer than the stored watermarks into SQL Database, page by page
+                logging.info('[MAIN] Collecting deployment data from GitHub...')
+                watermarks = load_watermarks("deployments")
+                summary = generate_summary([])
+                stored = stream_to_store(
+                    ({"deployments": page} for page in iter_github_deployments(github_token, watermarks)),
+                    [("deployments", lambda batch: store_deployments(batch, github_token), "created_at")],
+                    "MAIN",
+                    on_batch=lambda entity, batch: generate_summary(batch, summary)
+                )
+                logging.info(f"[MAIN] Stored {stored['deployments']} deployments successfully")
+                logging.info(f"[MAIN] Summary: {summary}")
+                logging.info('[MAIN] Function completed successfully')
             
-        except Exception as e:
-            logging.error(f"[MAIN] Error in deployment frequency collector: {type(e).__name__}: {str(e)}")
+            except Exception as e:
+                logging.error(f"[MAIN] Error in deployment frequency collector: {type(e).__name__}: {str(e)}")
+                import traceback
+                logging.error(f"[MAIN] Full traceback: {traceback.format_exc()}")
+                raise
+        except:
+            # Catch absolutely everything
+            import sys
             import traceback
-            logging.error(f"[MAIN] Full traceback: {traceback.format_exc()}")
+            error_details = traceback.format_exc()
+            logging.error(f"[CRITICAL] Unhandled exception: {error_details}")
+            logging.error(f"[CRITICAL] sys.exc_info: {sys.exc_info()}")
             raise
-    except:
-        # Catch absolutely everything
-        import sys
-        import traceback
-        error_details = traceback.format_exc()
-        logging.error(f"[CRITICAL] Unhandled exception: {error_details}")
-        logging.error(f"[CRITICAL] sys.exc_info: {sys.exc_info()}")
-        raise
 
 
-@app.schedule(schedule="0 */5 * * * *", arg_name="timer", run_on_startup=False,
+@app.schedule(schedule=COLLECTOR_SCHEDULE, arg_name="timer", run_on_startup=False,
               use_monitor=False) 
 def lead_time_collector(timer: func.TimerRequest) -> None:
     """
-    Timer trigger function that runs every 5 minutes
+    Timer trigger function that runs on COLLECTOR_SCHEDULE (every 5 minutes by default)
     Collects pull request data from GitHub for lead time calculation
     PRs are linked to deployments via merge commit SHA
     """
-    try:
-        logging.info('[PR-COLLECTOR] Pull request collection function started.')
+    if COLLECTION_MODE == "unified":
+        logging.debug("[lead_time_collector] Skipped - COLLECTION_MODE=unified (dora_unified_collector handles this metric)")
+        return
+    if not claim_collection_shards("lead_time_collector"):
+        return
+    
+    with telemetry_run("lead_time_collector"):
+        try:
+            logging.info('[PR-COLLECTOR] Pull request collection function started.')
         
-        if timer.past_due:
-            logging.info('[PR-COLLECTOR] The timer is past due!')
+            if timer.past_due:
+                logging.info('[PR-COLLECTOR] The timer is past due!')
         
-        try:
-            # Get GitHub access token
-            logging.info('[PR-COLLECTOR] Getting GitHub access token...')
-            github_token = get_github_app_token()
-            logging.info('[PR-COLLECTOR] GitHub token acquired')
+            try:
+                # Get GitHub access token
+                logging.info('[PR-COLLECTOR] Getting GitHub access token...')
+                github_token = get_github_app_token()
+                logging.info('[PR-COLLECTOR] GitHub token acquired')
             
-            # Collect pull request data
-            logging.info('[PR-COLLECTOR] Collecting pull request data from GitHub...')
-            prs = collect_github_pull_requests(github_token)
-            logging.info(f"[PR-COLLECTOR] Collected {len(prs)} pull requests")
+                # Stream pull request data into SQL Database, page by page
+                logging.info('[PR-COLLECTOR] Collecting pull request data from GitHub...')
+                watermarks = load_watermarks("pull_requests")
+                by_repo = {}
             
-            # Store in SQL Database
-            logging.info('[PR-COLLECTOR] Storing pull requests in database...')
-            store_pull_requests(prs)
-            logging.info("[PR-COLLECTOR] Pull requests stored successfully")
+                def summarize(entity, prs):
+                    for pr in prs:
+                        repo = pr["repository"]
+                        by_repo[repo] = by_repo.get(repo, 0) + 1
             
-            # Generate summary
-            by_repo = {}
-            for pr in prs:
-                repo = pr["repository"]
-                by_repo[repo] = by_repo.get(repo, 0) + 1
+                stored = stream_to_store(
+                    ({"pull_requests": page} for page in iter_github_pull_requests(github_token, watermarks)),
+                    [("pull_requests", store_pull_requests, "merged_at")],
+                    "PR-COLLECTOR",
+                    on_batch=summarize
+                )
+                logging.info("[PR-COLLECTOR] Pull requests stored successfully")
             
-            logging.info(f"[PR-COLLECTOR] Summary: {len(prs)} total PRs across {len(by_repo)} repositories")
-            logging.info(f"[PR-COLLECTOR] By repository: {by_repo}")
-            logging.info('[PR-COLLECTOR] Function completed successfully')
+                logging.info(f"[PR-COLLECTOR] Summary: {stored['pull_requests']} total PRs across {len(by_repo)} repositories")
+                logging.info(f"[PR-COLLECTOR] By repository: {by_repo}")
+                logging.info('[PR-COLLECTOR] Function completed successfully')
             
-        except Exception as e:
-            logging.error(f"[PR-COLLECTOR] Error in lead time collector: {type(e).__name__}: {str(e)}")
+            except Exception as e:
+                logging.error(f"[PR-COLLECTOR] Error in lead time collector: {type(e).__name__}: {str(e)}")
+                import traceback
+                logging.error(f"[PR-COLLECTOR] Full traceback: {traceback.format_exc()}")
+                raise
+        except:
+            # Catch absolutely everything
+            import sys
             import traceback
-            logging.error(f"[PR-COLLECTOR] Full traceback: {traceback.format_exc()}")
+            error_details = traceback.format_exc()
+            logging.error(f"[PR-COLLECTOR-CRITICAL] Unhandled exception: {error_details}")
+            logging.error(f"[PR-COLLECTOR-CRITICAL] sys.exc_info: {sys.exc_info()}")
             raise
-    except:
-        # Catch absolutely everything
-        import sys
-        import traceback
-        error_details = traceback.format_exc()
-        logging.error(f"[PR-COLLECTOR-CRITICAL] Unhandled exception: {error_details}")
-        logging.error(f"[PR-COLLECTOR-CRITICAL] sys.exc_info: {sys.exc_info()}")
-        raise
 
 
-@app.schedule(schedule="0 */5 * * * *", arg_name="timer", run_on_startup=False,
+@app.schedule(schedule=COLLECTOR_SCHEDULE, arg_name="timer", run_on_startup=False,
               use_monitor=False) 
 def cfr_mttr_collector(timer: func.TimerRequest) -> None:
     """
-    Timer trigger function that runs every 5 minutes
+    Timer trigger function that runs on COLLECTOR_SCHEDULE (every 5 minutes by default)
     Collects incident data from GitHub Issues for Change Failure Rate calculation
     """
-    try:
-        logging.info('[CFR-COLLECTOR] Starting Change Failure Rate data collection...')
+    if COLLECTION_MODE == "unified":
+        logging.debug("[cfr_mttr_collector] Skipped - COLLECTION_MODE=unified (dora_unified_collector handles this metric)")
+        return
+    if not claim_collection_shards("cfr_mttr_collector"):
+        return
+    
+    with telemetry_run("cfr_mttr_collector"):
+        try:
+            logging.info('[CFR-COLLECTOR] Starting Change Failure Rate data collection...')
         
-        if timer.past_due:
-            logging.info('[CFR-COLLECTOR] The timer is past due!')
+            if timer.past_due:
+                logging.info('[CFR-COLLECTOR] The timer is past due!')
         
-        try:
-            # Get GitHub access token
-            logging.info('[CFR-COLLECTOR] Getting GitHub access token...')
-            github_token = get_github_app_token()
-            logging.info('[CFR-COLLECTOR] GitHub token acquired')
+            try:
+                # Get GitHub access token
+                logging.info('[CFR-COLLECTOR] Getting GitHub access token...')
+                github_token = get_github_app_token()
+                logging.info('[CFR-COLLECTOR] GitHub token acquired')
             
-            # Collect incident data
-            logging.info('[CFR-COLLECTOR] Collecting incident data from GitHub Issues...')
-            incidents = collect_github_incidents(github_token)
-            logging.info(f"[CFR-COLLECTOR] Collected {len(incidents)} incidents")
+                # Stream incident data into SQL Database, page by page
+                logging.info('[CFR-COLLECTOR] Collecting incident data from GitHub Issues...')
+                watermarks = load_watermarks("incidents")
+                by_repo = {}
+                by_state = {}
             
-            # Store in SQL Database
-            logging.info('[CFR-COLLECTOR] Storing incidents in database...')
-            store_incidents(incidents)
-            logging.info("[CFR-COLLECTOR] Incidents stored successfully")
+                def summarize(entity, incidents):
+                    for incident in incidents:
+                        repo = incident["repository"]
+                        state = incident["state"]
+                        by_repo[repo] = by_repo.get(repo, 0) + 1
+                        by_state[state] = by_state.get(state, 0) + 1
             
-            # Generate summary
-            by_repo = {}
-            by_state = {}
-            for incident in incidents:
-                repo = incident["repository"]
-                state = incident["state"]
-                by_repo[repo] = by_repo.get(repo, 0) + 1
-                by_state[state] = by_state.get(state, 0) + 1
+                stored = stream_to_store(
+                    ({"incidents": page} for page in iter_github_incidents(github_token, watermarks)),
+                    [("incidents", store_incidents, "updated_at")],
+                    "CFR-COLLECTOR",
+                    on_batch=summarize
+                )
+                logging.info("[CFR-COLLECTOR] Incidents stored successfully")
             
-            logging.info(f"[CFR-COLLECTOR] Summary: {len(incidents)} total incidents across {len(by_repo)} repositories")
-            logging.info(f"[CFR-COLLECTOR] By repository: {by_repo}")
-            logging.info(f"[CFR-COLLECTOR] By state: {by_state}")
-            logging.info('[CFR-COLLECTOR] Function completed successfully')
+                logging.info(f"[CFR-COLLECTOR] Summary: {stored['incidents']} total incidents across {len(by_repo)} repositories")
+                logging.info(f"[CFR-COLLECTOR] By repository: {by_repo}")
+                logging.info(f"[CFR-COLLECTOR] By state: {by_state}")
+                logging.info('[CFR-COLLECTOR] Function completed successfully')
             
-        except Exception as e:
-            logging.error(f"[CFR-COLLECTOR] Error in CFR collector: {type(e).__name__}: {str(e)}")
+            except Exception as e:
+                logging.error(f"[CFR-COLLECTOR] Error in CFR collector: {type(e).__name__}: {str(e)}")
+                import traceback
+                logging.error(f"[CFR-COLLECTOR] Full traceback: {traceback.format_exc()}")
+                raise
+        except:
+            # Catch absolutely everything
+            import sys
             import traceback
-            logging.error(f"[CFR-COLLECTOR] Full traceback: {traceback.format_exc()}")
+            error_details = traceback.format_exc()
+            logging.error(f"[CFR-COLLECTOR-CRITICAL] Unhandled exception: {error_details}")
+            logging.error(f"[CFR-COLLECTOR-CRITICAL] sys.exc_info: {sys.exc_info()}")
             raise
-    except:
-        # Catch absolutely everything
-        import sys
-        import traceback
-        error_details = traceback.format_exc()
-        logging.error(f"[CFR-COLLECTOR-CRITICAL] Unhandled exception: {error_details}")
-        logging.error(f"[CFR-COLLECTOR-CRITICAL] sys.exc_info: {sys.exc_info()}")
-        raise
 
 
-def get_github_app_token() -> str:
+@app.schedule(schedule=COLLECTOR_SCHEDULE, arg_name="timer", run_on_startup=False,
+              use_monitor=False) 
+def dora_unified_collector(timer: func.TimerRequest) -> None:
     """
-    Generate JWT and get installation access token for GitHub App authentication
-    https://docs.github.com/en/apps/creating-github-apps/authenticating-with-a-github-app/generating-a-json-web-token-jwt-for-a-github-app
+    Timer trigger function that runs on COLLECTOR_SCHEDULE (every 5 minutes by default)
+    Collects deployments, pull requests and incidents in one organization traversal
+    and dispatches them to the same store functions as the per-metric collectors
     """
-    if not GITHUB_APP_ID or not GITHUB_APP_INSTALLATION_ID or not GITHUB_APP_PRIVATE_KEY:
-        raise ValueError("GITHUB_APP_ID, GITHUB_APP_INSTALLATION_ID, and GITHUB_APP_PRIVATE_KEY must be set")
-    
-    # Generate JWT
-    now = int(time.time())
-    payload = {
-        "iat": now - 60,  # Issued at time (60 seconds in the past to allow for clock drift)
-        "exp": now + (10 * 60),  # JWT expiration time (10 minutes)
-        "iss": GITHUB_APP_ID  # GitHub App's identifier
-    }
-    
-    # Decode private key (handle both raw and base64 encoded)
-    private_key = GITHUB_APP_PRIVATE_KEY
-    if not private_key.startswith("-----BEGIN"):
-        # If stored as base64 in environment variable
-        import base64
-        private_key = base64.b64decode(private_key).decode('utf-8')
-    
-    # Create JWT
-    jwt_token = jwt.encode(payload, private_key, algorithm="RS256")
+    if COLLECTION_MODE != "unified":
+        logging.debug(f"[dora_unified_collector] Skipped - COLLECTION_MODE={COLLECTION_MODE}")
+        return
+    if not claim_collection_shards("dora_unified_collector"):
+        return
     
-    # Get installation access token
-    headers = {
-        "Authorization": f"Bearer {jwt_token}",
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
+    with telemetry_run("dora_unified_collector"):
+        logging.info('[UNIFIED-COLLECTOR] Unified collection function started.')
     
-    response = requests.post(
-        f"https://api.github.com/app/installations/{GITHUB_APP_INSTALLATION_ID}/access_tokens",
-        headers=headers,
-        timeout=30
-    )
+        if timer.past_due:
+            logging.info('[UNIFIED-COLLECTOR] The timer is past due!')
     
-    if response.status_code != 201:
-        logging.error(f"Failed to get installation token: {response.status_code} - {response.text}")
-        raise Exception(f"Failed to authenticate as GitHub App: {response.status_code}")
+        summary = generate_summary([])
+        try:
+            logging.info('[UNIFIED-COLLECTOR] Getting GitHub access token...')
+            github_token = get_github_app_token()
+        
+            watermarks = {entity: load_watermarks(entity) for entity in COLLECTION_ENTITIES}
+        
+            # Each metric is stored independently so one failing sink does not drop the others
+            sinks = [
+                ("deployments", lambda records: store_deployments(records, github_token), "created_at"),
+                ("pull_requests", store_pull_requests, "merged_at"),
+                ("incidents", store_incidents, "updated_at")
+            ]
+            stored = stream_to_store(
+                iter_github_all(github_token, watermarks),
+                sinks,
+                "UNIFIED-COLLECTOR",
+                on_batch=lambda entity, batch: generate_summary(batch, summary) if entity == "deployments" else None
+            )
+        except Exception as e:
+            logging.error(f"[UNIFIED-COLLECTOR] Collection failed: {type(e).__name__}: {str(e)}")
+            import traceback
+            logging.error(f"[UNIFIED-COLLECTOR] Full traceback: {traceback.format_exc()}")
+            raise
     
-    token_data = response.json()
-    logging.info("Successfully authenticated as GitHub App")
-    return token_data["token"]
+        logging.info(f"[UNIFIED-COLLECTOR] Stored {stored['deployments']} deployments, {stored['pull_requests']} PRs, {stored['incidents']} incidents")
+        logging.info(f"[UNIFIED-COLLECTOR] Summary: {summary}")
+        logging.info('[UNIFIED-COLLECTOR] Function completed successfully')
 
 
-def collect_github_deployments(github_token: str) -> List[Dict[str, Any]]:
+@app.schedule(schedule="0 15 */6 * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def team_map_refresher(timer: func.TimerRequest) -> None:
     """
-    Collect deployments from GitHub organization using GraphQL API
+    Timer trigger function that runs every 6 hours
+    Rebuilds the org-wide team -> repository map and syncs repositories.team, so team changes
+    reach the database without any lookups on the collection write path
     """
-    if not GITHUB_ORG:
-        raise ValueError("GITHUB_ORG_NAME must be set")
-    # Parse environment filter
-    environments_filter = []
-    if GITHUB_DEPLOYMENT_ENVIRONMENTS:
-        environments_filter = [env.strip() for env in GITHUB_DEPLOYMENT_ENVIRONMENTS.split(",") if env.strip()]
-        logging.info(f"Filtering deployments for environments: {environments_filter}")
-    else:
-        logging.info("No environment filter set - collecting all deployment environments")
-    
-    headers = {
-        "Authorization": f"Bearer {github_token}",
-        "Content-Type": "application/json"
-    }
+    logging.info('[TEAM-REFRESHER] Team map refresh started.')
     
-    # Build deployments query part with optional environment filter
-    if environments_filter:
-        # Convert list to GraphQL array format
-        envs_graphql = '[' + ', '.join([f'"{env}"' for env in environments_filter]) + ']'
-        deployments_query = f'deployments(first: 50, environments: {envs_graphql}, orderBy: {{field: CREATED_AT, direction: DESC}})'
-    else:
-        deployments_query = 'deployments(first: 50, orderBy: {field: CREATED_AT, direction: DESC})'
+    try:
+        github_token = get_github_app_token()
+        teams = team_map.refresh(github_token)
+        store_repository_teams(teams)
+    except Exception as e:
+        logging.error(f"[TEAM-REFRESHER] Error refreshing team map: {type(e).__name__}: {str(e)}")
+        import traceback
+        logging.error(f"[TEAM-REFRESHER] Full traceback: {traceback.format_exc()}")
+        raise
     
-    # GraphQL query to get all repos and their deployments
-    query = f"""
-    query($org: String!, $cursor: String) {{
-      organization(login: $org) {{
-        repositories(first: 100, after: $cursor) {{
-          pageInfo {{
-            hasNextPage
-            endCursor
-          }}
-          nodes {{
-            name
-            owner {{
-              login
-            }}
-            {deployments_query} {{
-              nodes {{
-                id
-                createdAt
-                environment
-                commit {{
-                  oid
-                  author {{
-                    user {{
-                      login
-                    }}
-                  }}
-                }}
-                creator {{
-                  login
-                }}
-                latestStatus {{
-                  state
-                  createdAt
-                }}
-              }}
-            }}
-          }}
-        }}
-      }}
-    }}
+    logging.info('[TEAM-REFRESHER] Function completed successfully')
+
+
+@app.schedule(schedule=RETENTION_SCHEDULE, arg_name="timer", run_on_startup=False, use_monitor=False)
+def raw_data_retention(timer: func.TimerRequest) -> None:
+    """
+    Timer trigger function that runs on RETENTION_SCHEDULE (daily by default)
+    Rolls raw rows older than RETENTION_DAYS into the aggregate tables, archives them as
+    date-partitioned Parquet and deletes them from the hot tables in small chunks
+    Azure SQL only: with DATA_STORE=sqlite the raw rows stay in the SQLite file
     """
+    if RETENTION_DAYS <= 0:
+        logging.debug("[RETENTION] Skipped - RETENTION_DAYS=0 (raw data is kept forever)")
+        return
+    if DATA_STORE != "sql":
+        logging.info(f"[RETENTION] Skipped - DATA_STORE={DATA_STORE} (retention archives Azure SQL tables only)")
+        return
     
-    all_deployments = []
-    cursor = None
-    has_next_page = True
+    logging.info(f'[RETENTION] Retention started (horizon {RETENTION_DAYS} days, archive {RETENTION_ARCHIVE_LOCATION})')
     
-    while has_next_page:
-        variables = {"org": GITHUB_ORG, "cursor": cursor}
-        
-        response = requests.post(
-            "https://api.github.com/graphql",
-            json={"query": query, "variables": variables},
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            logging.error(f"GitHub API error: {response.status_code} - {response.text}")
-            raise Exception(f"GitHub API returned {response.status_code}")
-        
-        data = response.json()
-        
-        if "errors" in data:
-            logging.error(f"GraphQL errors: {data['errors']}")
-            raise Exception(f"GraphQL query failed: {data['errors']}")
-        
-        repos = data["data"]["organization"]["repositories"]["nodes"]
-        
-        logging.info(f"Processing {len(repos)} repositories")
-        
-        for repo in repos:
-            repo_name = repo["name"]
-            deployments_in_repo = repo["deployments"]["nodes"]
-            
-            if deployments_in_repo:
-                logging.info(f"Repo '{repo_name}' has {len(deployments_in_repo)} deployments")
-            
-            for deployment in deployments_in_repo:
-                # Filter deployments from last 24 hours
-                created_at = datetime.fromisoformat(deployment["createdAt"].replace("Z", "+00:00"))
-                now = datetime.now(timezone.utc)
-                hours_ago = (now - created_at).total_seconds() / 3600
-                
-                logging.debug(f"Deployment in {repo_name}: environment={deployment['environment']}, created={hours_ago:.1f}h ago")
-                
-                if hours_ago <= 24:
-                    all_deployments.append({
-                        "deployment_id": deployment["id"],
-                        "repository": f"{repo['owner']['login']}/{repo_name}",
-                        "environment": deployment["environment"],
-                        "commit_sha": deployment["commit"]["oid"],
-                        "created_at": deployment["createdAt"],
-                        "creator": deployment["creator"]["login"] if deployment["creator"] else "unknown",
-                        "status": deployment["latestStatus"]["state"] if deployment["latestStatus"] else "pending",
-                        "status_updated_at": deployment["latestStatus"]["createdAt"] if deployment["latestStatus"] else None
-                    })
-                else:
-                    logging.debug(f"Skipping deployment older than 24h: {hours_ago:.1f}h ago")
-        
-        page_info = data["data"]["organization"]["repositories"]["pageInfo"]
-        has_next_page = page_info["hasNextPage"]
-        cursor = page_info["endCursor"]
+    try:
+        results = run_retention()
+    except Exception as e:
+        logging.error(f"[RETENTION] Error running retention: {type(e).__name__}: {str(e)}")
+        import traceback
+        logging.error(f"[RETENTION] Full traceback: {traceback.format_exc()}")
+        raise
     
-    logging.info(f"Total deployments collected (last 24h): {len(all_deployments)}")
-    return all_deployments
+    logging.info(f'[RETENTION] Summary: {results}')
+    logging.info('[RETENTION] Function completed successfully')
+
 
+LOG_SUBSYSTEMS = ("github", "collect", "store", "sql", "watermarks")  # Loggers "dora.<subsystem>" of the ingestion hot paths (LOG_LEVELS keys)
 
-def collect_github_pull_requests(github_token: str) -> List[Dict[str, Any]]:
+
+class LogRateLimiter(logging.Filter):
     """
-    Collect merged pull requests from GitHub organization using GraphQL API
-    Tracks PRs merged to the base branch (typically 'main') for lead time calculation
+    Rate-limited sampling of repeated log lines
+    Lines are grouped by logger and unformatted message, which for the lazily formatted subsystem
+    loggers is one kind of message whatever its arguments. Beyond `per_minute` lines of a kind per
+    minute the rest are dropped before they are formatted and counted; the next line of that kind
+    let through reports how many were suppressed. Only INFO and WARNING lines are sampled: errors
+    are always kept, and DEBUG lines only appear when LOG_LEVELS asks for them.
     """
-    if not GITHUB_ORG:
-        raise ValueError("GITHUB_ORG_NAME must be set")
-    
-    logging.info(f"Collecting merged PRs to '{BASE_BRANCH}' branch from last {PR_LOOKBACK_HOURS} hours")
-    
-    headers = {
-        "Authorization": f"Bearer {github_token}",
-        "Content-Type": "application/json"
-    }
-    
-    # Calculate time threshold (used for filtering in Python, not GraphQL)
-    since_time = datetime.now(timezone.utc) - timedelta(hours=PR_LOOKBACK_HOURS)
-    
-    # GraphQL query to get merged PRs from all repos
-    query = """
-    query($org: String!, $cursor: String) {
-      organization(login: $org) {
-        repositories(first: 100, after: $cursor) {
-          pageInfo {
-            hasNextPage
-            endCursor
-          }
-          nodes {
-            name
-            owner {
-              login
-            }
-            pullRequests(first: 50, states: MERGED, orderBy: {field: UPDATED_AT, direction: DESC}) {
-              nodes {
-                number
-                title
-                createdAt
-                mergedAt
-                baseRefName
-                mergeCommit {
-                  oid
-                }
-                author {
-                  login
-                }
-                commits(first: 1) {
-                  nodes {
-                    commit {
-                      authoredDate
-                    }
-                  }
-                }
-              }
-            }
-          }
-        }
-      }
-    }
+
+    def __init__(self, per_minute: int):
+        super().__init__()
+        self.per_minute = per_minute
+        self._windows: Dict[Tuple[str, Any], List[float]] = {}  # (logger, message) -> [window start, lines, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.per_minute <= 0 or not logging.INFO <= record.levelno < logging.ERROR:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < 60:
+                if window[1] >= self.per_minute:
+                    window[2] += 1
+                    return False
+                window[1] += 1
+                return True
+            suppressed = int(window[2]) if window else 0
+            if len(self._windows) >= 4096:
+                self._windows = {k: w for k, w in self._windows.items() if now - w[0] < 60}
+            self._windows[key] = [now, 1, 0]
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar lines suppressed)"
+        return True
+
+
+class LogFields:
+    """key=value pairs of a structured log line, formatted only if the line is emitted"""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return " ".join(f"{key}={value}" for key, value in self.fields.items())
+
+
+class LazyLog:
+    """Log argument computed only if the line is emitted (e.g. LazyLog(sql_pool.get_stats))"""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __str__(self) -> str:
+        return str(self.fn())
+
+
+def parse_log_levels(spec: str) -> Dict[str, int]:
+    """LOG_LEVELS ("collect=DEBUG,store=WARNING") as {subsystem: level}; invalid entries are logged and ignored"""
+    levels = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        subsystem, _, level_name = entry.partition("=")
+        subsystem, level = subsystem.strip().lower(), logging.getLevelName(level_name.strip().upper())
+        if subsystem not in LOG_SUBSYSTEMS or not isinstance(level, int):
+            logging.warning(f"[logging] Ignoring LOG_LEVELS entry '{entry}' (subsystems: {', '.join(LOG_SUBSYSTEMS)}; levels: DEBUG, INFO, WARNING, ERROR)")
+            continue
+        levels[subsystem] = level
+    return levels
+
+
+_log_levels = parse_log_levels(LOG_LEVELS)
+_log_rate_limiter = LogRateLimiter(LOG_RATE_LIMIT_PER_MINUTE)
+
+
+def get_logger(subsystem: str) -> logging.Logger:
     """
-    
-    all_prs = []
-    cursor = None
-    has_next_page = True
-    
-    while has_next_page:
-        variables = {"org": GITHUB_ORG, "cursor": cursor}
-        
-        response = requests.post(
-            "https://api.github.com/graphql",
-            json={"query": query, "variables": variables},
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            logging.error(f"GitHub API error: {response.status_code} - {response.text}")
-            raise Exception(f"GitHub API returned {response.status_code}")
-        
-        data = response.json()
-        
-        if "errors" in data:
-            logging.error(f"GraphQL errors: {data['errors']}")
-            raise Exception(f"GraphQL query failed: {data['errors']}")
-        
-        repos = data["data"]["organization"]["repositories"]["nodes"]
-        
-        logging.info(f"Processing {len(repos)} repositories for PRs")
-        
-        for repo in repos:
-            repo_name = repo["name"]
-            prs_in_repo = repo["pullRequests"]["nodes"]
-            
-            if prs_in_repo:
-                logging.info(f"Repo '{repo_name}' has {len(prs_in_repo)} merged PRs")
-            
-            for pr in prs_in_repo:
-                # Filter by base branch and time window
-                if pr["baseRefName"] != BASE_BRANCH:
-                    logging.debug(f"Skipping PR #{pr['number']} - merged to {pr['baseRefName']}, not {BASE_BRANCH}")
-                    continue
-                
-                if not pr["mergedAt"]:
-                    logging.debug(f"Skipping PR #{pr['number']} - no merge timestamp")
-                    continue
-                
-                merged_at = datetime.fromisoformat(pr["mergedAt"].replace("Z", "+00:00"))
-                hours_ago = (datetime.now(timezone.utc) - merged_at).total_seconds() / 3600
-                
-                if hours_ago <= PR_LOOKBACK_HOURS:
-                    # Extract first commit authored date (canonical DORA T1)
-                    first_commit_date = None
-                    if pr.get("commits") and pr["commits"].get("nodes") and len(pr["commits"]["nodes"]) > 0:
-                        first_commit_date = pr["commits"]["nodes"][0]["commit"]["authoredDate"]
-                    
-                    all_prs.append({
-                        "pr_number": pr["number"],
-                        "repository": f"{repo['owner']['login']}/{repo_name}",
-                        "title": pr["title"],
-                        "author": pr["author"]["login"] if pr["author"] else "unknown",
-                        "created_at": pr["createdAt"],
-                        "merged_at": pr["mergedAt"],
-                        "merge_commit_sha": pr["mergeCommit"]["oid"] if pr["mergeCommit"] else None,
-                        "base_branch": pr["baseRefName"],
-                        "first_commit_date": first_commit_date
-                    })
-                    logging.debug(f"Added PR #{pr['number']} from {repo_name}, merged {hours_ago:.1f}h ago, first_commit={first_commit_date}")
-                else:
-                    logging.debug(f"Skipping PR #{pr['number']} - merged {hours_ago:.1f}h ago (outside {PR_LOOKBACK_HOURS}h window)")
-        
-        page_info = data["data"]["organization"]["repositories"]["pageInfo"]
-        has_next_page = page_info["hasNextPage"]
-        cursor = page_info["endCursor"]
-    
-    logging.info(f"Total PRs collected (merged to {BASE_BRANCH} in last {PR_LOOKBACK_HOURS}h): {len(all_prs)}")
-    return all_prs
+    Logger of an ingestion subsystem ("dora.<subsystem>")
+    Uses its LOG_LEVELS verbosity (otherwise the host's level) and the shared rate limiter. Call it
+    with %-style arguments so that disabled and suppressed lines are never formatted.
+    """
+    logger = logging.getLogger(f"dora.{subsystem}")
+    logger.setLevel(_log_levels.get(subsystem, logging.NOTSET))
+    logger.addFilter(_log_rate_limiter)
+    return logger
 
 
-def collect_github_incidents(github_token: str) -> List[Dict[str, Any]]:
+def log_event(logger: logging.Logger, level: int, event: str, **fields) -> None:
     """
-    Collect incidents from GitHub Issues with labels "incident" AND "production"
-    Uses GraphQL API to query organization repositories
+    Structured line "<event> key=value ..." on a subsystem logger
+    Nothing is formatted when the level is disabled; the fields are also attached to the record
+    as `dora_fields` for handlers that export properties (e.g. OpenTelemetry log exporters).
     """
-    if not GITHUB_ORG:
-        raise ValueError("GITHUB_ORG_NAME must be set")
-    
-    since_time = datetime.now(timezone.utc) - timedelta(hours=INCIDENT_LOOKBACK_HOURS)
-    logging.info(f"Collecting incidents from last {INCIDENT_LOOKBACK_HOURS} hours (since {since_time.isoformat()})")
-    
-    headers = {
-        "Authorization": f"Bearer {github_token}",
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28"
-    }
-    
-    # GraphQL query to get all repos and their issues with incident labels
-    query = """
-    query($org: String!, $cursor: String) {
-      organization(login: $org) {
-        repositories(first: 100, after: $cursor) {
-          pageInfo {
-            hasNextPage
-            endCursor
-          }
-          nodes {
-            name
-            owner {
-              login
+    if logger.isEnabledFor(level):
+        logger.log(level, f"{event} %s", LogFields(fields), extra={"dora_fields": fields})
+
+
+github_log = get_logger("github")
+collect_log = get_logger("collect")
+store_log = get_logger("store")
+sql_log = get_logger("sql")
+watermark_log = get_logger("watermarks")
+
+
+class RunTelemetry:
+    """
+    Timings and counters of one collector run, aggregated per stage
+    Spans of the same stage are summed (calls, total, self and max seconds). Self time excludes
+    the nested spans opened on the same thread, so the stage with the most self time is where the
+    run actually spent its time; fetch and store overlap on different threads, so stage totals
+    can exceed the wall time. Counters (GraphQL points, bytes, rows, DB round trips) are added to
+    the run and to the innermost stage open on the calling thread.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.run_id = f"{name}-{os.urandom(6).hex()}"
+        self.started_at = datetime.now(timezone.utc)
+        self.status = "running"
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._wall_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _stage(self, stage: str) -> Dict[str, float]:
+        """Stage entry (caller holds the lock)"""
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {"calls": 0, "seconds": 0.0, "self_seconds": 0.0, "max_seconds": 0.0}
+        return entry
+
+    def add_span(self, stage: str, seconds: float, self_seconds: float) -> None:
+        with self._lock:
+            entry = self._stage(stage)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["self_seconds"] += self_seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def count(self, counter: str, value: float, stage: Optional[str]) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+            if stage:
+                entry = self._stage(stage)
+                entry[counter] = entry.get(counter, 0) + value
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self._wall_seconds = time.perf_counter() - self._started
+
+    def summary(self) -> Dict[str, Any]:
+        """Stages ordered by self time; the bottleneck is the busiest stage other than pipeline waits"""
+        wall_seconds = self._wall_seconds if self._wall_seconds is not None else time.perf_counter() - self._started
+        with self._lock:
+            stages = {
+                stage: {key: round(value, 4) if isinstance(value, float) else value for key, value in entry.items()}
+                for stage, entry in sorted(self.stages.items(), key=lambda item: -item[1]["self_seconds"])
             }
-            issues(first: 50, labels: ["incident", "production"], states: [OPEN, CLOSED], orderBy: {field: CREATED_AT, direction: DESC}) {
-              nodes {
-                number
-                title
-                bodyText
+            counters = {key: round(value, 4) if isinstance(value, float) else value for key, value in self.counters.items()}
+        working = [stage for stage in stages if not stage.startswith("pipeline.")]
+        return {
+            "run": self.name,
+            "run_id": self.run_id,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(wall_seconds, 3),
+            "bottleneck": working[0] if working else None,
+            "stages": stages,
+            "counters": counters
+        }
+
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("dora_run_telemetry", default=None)
+_open_spans = threading.local()  # Per-thread stack of [stage, nested seconds] frames
+recent_runs = deque(maxlen=20)  # Summaries of the latest runs in this worker (health endpoint)
+
+
+@contextmanager
+def telemetry_span(stage: str):
+    """Time the enclosed block as `stage` of the current run (no-op outside telemetry_run)"""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    stack = getattr(_open_spans, "stack", None)
+    if stack is None:
+        stack = _open_spans.stack = []
+    frame = [stage, 0.0]
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        run.add_span(stage, elapsed, max(elapsed - frame[1], 0.0))
+
+
+def timed_stage(stage: str):
+    """Decorator running the function inside telemetry_span(stage)"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with telemetry_span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def telemetry_count(counter: str, value: float = 1) -> None:
+    """Add to a counter of the current run and of the innermost open stage (no-op outside telemetry_run)"""
+    run = _current_run.get()
+    if run is None:
+        return
+    stack = getattr(_open_spans, "stack", None)
+    run.count(counter, value, stack[-1][0] if stack else None)
+
+
+def format_run_summary(summary: Dict[str, Any]) -> str:
+    """One log line: wall time, bottleneck, busiest stages and counters"""
+    wall_seconds = summary["wall_seconds"]
+    stages = ", ".join(f"{stage} {entry['self_seconds']:.2f}s/{entry['calls']}" for stage, entry in list(summary["stages"].items())[:8])
+    counters = " ".join(f"{name}={value:g}" for name, value in sorted(summary["counters"].items()))
+    bottleneck = summary["bottleneck"]
+    busiest = f"{bottleneck} ({summary['stages'][bottleneck]['self_seconds']:.2f}s self time)" if bottleneck else "none"
+    return f"{summary['run']} {summary['status']} in {wall_seconds:.2f}s - bottleneck {busiest} - self time: {stages} - {counters}"
+
+
+def telemetry_metric_points(summary: Dict[str, Any]) -> List[Tuple[str, float, Dict[str, str]]]:
+    """(name, value, properties) custom metrics for a run summary"""
+    properties = {"run": summary["run"], "run_id": summary["run_id"], "status": summary["status"], "instance": SHARD_INSTANCE_ID}
+    points = [("dora.run.seconds", summary["wall_seconds"], properties)]
+    for stage, entry in summary["stages"].items():
+        stage_properties = {**properties, "stage": stage}
+        points.append(("dora.stage.seconds", entry["seconds"], stage_properties))
+        points.append(("dora.stage.self_seconds", entry["self_seconds"], stage_properties))
+        points.append(("dora.stage.calls", entry["calls"], stage_properties))
+    for counter, value in summary["counters"].items():
+        points.append((f"dora.{counter}", value, properties))
+    return points
+
+
+class AppInsightsMetricsExporter:
+    """
+    Run summaries as Application Insights custom metrics (customMetrics table)
+    Posts the metric envelopes of a run in one request to the ingestion endpoint of
+    APPLICATIONINSIGHTS_CONNECTION_STRING (already set on Function Apps with Application Insights).
+    """
+
+    def __init__(self, connection_string: str):
+        settings = dict(part.split("=", 1) for part in connection_string.split(";") if "=" in part)
+        self.instrumentation_key = settings["InstrumentationKey"]
+        self.url = f"{settings.get('IngestionEndpoint', 'https://dc.services.visualstudio.com').rstrip('/')}/v2/track"
+
+    def export(self, summary: Dict[str, Any]) -> None:
+        time_stamp = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        envelopes = [
+            {
+                "name": "Microsoft.ApplicationInsights.Metric",
+                "time": time_stamp,
+                "iKey": self.instrumentation_key,
+                "tags": {"ai.cloud.role": os.environ.get("WEBSITE_SITE_NAME", "dora-metrics-collector"), "ai.operation.id": summary["run_id"]},
+                "data": {
+                    "baseType": "MetricData",
+                    "baseData": {"ver": 2, "metrics": [{"name": name, "value": value, "count": 1}], "properties": properties}
+                }
+            }
+            for name, value, properties in telemetry_metric_points(summary)
+        ]
+        response = requests.post(self.url, data=json.dumps(envelopes), headers={"Content-Type": "application/json"}, timeout=10)
+        if response.status_code not in (200, 206):
+            logging.warning(f"[telemetry] Application Insights rejected {len(envelopes)} metrics: {response.status_code} - {response.text[:200]}")
+
+
+class LocalMetricsExporter:
+    """
+    Run summaries as JSON lines in a local file, one custom metric per line (same names and
+    properties as Application Insights); `exported` keeps them in memory for tests and benchmarks
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exported: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def export(self, summary: Dict[str, Any]) -> None:
+        time_stamp = datetime.now(timezone.utc).isoformat()
+        records = [{"time": time_stamp, "name": name, "value": value, "properties": properties}
+                   for name, value, properties in telemetry_metric_points(summary)]
+        with self._lock:
+            self.exported.extend(records)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+
+
+_telemetry_exporter = None
+
+
+def get_telemetry_exporter():
+    """Return the configured telemetry exporter (None when TELEMETRY_EXPORTER=none or Application Insights is not configured)"""
+    global _telemetry_exporter
+    if _telemetry_exporter is None:
+        if TELEMETRY_EXPORTER == "appinsights":
+            if APPLICATIONINSIGHTS_CONNECTION_STRING:
+                _telemetry_exporter = AppInsightsMetricsExporter(APPLICATIONINSIGHTS_CONNECTION_STRING)
+        elif TELEMETRY_EXPORTER == "local":
+            _telemetry_exporter = LocalMetricsExporter(TELEMETRY_LOCAL_PATH)
+        elif TELEMETRY_EXPORTER != "none":
+            raise ValueError(f"Unknown TELEMETRY_EXPORTER '{TELEMETRY_EXPORTER}' (expected appinsights, local or none)")
+    return _telemetry_exporter
+
+
+@contextmanager
+def telemetry_run(name: str):
+    """
+    Collect the spans and counters of one run (e.g. a collector invocation)
+    On exit the summary is logged, kept in recent_runs and exported; exporter failures are only logged.
+    """
+    run = RunTelemetry(name)
+    token = _current_run.set(run)
+    status = "failed"
+    try:
+        yield run
+        status = "succeeded"
+    finally:
+        _current_run.reset(token)
+        run.finish(status)
+        summary = run.summary()
+        recent_runs.append(summary)
+        logging.info(f"[TELEMETRY] {format_run_summary(summary)}")
+        try:
+            exporter = get_telemetry_exporter()
+            if exporter:
+                exporter.export(summary)
+        except Exception as e:
+            logging.warning(f"[telemetry] Could not export run metrics: {type(e).__name__}: {str(e)}")
+
+
+class CountingCursor:
+    """Database cursor proxy counting each execute/executemany as a db_round_trip of the current run"""
+
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def execute(self, *args):
+        telemetry_count("db_round_trips")
+        return self._cursor.execute(*args)
+
+    def executemany(self, *args):
+        telemetry_count("db_round_trips")
+        return self._cursor.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+def commit_transaction(conn) -> None:
+    """conn.commit() timed as the sql.commit stage"""
+    with telemetry_span("sql.commit"):
+        telemetry_count("db_round_trips")
+        conn.commit()
+
+
+class GitHubAppTokenProvider:
+    """
+    Process-wide cache for the GitHub App installation token
+    The private key is parsed once and the installation token is reused until it is
+    close to its expires_at, so warm workers skip JWT signing and the token round trip.
+    Thread-safe: the three collectors share one provider inside the same worker.
+    """
+
+    def __init__(self, app_id: Optional[str], installation_id: Optional[str], private_key: Optional[str],
+                 refresh_margin_seconds: int = 300):
+        self.app_id = app_id
+        self.installation_id = installation_id
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._raw_private_key = private_key
+        self._signing_key = None
+        self._token: Optional[str] = None
+        self._expires_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def _load_signing_key(self):
+        """Decode (raw or base64) and parse the PEM private key once"""
+        if self._signing_key is None:
+            private_key = self._raw_private_key
+            if not private_key.startswith("-----BEGIN"):
+                # If stored as base64 in environment variable
+                private_key = base64.b64decode(private_key).decode('utf-8')
+            self._signing_key = serialization.load_pem_private_key(private_key.encode('utf-8'), password=None)
+        return self._signing_key
+
+    def _is_fresh(self) -> bool:
+        if not self._token or not self._expires_at:
+            return False
+        remaining = (self._expires_at - datetime.now(timezone.utc)).total_seconds()
+        return remaining > self.refresh_margin_seconds
+
+    def get_token(self) -> str:
+        """Return a cached installation token, refreshing it ahead of expiry"""
+        if self._is_fresh():
+            return self._token
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self._is_fresh():
+                return self._token
+            self._token, self._expires_at = self._request_installation_token()
+            return self._token
+
+    def invalidate(self) -> None:
+        """Drop the cached token (e.g. after GitHub answers 401 Bad credentials)"""
+        with self._lock:
+            self._token = None
+            self._expires_at = None
+
+    def _request_installation_token(self):
+        if not self.app_id or not self.installation_id or not self._raw_private_key:
+            raise ValueError("GITHUB_APP_ID, GITHUB_APP_INSTALLATION_ID, and GITHUB_APP_PRIVATE_KEY must be set")
+
+        # Generate JWT
+        now = int(time.time())
+        payload = {
+            "iat": now - 60,  # Issued at time (60 seconds in the past to allow for clock drift)
+            "exp": now + (10 * 60),  # JWT expiration time (10 minutes)
+            "iss": self.app_id  # GitHub App's identifier
+        }
+        jwt_token = jwt.encode(payload, self._load_signing_key(), algorithm="RS256")
+
+        # Get installation access token
+        headers = {
+            "Authorization": f"Bearer {jwt_token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28"
+        }
+
+        response = github_request(
+            "POST",
+            f"{GITHUB_API_URL}/app/installations/{self.installation_id}/access_tokens",
+            headers
+        )
+
+        if response.status_code != 201:
+            logging.error(f"Failed to get installation token: {response.status_code} - {response.text}")
+            raise Exception(f"Failed to authenticate as GitHub App: {response.status_code}")
+
+        token_data = response.json()
+        expires_at = datetime.fromisoformat(token_data["expires_at"].replace("Z", "+00:00"))
+        logging.info(f"Successfully authenticated as GitHub App (token expires at {token_data['expires_at']})")
+        return token_data["token"], expires_at
+
+
+_github_token_provider = GitHubAppTokenProvider(
+    GITHUB_APP_ID,
+    GITHUB_APP_INSTALLATION_ID,
+    GITHUB_APP_PRIVATE_KEY,
+    refresh_margin_seconds=GITHUB_TOKEN_REFRESH_MARGIN_SECONDS
+)
+
+
+@timed_stage("github.auth")
+def get_github_app_token() -> str:
+    """
+    Get an installation access token for GitHub App authentication
+    Tokens are cached process-wide and refreshed ahead of expiry (see GitHubAppTokenProvider)
+    https://docs.github.com/en/apps/creating-github-apps/authenticating-with-a-github-app/generating-a-json-web-token-jwt-for-a-github-app
+    """
+    return _github_token_provider.get_token()
+
+
+COLLECTION_ENTITIES = ("deployments", "pull_requests", "incidents")
+RATE_LIMIT_FIELDS = """
+  rateLimit {
+    cost
+    remaining
+    resetAt
+  }"""
+
+
+class GitHubRateLimitError(Exception):
+    """The GitHub rate-limit budget is exhausted and the reset is further away than we may wait"""
+
+
+class GitHubNotFoundError(Exception):
+    """A GraphQL query only failed with NOT_FOUND errors (e.g. a repository deleted or renamed)"""
+
+
+class GitHubRateLimitGovernor:
+    """
+    Process-wide GitHub rate-limit governor shared by every collector in the worker
+    - Token bucket pacing (requests_per_second, bursts of up to `burst` requests)
+    - Tracks remaining points / reset time per rate-limit resource ("graphql", "core", ...)
+      from response headers and from the GraphQL rateLimit { cost remaining resetAt } object
+    - Learns the point cost of each query and reserves it against the remaining budget before
+      each request, holding requests that would dip into reserve_points until the reset
+    - Pauses every caller after a secondary rate limit / Retry-After response
+    Waits longer than max_wait_seconds raise GitHubRateLimitError instead of sleeping past
+    the function timeout.
+    """
+
+    def __init__(self, requests_per_second: float, burst: int, reserve_points: int, max_wait_seconds: float):
+        self.requests_per_second = requests_per_second
+        self.burst = max(burst, 1)
+        self.reserve_points = reserve_points
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._budgets: Dict[str, Dict[str, float]] = {}  # resource -> {"remaining": points, "reset_at": epoch seconds}
+        self._query_costs: Dict[int, int] = {}
+        self.stats = {"requests": 0, "retries": 0, "throttled_seconds": 0.0, "graphql_points": 0}
+
+    def expected_cost(self, query: str) -> int:
+        """Last observed point cost of a GraphQL query (1 until it has been seen)"""
+        with self._lock:
+            return self._query_costs.get(hash(query), 1)
+
+    def _wait_time(self, resource: str, expected_cost: int) -> float:
+        """Seconds to wait before the next request may be sent (0 = send now). Caller holds the lock."""
+        now = time.time()
+        if self._paused_until > now:
+            return self._paused_until - now
+
+        budget = self._budgets.get(resource)
+        if budget is not None and budget["reset_at"] > now and budget["remaining"] - expected_cost < self.reserve_points:
+            return budget["reset_at"] - now + 1
+
+        monotonic_now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (monotonic_now - self._last_refill) * self.requests_per_second)
+        self._last_refill = monotonic_now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            if budget is not None:
+                # Reserve the points now so concurrent callers do not overspend the same budget
+                budget["remaining"] -= expected_cost
+            self.stats["requests"] += 1
+            return 0.0
+        return (1 - self._tokens) / self.requests_per_second
+
+    def acquire(self, resource: str = "graphql", expected_cost: int = 1) -> None:
+        """Block until a request of expected_cost points may be sent"""
+        while True:
+            with self._lock:
+                wait = self._wait_time(resource, expected_cost)
+                if wait <= 0:
+                    return
+                if wait > self.max_wait_seconds:
+                    raise GitHubRateLimitError(f"GitHub {resource} rate limit exhausted; next request allowed in {wait:.0f}s")
+                self.stats["throttled_seconds"] += wait
+            if wait > 1:
+                github_log.warning("[rate_limit] Waiting %.1fs for the GitHub %s budget", wait, resource)
+            with telemetry_span("github.throttle"):
+                time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller (e.g. after a secondary rate limit) for `seconds`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+            self.stats["retries"] += 1
+        telemetry_count("github_retries")
+
+    def record_headers(self, headers) -> None:
+        """Update the budget from x-ratelimit-* response headers"""
+        resource = headers.get("x-ratelimit-resource")
+        remaining = headers.get("x-ratelimit-remaining")
+        reset = headers.get("x-ratelimit-reset")
+        if not resource or remaining is None or reset is None:
+            return
+        with self._lock:
+            self._budgets[resource] = {"remaining": float(remaining), "reset_at": float(reset)}
+
+    def record_graphql(self, query: str, rate_limit: Dict[str, Any]) -> None:
+        """Update the GraphQL budget and the query's learned cost from the rateLimit object"""
+        reset_at = datetime.fromisoformat(rate_limit["resetAt"].replace("Z", "+00:00")).timestamp()
+        with self._lock:
+            self._query_costs[hash(query)] = rate_limit["cost"]
+            self._budgets["graphql"] = {"remaining": float(rate_limit["remaining"]), "reset_at": reset_at}
+            self.stats["graphql_points"] += rate_limit["cost"]
+
+    def retry_after(self, response) -> Optional[float]:
+        """Seconds to back off if the response is a primary or secondary rate limit, else None"""
+        if response.status_code not in (403, 429):
+            return None
+        if response.headers.get("retry-after"):
+            return float(response.headers["retry-after"])
+        if response.headers.get("x-ratelimit-remaining") == "0" and response.headers.get("x-ratelimit-reset"):
+            return max(float(response.headers["x-ratelimit-reset"]) - time.time(), 0) + 1
+        if response.status_code == 429 or "rate limit" in response.text.lower():
+            # GitHub asks clients to wait at least one minute after a secondary rate limit
+            return 60.0
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["budgets"] = {resource: dict(budget) for resource, budget in self._budgets.items()}
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 1)
+        return stats
+
+
+github_rate_limiter = GitHubRateLimitGovernor(
+    requests_per_second=GITHUB_REQUESTS_PER_SECOND,
+    burst=GITHUB_FETCH_CONCURRENCY,
+    reserve_points=GITHUB_RATE_LIMIT_RESERVE_POINTS,
+    max_wait_seconds=GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS
+)
+
+
+def github_request(method: str, url: str, headers: Dict[str, str], resource: str = "core",
+                   expected_cost: int = 1, **kwargs) -> requests.Response:
+    """
+    Send a GitHub API request through the shared rate-limit governor
+    Rate-limit responses (403/429 with Retry-After, exhausted budget or secondary limit), 5xx
+    responses and connection errors are retried up to GITHUB_MAX_RETRIES times. Any other
+    response is returned to the caller unchanged.
+    """
+    kwargs.setdefault("timeout", 30)
+    for attempt in range(GITHUB_MAX_RETRIES + 1):
+        github_rate_limiter.acquire(resource, expected_cost)
+        last_attempt = attempt == GITHUB_MAX_RETRIES
+        try:
+            with telemetry_span("github.http"):
+                response = requests.request(method, url, headers=headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                raise
+            backoff = min(2 ** attempt, 30)
+            github_log.warning("[rate_limit] %s calling GitHub, retrying in %ss", type(e).__name__, backoff)
+            github_rate_limiter.pause(backoff)
+            continue
+
+        telemetry_count("github_requests")
+        telemetry_count("github_bytes", len(response.content))
+        github_rate_limiter.record_headers(response.headers)
+
+        wait = github_rate_limiter.retry_after(response)
+        if wait is not None:
+            if last_attempt or wait > GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise GitHubRateLimitError(f"GitHub rate limit hit ({response.status_code}); retry after {wait:.0f}s")
+            github_log.warning("[rate_limit] GitHub rate limit hit (%d), pausing %.0fs", response.status_code, wait)
+            github_rate_limiter.pause(wait)
+            continue
+
+        if response.status_code in (500, 502, 503, 504) and not last_attempt:
+            backoff = min(2 ** attempt, 30)
+            github_log.warning("[rate_limit] GitHub returned %d, retrying in %ss", response.status_code, backoff)
+            github_rate_limiter.pause(backoff)
+            continue
+
+        return response
+    return response
+
+
+@timed_stage("github.graphql")
+def github_graphql(github_token: str, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Execute a GitHub GraphQL query and return its "data" object
+    Goes through the shared rate-limit governor; RATE_LIMITED errors are retried after the reset.
+    Raises on non-200 responses and on other GraphQL errors
+    """
+    headers = {
+        "Authorization": f"Bearer {github_token}",
+        "Content-Type": "application/json"
+    }
+
+    for attempt in range(GITHUB_MAX_RETRIES + 1):
+        response = github_request(
+            "POST",
+            GITHUB_GRAPHQL_URL,
+            headers,
+            resource="graphql",
+            expected_cost=github_rate_limiter.expected_cost(query),
+            json={"query": query, "variables": variables}
+        )
+
+        if response.status_code != 200:
+            github_log.error("GitHub API error: %d - %s", response.status_code, response.text)
+            raise Exception(f"GitHub API returned {response.status_code}")
+
+        with telemetry_span("github.json"):
+            data = response.json()
+
+        if data.get("data") and data["data"].get("rateLimit"):
+            github_rate_limiter.record_graphql(query, data["data"]["rateLimit"])
+            telemetry_count("graphql_points", data["data"]["rateLimit"]["cost"])
+
+        if "errors" in data:
+            if any(error.get("type") == "RATE_LIMITED" for error in data["errors"]) and attempt < GITHUB_MAX_RETRIES:
+                # Wait for the budget reset recorded from the response headers
+                github_log.warning("[rate_limit] GraphQL RATE_LIMITED, waiting for the budget to reset")
+                continue
+            if all(error.get("type") == "NOT_FOUND" for error in data["errors"]):
+                github_log.warning("GraphQL NOT_FOUND: %s", data["errors"])
+                raise GitHubNotFoundError(f"GraphQL query failed: {data['errors']}")
+            github_log.error("GraphQL errors: %s", data["errors"])
+            raise Exception(f"GraphQL query failed: {data['errors']}")
+
+        return data["data"]
+
+    raise GitHubRateLimitError("GraphQL query still RATE_LIMITED after retries")
+
+
+def get_environments_filter() -> List[str]:
+    """Parse GITHUB_DEPLOYMENT_ENVIRONMENTS into a list of environment names"""
+    if not GITHUB_DEPLOYMENT_ENVIRONMENTS:
+        return []
+    return [env.strip() for env in GITHUB_DEPLOYMENT_ENVIRONMENTS.split(",") if env.strip()]
+
+
+def connection_arguments(first: int, paginated: bool) -> str:
+    """`first`/`after` arguments for a nested connection (follow-up pages take $cursor)"""
+    return f"first: {first}, after: $cursor" if paginated else f"first: {first}"
+
+
+def deployments_connection(first: int, paginated: bool = False) -> str:
+    """Aliased deployments connection for a Repository node (optional environment filter)"""
+    arguments = connection_arguments(first, paginated)
+    environments_filter = get_environments_filter()
+    if environments_filter:
+        # Convert list to GraphQL array format
+        envs_graphql = '[' + ', '.join([f'"{env}"' for env in environments_filter]) + ']'
+        deployments_query = f'deployments({arguments}, environments: {envs_graphql}, orderBy: {{field: CREATED_AT, direction: DESC}})'
+    else:
+        deployments_query = f'deployments({arguments}, orderBy: {{field: CREATED_AT, direction: DESC}})'
+
+    return f"""
+            deployments: {deployments_query} {{
+              pageInfo {{
+                hasNextPage
+                endCursor
+              }}
+              nodes {{
+                id
+                createdAt
+                environment
+                commit {{
+                  oid
+                  author {{
+                    user {{
+                      login
+                    }}
+                  }}
+                }}
+                creator {{
+                  login
+                }}
+                latestStatus {{
+                  state
+                  createdAt
+                }}
+              }}
+            }}"""
+
+
+def pull_requests_connection(first: int, paginated: bool = False) -> str:
+    """Aliased merged pullRequests connection, newest activity first (mergedAt <= updatedAt)"""
+    return f"""
+            pullRequests: pullRequests({connection_arguments(first, paginated)}, states: MERGED, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+              pageInfo {{
+                hasNextPage
+                endCursor
+              }}
+              nodes {{
+                number
+                title
+                createdAt
+                updatedAt
+                mergedAt
+                baseRefName
+                mergeCommit {{
+                  oid
+                }}
+                author {{
+                  login
+                }}
+                commits(first: 1) {{
+                  nodes {{
+                    commit {{
+                      authoredDate
+                    }}
+                  }}
+                }}
+              }}
+            }}"""
+
+
+def incidents_connection(first: int, paginated: bool = False) -> str:
+    """Aliased incident issues connection; uses the $since variable (org-wide incidents watermark)"""
+    return f"""
+            issues: issues({connection_arguments(first, paginated)}, labels: ["incident", "production"], states: [OPEN, CLOSED], filterBy: {{since: $since}}, orderBy: {{field: UPDATED_AT, direction: DESC}}) {{
+              pageInfo {{
+                hasNextPage
+                endCursor
+              }}
+              nodes {{
+                number
+                title
+                bodyText
                 createdAt
+                updatedAt
                 closedAt
                 state
-                labels(first: 20) {
-                  nodes {
+                labels(first: 20) {{
+                  nodes {{
                     name
-                  }
-                }
-                author {
+                  }}
+                }}
+                author {{
                   login
-                }
+                }}
                 url
-              }
-            }
-          }
-        }
-      }
-    }
+              }}
+            }}"""
+
+
+# entity type -> (connection builder, response alias, field the connection is ordered by, lookback hours)
+INNER_CONNECTIONS = {
+    "deployments": (deployments_connection, "deployments", "createdAt", DEPLOYMENT_LOOKBACK_HOURS),
+    "pull_requests": (pull_requests_connection, "pullRequests", "updatedAt", PR_LOOKBACK_HOURS),
+    "incidents": (incidents_connection, "issues", "updatedAt", INCIDENT_LOOKBACK_HOURS)
+}
+
+
+REPOSITORY_ACTIVITY_FIELDS = {"PUSHED_AT": "pushedAt", "UPDATED_AT": "updatedAt"}
+if REPOSITORY_ORDER_FIELD not in REPOSITORY_ACTIVITY_FIELDS:
+    raise ValueError(f"REPOSITORY_ORDER_FIELD must be one of {list(REPOSITORY_ACTIVITY_FIELDS)}, got '{REPOSITORY_ORDER_FIELD}'")
+REPOSITORY_ACTIVITY_FIELD = REPOSITORY_ACTIVITY_FIELDS[REPOSITORY_ORDER_FIELD]
+
+# New deployments and merged PRs come with a push, so a repository whose last push is older
+# than the window cannot have any. Issues do not move pushedAt.
+PUSH_DRIVEN_ENTITIES = ("deployments", "pull_requests")
+
+
+def repository_list_arguments() -> str:
+    """organization.repositories arguments: newest activity first, archived repositories and forks excluded by policy"""
+    arguments = f"first: 100, after: $cursor, orderBy: {{field: {REPOSITORY_ORDER_FIELD}, direction: DESC}}"
+    if not INCLUDE_ARCHIVED_REPOS:
+        arguments += ", isArchived: false"
+    if not INCLUDE_FORK_REPOS:
+        arguments += ", isFork: false"
+    return arguments
+
+
+def activity_scoped_entities(entities: List[str]) -> List[str]:
+    """Entities that may be skipped on dormant repositories under the current policy"""
+    if not SKIP_DORMANT_REPOS:
+        return []
+    return [
+        entity for entity in entities
+        if entity in PUSH_DRIVEN_ENTITIES or (entity == "incidents" and not INCIDENT_SCAN_DORMANT_REPOS)
+    ]
+
+
+def activity_cutoff(entities: List[str], watermarks: Dict[str, Optional[Dict[str, datetime]]]) -> Optional[datetime]:
+    """
+    Repositories last active before this time hold nothing new for the activity-scoped entities
+    The oldest org-wide threshold of those entities minus DORMANT_REPO_GRACE_HOURS; None when
+    every repository has to be visited.
+    """
+    thresholds = [
+        watermark_threshold(watermarks.get(entity), ORG_WATERMARK_KEY, INNER_CONNECTIONS[entity][3])
+        for entity in activity_scoped_entities(entities)
+    ]
+    if not thresholds:
+        return None
+    return min(thresholds) - timedelta(hours=DORMANT_REPO_GRACE_HOURS)
+
+
+def repository_is_active(repo: Dict[str, Any], cutoff: datetime) -> bool:
+    """Whether the repository's REPOSITORY_ACTIVITY_FIELD is at or after cutoff (empty repositories never are)"""
+    last_activity = repo.get(REPOSITORY_ACTIVITY_FIELD)
+    return last_activity is not None and datetime.fromisoformat(last_activity.replace("Z", "+00:00")) >= cutoff
+
+
+def repository_connections(entities: List[str]) -> Tuple[str, str]:
+    """
+    Aliased connections for the requested entity types and the extra variable declarations they need
+    entities: any of "deployments", "pull_requests", "incidents"
+    """
+    connections = [
+        INNER_CONNECTIONS[entity][0](GITHUB_INNER_FIRST_PAGE_SIZE)
+        for entity in COLLECTION_ENTITIES if entity in entities
+    ]
+
+    # GraphQL rejects declared-but-unused variables, so $since is only declared for incidents
+    since_variable = ", $since: DateTime" if "incidents" in entities else ""
+    return ''.join(connections), since_variable
+
+
+def build_repositories_query(entities: List[str]) -> str:
+    """Compose one organization.repositories query with an aliased connection per entity type"""
+    connections, since_variable = repository_connections(entities)
+
+    return f"""
+    query($org: String!, $cursor: String{since_variable}) {{{RATE_LIMIT_FIELDS}
+      organization(login: $org) {{
+        repositories({repository_list_arguments()}) {{
+          pageInfo {{
+            hasNextPage
+            endCursor
+          }}
+          nodes {{
+            name
+            {REPOSITORY_ACTIVITY_FIELD}
+            owner {{
+              login
+            }}{connections}
+          }}
+        }}
+      }}
+    }}
+    """
+
+
+def build_repository_nodes_query(entities: List[str]) -> str:
+    """Same connections as build_repositories_query, but for an explicit batch of repository node IDs"""
+    connections, since_variable = repository_connections(entities)
+
+    return f"""
+    query($ids: [ID!]!{since_variable}) {{{RATE_LIMIT_FIELDS}
+      nodes(ids: $ids) {{
+        ... on Repository {{
+          name
+          owner {{
+            login
+          }}{connections}
+        }}
+      }}
+    }}
     """
+
+
+REPOSITORY_IDS_QUERY = f"""
+query($org: String!, $cursor: String) {{{RATE_LIMIT_FIELDS}
+  organization(login: $org) {{
+    repositories({repository_list_arguments()}) {{
+      pageInfo {{
+        hasNextPage
+        endCursor
+      }}
+      nodes {{
+        id
+        {REPOSITORY_ACTIVITY_FIELD}
+      }}
+    }}
+  }}
+}}
+"""
+
+
+def iter_repository_id_batches(github_token: str, batch_size: int, cutoff: Optional[datetime] = None,
+                               include_dormant: bool = True):
+    """
+    Yield (ids, active) batches of organization repository node IDs as the (small, cheap) ID pages arrive
+    Consumed lazily, so fetching the first batches overlaps with enumerating the rest.
+    With a cutoff, repositories last active before it are batched separately (active=False), or
+    enumeration stops at the first dormant page when include_dormant is False.
+    With SHARDING_ENABLED, only repositories in the partitions this instance holds are yielded.
+    """
+    batches = {True: [], False: []}
+    for repos in iter_repository_pages(github_token, REPOSITORY_IDS_QUERY, {}):
+        for repo in repos:
+            if SHARDING_ENABLED and not shard_coordinator.owns(repo["id"]):
+                continue
+            active = cutoff is None or repository_is_active(repo, cutoff)
+            if not active and not include_dormant:
+                continue
+            batch = batches[active]
+            batch.append(repo["id"])
+            if len(batch) == batch_size:
+                yield batch, active
+                batches[active] = []
+
+        if cutoff is not None and not include_dormant and repos and not repository_is_active(repos[-1], cutoff):
+            github_log.info("Stopped enumerating repositories: the rest were last active before %s", cutoff.isoformat())
+            break
+
+    for active, batch in batches.items():
+        if batch:
+            yield batch, active
+
+
+def map_concurrently(fn, items, concurrency: int):
+    """
+    Apply fn to each item on up to `concurrency` threads, yielding results in input order
+    At most 2 x concurrency calls are in flight, so memory stays bounded for long inputs.
+    The first exception is re-raised to the caller and calls that have not started are cancelled.
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    iterator = iter(items)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="github-fetch") as executor:
+        try:
+            for item in itertools.islice(iterator, concurrency * 2):
+                pending.append(executor.submit(contextvars.copy_context().run, fn, item))
+            while pending:
+                result = pending.popleft().result()
+                for item in itertools.islice(iterator, 1):
+                    pending.append(executor.submit(contextvars.copy_context().run, fn, item))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def iter_repositories(github_token: str, entities: List[str], variables: Dict[str, Any],
+                      cutoff: Optional[datetime] = None):
+    """
+    Yield lists of repository nodes carrying the connections for `entities`
+    With GITHUB_FETCH_CONCURRENCY > 1 the repository IDs are enumerated with a light query and
+    fetched in batches of GITHUB_REPO_BATCH_SIZE in parallel; otherwise the organization is paged
+    serially. Batches are yielded in enumeration order either way.
+    With a cutoff (see activity_cutoff), repositories last active before it only carry the
+    connections of entities that are not activity-scoped, and are not fetched at all if there are none.
+    With SHARDING_ENABLED only this instance's partitions are fetched (always through the ID batches).
+    """
+    dormant_entities = [entity for entity in entities if entity not in activity_scoped_entities(entities)] if cutoff else []
+
+    # Sharding needs the repository IDs up front, so it always enumerates them first
+    if GITHUB_FETCH_CONCURRENCY <= 1 and not SHARDING_ENABLED:
+        dormant_query = build_repositories_query(dormant_entities) if dormant_entities else None
+        yield from iter_repository_pages(github_token, build_repositories_query(entities), variables, cutoff, dormant_query)
+        return
+
+    github_log.info("Fetching repositories in batches of %d with concurrency %d", GITHUB_REPO_BATCH_SIZE, GITHUB_FETCH_CONCURRENCY)
+    batches = iter_repository_id_batches(github_token, GITHUB_REPO_BATCH_SIZE, cutoff, bool(dormant_entities))
+
+    queries = {True: build_repository_nodes_query(entities)}
+    if dormant_entities:
+        queries[False] = build_repository_nodes_query(dormant_entities)
+
+    def fetch_batch(batch: Tuple[List[str], bool]) -> List[Dict[str, Any]]:
+        batch_ids, active = batch
+        data = github_graphql(github_token, queries[active], {**variables, "ids": batch_ids})
+        # Repositories deleted since enumeration come back as null
+        return [node for node in data["nodes"] if node]
+
+    yield from map_concurrently(fetch_batch, batches, GITHUB_FETCH_CONCURRENCY)
+
+
+def build_inner_page_query(entity: str) -> str:
+    """Follow-up page of one nested connection for a single repository"""
+    builder = INNER_CONNECTIONS[entity][0]
+    since_variable = ", $since: DateTime" if entity == "incidents" else ""
+
+    return f"""
+    query($owner: String!, $name: String!, $cursor: String{since_variable}) {{{RATE_LIMIT_FIELDS}
+      repository(owner: $owner, name: $name) {{{builder(GITHUB_INNER_PAGE_SIZE, paginated=True)}
+      }}
+    }}
+    """
+
+
+def connection_needs_more(connection: Dict[str, Any], order_field: str, threshold: datetime) -> bool:
+    """
+    True while a DESC-ordered connection may still hold items at or after threshold
+    Once the last (oldest) node is older than threshold, nothing newer can remain on later pages.
+    """
+    if not connection["pageInfo"]["hasNextPage"] or not connection["nodes"]:
+        return False
+    oldest = datetime.fromisoformat(connection["nodes"][-1][order_field].replace("Z", "+00:00"))
+    return oldest >= threshold
+
+
+def paginate_inner_connections(github_token: str, repos: List[Dict[str, Any]], entities: List[str],
+                               watermarks: Dict[str, Optional[Dict[str, datetime]]], variables: Dict[str, Any]) -> None:
+    """
+    Fetch the remaining pages of nested connections in place, only while items are inside the window
+    Quiet repositories cost nothing extra; busy repositories are followed page by page until
+    the ordering guarantees nothing newer than the watermark/lookback threshold remains.
+    """
+    pending = []
+    for repo in repos:
+        full_name = f"{repo['owner']['login']}/{repo['name']}"
+        for entity in entities:
+            _, alias, order_field, lookback_hours = INNER_CONNECTIONS[entity]
+            if alias not in repo:
+                # Dormant repository fetched without this connection
+                continue
+            threshold = watermark_threshold(watermarks.get(entity), full_name, lookback_hours)
+            if connection_needs_more(repo[alias], order_field, threshold):
+                pending.append((repo, entity, threshold))
+
+    if not pending:
+        return
+
+    github_log.debug("Paginating %d busy repository connections beyond the first page", len(pending))
+
+    def fetch_remaining(task) -> int:
+        repo, entity, threshold = task
+        _, alias, order_field, _ = INNER_CONNECTIONS[entity]
+        query = build_inner_page_query(entity)
+        connection = repo[alias]
+        pages = 0
+        while connection_needs_more(connection, order_field, threshold):
+            if pages >= GITHUB_INNER_MAX_PAGES:
+                github_log.warning("Stopped paginating %s for %s/%s after %d extra pages (GITHUB_INNER_MAX_PAGES)", entity, repo["owner"]["login"], repo["name"], pages)
+                break
+            page_variables = {"owner": repo["owner"]["login"], "name": repo["name"], "cursor": connection["pageInfo"]["endCursor"]}
+            if entity == "incidents":
+                page_variables["since"] = variables["since"]
+            page = github_graphql(github_token, query, page_variables)["repository"][alias]
+            connection["nodes"].extend(page["nodes"])
+            connection["pageInfo"] = page["pageInfo"]
+            pages += 1
+        return pages
+
+    extra_pages = sum(map_concurrently(fetch_remaining, pending, GITHUB_FETCH_CONCURRENCY))
+    github_log.debug("Fetched %d extra connection pages", extra_pages)
+
+
+def iter_repository_pages(github_token: str, query: str, variables: Dict[str, Any],
+                          cutoff: Optional[datetime] = None, dormant_query: Optional[str] = None):
+    """
+    Yield the repository nodes of each organization.repositories page
+    Pages arrive newest activity first, so once a page ends with a repository last active before
+    cutoff the remaining pages are fetched with dormant_query, or not at all when it is None.
+    """
+    cursor = None
+    has_next_page = True
+
+    while has_next_page:
+        data = github_graphql(github_token, query, {**variables, "org": GITHUB_ORG, "cursor": cursor})
+
+        repositories = data["organization"]["repositories"]
+        if cursor is None:
+            cost = github_rate_limiter.expected_cost(query)
+            github_log.info("[rate_limit] Page cost %d points", cost)
+        yield repositories["nodes"]
+
+        page_info = repositories["pageInfo"]
+        has_next_page = page_info["hasNextPage"]
+        cursor = page_info["endCursor"]
+
+        nodes = repositories["nodes"]
+        if has_next_page and cutoff is not None and query != dormant_query and nodes and not repository_is_active(nodes[-1], cutoff):
+            if dormant_query is None:
+                github_log.info("Stopped paging repositories: the rest were last active before %s", cutoff.isoformat())
+                break
+            github_log.info("Remaining repositories were last active before %s; continuing with a lighter query", cutoff.isoformat())
+            query = dormant_query
+
+
+def count_parsed(entity: str, repo_name: str, fetched: int, kept: int, **skipped: int) -> None:
+    """
+    Per-repository parse counters instead of a log line per item
+    Kept and skipped items are added to the run's counters (e.g. deployments_kept); the breakdown
+    of skip reasons is one debug line on the collect logger.
+    """
+    if not fetched:
+        return
+    telemetry_count(f"{entity}_kept", kept)
+    telemetry_count(f"{entity}_skipped", fetched - kept)
+    log_event(collect_log, logging.DEBUG, f"[parse_{entity}]", repository=repo_name, fetched=fetched, kept=kept, **skipped)
+
+
+@timed_stage("github.parse")
+def parse_repo_deployments(repo: Dict[str, Any], threshold: datetime) -> List[Dict[str, Any]]:
+    """Normalize a repository's deployments, keeping those created at or after threshold"""
+    repo_name = repo["name"]
+    if "deployments" not in repo:
+        return []
+    deployments_in_repo = repo["deployments"]["nodes"]
+
+    records = []
+    before_watermark = 0
+    for deployment in deployments_in_repo:
+        # Filter deployments newer than the watermark (default: last 24 hours)
+        created_at = datetime.fromisoformat(deployment["createdAt"].replace("Z", "+00:00"))
+        if created_at >= threshold:
+            records.append({
+                "deployment_id": deployment["id"],
+                "repository": f"{repo['owner']['login']}/{repo_name}",
+                "environment": deployment["environment"],
+                "commit_sha": deployment["commit"]["oid"],
+                "created_at": deployment["createdAt"],
+                "creator": deployment["creator"]["login"] if deployment["creator"] else "unknown",
+                "status": deployment["latestStatus"]["state"] if deployment["latestStatus"] else "pending",
+                "status_updated_at": deployment["latestStatus"]["createdAt"] if deployment["latestStatus"] else None
+            })
+        else:
+            before_watermark += 1
+
+    count_parsed("deployments", repo_name, len(deployments_in_repo), len(records), before_watermark=before_watermark)
+    return records
+
+
+@timed_stage("github.parse")
+def parse_repo_pull_requests(repo: Dict[str, Any], threshold: datetime) -> List[Dict[str, Any]]:
+    """Normalize a repository's PRs merged to BASE_BRANCH at or after threshold"""
+    repo_name = repo["name"]
+    if "pullRequests" not in repo:
+        return []
+    prs_in_repo = repo["pullRequests"]["nodes"]
+
+    records = []
+    other_branch = not_merged = before_watermark = 0
+    for pr in prs_in_repo:
+        # Filter by base branch and time window
+        if pr["baseRefName"] != BASE_BRANCH:
+            other_branch += 1
+            continue
+
+        if not pr["mergedAt"]:
+            not_merged += 1
+            continue
+
+        merged_at = datetime.fromisoformat(pr["mergedAt"].replace("Z", "+00:00"))
+        if merged_at >= threshold:
+            # Extract first commit authored date (canonical DORA T1)
+            first_commit_date = None
+            if pr.get("commits") and pr["commits"].get("nodes") and len(pr["commits"]["nodes"]) > 0:
+                first_commit_date = pr["commits"]["nodes"][0]["commit"]["authoredDate"]
+
+            records.append({
+                "pr_number": pr["number"],
+                "repository": f"{repo['owner']['login']}/{repo_name}",
+                "title": pr["title"],
+                "author": pr["author"]["login"] if pr["author"] else "unknown",
+                "created_at": pr["createdAt"],
+                "merged_at": pr["mergedAt"],
+                "merge_commit_sha": pr["mergeCommit"]["oid"] if pr["mergeCommit"] else None,
+                "base_branch": pr["baseRefName"],
+                "first_commit_date": first_commit_date
+            })
+        else:
+            before_watermark += 1
+
+    count_parsed("pull_requests", repo_name, len(prs_in_repo), len(records),
+                 other_branch=other_branch, not_merged=not_merged, before_watermark=before_watermark)
+    return records
+
+
+def incident_label_flags(labels: List[str]) -> Tuple[bool, bool]:
+    """(has incident label, has production label) for a list of label names"""
+    label_names = [label.lower() for label in labels]
+    has_incident_label = any(label in ["incident", "production-incident"] for label in label_names)
+    has_production_label = any(label in ["production", "environment:production", "env:production"] for label in label_names)
+    return has_incident_label, has_production_label
+
+
+def extract_incident_product(body: Optional[str]) -> Optional[str]:
+    """Product from the "Product Affected" field of the incident issue form, if present"""
+    if not body:
+        return None
+    product_match = re.search(r'### Product Affected\s*\n\s*(.+)', body)
+    return product_match.group(1).strip() if product_match else None
+
+
+@timed_stage("github.parse")
+def parse_repo_incidents(repo: Dict[str, Any], threshold: datetime) -> List[Dict[str, Any]]:
+    """Normalize a repository's incident issues updated at or after threshold"""
+    repo_name = repo["name"]
+    if "issues" not in repo:
+        return []
+    issues_in_repo = repo["issues"]["nodes"]
+
+    records = []
+    missing_labels = before_watermark = 0
+    for issue in issues_in_repo:
+        # Filter by watermark (default: updated within the lookback window)
+        updated_at = datetime.fromisoformat(issue["updatedAt"].replace("Z", "+00:00"))
+        if updated_at >= threshold:
+            # Verify both "incident" and "production" labels are present
+            has_incident_label, has_production_label = incident_label_flags([label["name"] for label in issue["labels"]["nodes"]])
+
+            if has_incident_label and has_production_label:
+                product = extract_incident_product(issue.get("bodyText"))
+
+                # Convert labels list to JSON string
+                labels_json = json.dumps([label["name"] for label in issue["labels"]["nodes"]])
+
+                records.append({
+                    "issue_number": issue["number"],
+                    "repository": f"{repo['owner']['login']}/{repo_name}",
+                    "title": issue["title"],
+                    "created_at": issue["createdAt"],
+                    "updated_at": issue["updatedAt"],
+                    "closed_at": issue["closedAt"],
+                    "state": issue["state"].lower(),
+                    "labels": labels_json,
+                    "product": product,
+                    "creator": issue["author"]["login"] if issue["author"] else "unknown",
+                    "url": issue["url"]
+                })
+            else:
+                missing_labels += 1
+        else:
+            before_watermark += 1
+
+    count_parsed("incidents", repo_name, len(issues_in_repo), len(records),
+                 missing_labels=missing_labels, before_watermark=before_watermark)
+    return records
+
+
+def incidents_since(watermarks: Optional[Dict[str, datetime]]) -> datetime:
+    """Server-side filter for issues: nothing older than the org-wide watermark needs to be downloaded"""
+    return watermark_threshold(watermarks, ORG_WATERMARK_KEY, INCIDENT_LOOKBACK_HOURS)
+
+
+def iter_github_deployments(github_token: str, watermarks: Optional[Dict[str, datetime]] = None):
+    """
+    Fetch/parse stage for deployments: yield the deployment records of each repository page
+    Only deployments created after each repository's watermark (or within DEPLOYMENT_LOOKBACK_HOURS) are yielded
+    """
+    if not GITHUB_ORG:
+        raise ValueError("GITHUB_ORG_NAME must be set")
+    # Parse environment filter
+    environments_filter = get_environments_filter()
+    if environments_filter:
+        collect_log.info("Filtering deployments for environments: %s", environments_filter)
+    else:
+        collect_log.info("No environment filter set - collecting all deployment environments")
+
+    cutoff = activity_cutoff(["deployments"], {"deployments": watermarks})
+
+    for repos in iter_repositories(github_token, ["deployments"], {}, cutoff):
+        collect_log.debug("Processing %d repositories", len(repos))
+        paginate_inner_connections(github_token, repos, ["deployments"], {"deployments": watermarks}, {})
+
+        page_deployments = []
+        for repo in repos:
+            full_name = f"{repo['owner']['login']}/{repo['name']}"
+            page_deployments.extend(parse_repo_deployments(repo, watermark_threshold(watermarks, full_name, DEPLOYMENT_LOOKBACK_HOURS)))
+        yield page_deployments
+
+
+def collect_github_deployments(github_token: str, watermarks: Optional[Dict[str, datetime]] = None) -> List[Dict[str, Any]]:
+    """
+    Collect deployments from GitHub organization using GraphQL API
+    Only deployments created after each repository's watermark (or within DEPLOYMENT_LOOKBACK_HOURS) are returned
+    """
+    all_deployments = list(itertools.chain.from_iterable(iter_github_deployments(github_token, watermarks)))
+    collect_log.info("Total deployments collected (since watermarks / last %dh): %d", DEPLOYMENT_LOOKBACK_HOURS, len(all_deployments))
+    return all_deployments
+
+
+def iter_github_pull_requests(github_token: str, watermarks: Optional[Dict[str, datetime]] = None):
+    """
+    Fetch/parse stage for merged pull requests: yield the PR records of each repository page
+    Only PRs merged to BASE_BRANCH after each repository's watermark (or within PR_LOOKBACK_HOURS) are yielded
+    """
+    if not GITHUB_ORG:
+        raise ValueError("GITHUB_ORG_NAME must be set")
+
+    collect_log.info("Collecting merged PRs to '%s' branch from last %d hours", BASE_BRANCH, PR_LOOKBACK_HOURS)
+
+    cutoff = activity_cutoff(["pull_requests"], {"pull_requests": watermarks})
+
+    for repos in iter_repositories(github_token, ["pull_requests"], {}, cutoff):
+        collect_log.debug("Processing %d repositories for PRs", len(repos))
+        paginate_inner_connections(github_token, repos, ["pull_requests"], {"pull_requests": watermarks}, {})
+
+        page_prs = []
+        for repo in repos:
+            full_name = f"{repo['owner']['login']}/{repo['name']}"
+            page_prs.extend(parse_repo_pull_requests(repo, watermark_threshold(watermarks, full_name, PR_LOOKBACK_HOURS)))
+        yield page_prs
+
+
+def collect_github_pull_requests(github_token: str, watermarks: Optional[Dict[str, datetime]] = None) -> List[Dict[str, Any]]:
+    """
+    Collect merged pull requests from GitHub organization using GraphQL API
+    Tracks PRs merged to the base branch (typically 'main') for lead time calculation
+    Only PRs merged after each repository's watermark (or within PR_LOOKBACK_HOURS) are returned
+    """
+    all_prs = list(itertools.chain.from_iterable(iter_github_pull_requests(github_token, watermarks)))
+    collect_log.info("Total PRs collected (merged to %s in last %dh): %d", BASE_BRANCH, PR_LOOKBACK_HOURS, len(all_prs))
+    return all_prs
+
+
+def iter_github_incidents(github_token: str, watermarks: Optional[Dict[str, datetime]] = None):
+    """
+    Fetch/parse stage for incidents: yield the incident records of each repository page
+    Issues are selected by updatedAt so that closing an older incident is picked up as well;
+    only issues updated after each repository's watermark (or within INCIDENT_LOOKBACK_HOURS) are yielded
+    """
+    if not GITHUB_ORG:
+        raise ValueError("GITHUB_ORG_NAME must be set")
+
+    since_time = incidents_since(watermarks)
+    collect_log.info("Collecting incidents updated since %s", since_time.isoformat())
+
+    variables = {"since": since_time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+    cutoff = activity_cutoff(["incidents"], {"incidents": watermarks})
+
+    for repos in iter_repositories(github_token, ["incidents"], variables, cutoff):
+        collect_log.debug("Processing %d repositories for incidents", len(repos))
+        paginate_inner_connections(github_token, repos, ["incidents"], {"incidents": watermarks}, variables)
+
+        page_incidents = []
+        for repo in repos:
+            full_name = f"{repo['owner']['login']}/{repo['name']}"
+            page_incidents.extend(parse_repo_incidents(repo, watermark_threshold(watermarks, full_name, INCIDENT_LOOKBACK_HOURS)))
+        yield page_incidents
+
+
+def collect_github_incidents(github_token: str, watermarks: Optional[Dict[str, datetime]] = None) -> List[Dict[str, Any]]:
+    """
+    Collect incidents from GitHub Issues with labels "incident" AND "production"
+    Uses GraphQL API to query organization repositories
+    Issues are selected by updatedAt so that closing an older incident is picked up as well;
+    only issues updated after each repository's watermark (or within INCIDENT_LOOKBACK_HOURS) are returned
+    """
+    all_incidents = list(itertools.chain.from_iterable(iter_github_incidents(github_token, watermarks)))
+    collect_log.info("Total incidents collected (updated since watermarks / last %dh): %d", INCIDENT_LOOKBACK_HOURS, len(all_incidents))
+    return all_incidents
+
+
+def iter_github_all(github_token: str, watermarks: Optional[Dict[str, Dict[str, datetime]]] = None):
+    """
+    Fetch/parse stage of the unified collector: one organization traversal for all three metrics
+    One composed query with aliased connections replaces the three per-metric traversals,
+    so each repository page is fetched once instead of three times.
+    Yields {"deployments": [...], "pull_requests": [...], "incidents": [...]} per repository page,
+    with the same record shapes as the per-metric iter_github_* functions.
+    """
+    if not GITHUB_ORG:
+        raise ValueError("GITHUB_ORG_NAME must be set")
+
+    watermarks = watermarks or {}
+    deployment_watermarks = watermarks.get("deployments")
+    pr_watermarks = watermarks.get("pull_requests")
+    incident_watermarks = watermarks.get("incidents")
+
+    since_time = incidents_since(incident_watermarks)
+    collect_log.info("Collecting deployments, PRs merged to '%s' and incidents updated since %s in one pass", BASE_BRANCH, since_time.isoformat())
+
+    variables = {"since": since_time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+    cutoff = activity_cutoff(list(COLLECTION_ENTITIES), watermarks)
+
+    for repos in iter_repositories(github_token, list(COLLECTION_ENTITIES), variables, cutoff):
+        collect_log.debug("Processing %d repositories (unified)", len(repos))
+        paginate_inner_connections(github_token, repos, list(COLLECTION_ENTITIES), watermarks, variables)
+
+        page = {entity: [] for entity in COLLECTION_ENTITIES}
+        for repo in repos:
+            full_name = f"{repo['owner']['login']}/{repo['name']}"
+            page["deployments"].extend(parse_repo_deployments(repo, watermark_threshold(deployment_watermarks, full_name, DEPLOYMENT_LOOKBACK_HOURS)))
+            page["pull_requests"].extend(parse_repo_pull_requests(repo, watermark_threshold(pr_watermarks, full_name, PR_LOOKBACK_HOURS)))
+            page["incidents"].extend(parse_repo_incidents(repo, watermark_threshold(incident_watermarks, full_name, INCIDENT_LOOKBACK_HOURS)))
+        yield page
+
+
+def collect_github_all(github_token: str, watermarks: Optional[Dict[str, Dict[str, datetime]]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Collect deployments, merged PRs and incidents in a single organization traversal
+    Returns {"deployments": [...], "pull_requests": [...], "incidents": [...]} with the same
+    record shapes as the per-metric collect_github_* functions.
+    """
+    results = {entity: [] for entity in COLLECTION_ENTITIES}
+    for page in iter_github_all(github_token, watermarks):
+        for entity, records in page.items():
+            results[entity].extend(records)
+
+    collect_log.info("Total collected (unified): %d deployments, %d PRs, %d incidents",
+                     len(results["deployments"]), len(results["pull_requests"]), len(results["incidents"]))
+    return results
+
+
+def prefetch(iterable, depth: int):
+    """
+    Run an iterator on a background thread, handing items over through a bounded queue
+    The consumer's work on item N overlaps with producing item N+1. The producer blocks while
+    `depth` items are waiting, so memory is bounded by the queue rather than by the input size.
+    Producer exceptions are re-raised in the consumer; closing this generator stops the producer.
+    """
+    buffer = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(message) -> bool:
+        with telemetry_span("pipeline.wait_store"):
+            while not stop.is_set():
+                try:
+                    buffer.put(message, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as e:
+            put(("error", e))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), name="pipeline-producer", daemon=True).start()
+    try:
+        while True:
+            with telemetry_span("pipeline.wait_fetch"):
+                kind, value = buffer.get()
+            if kind == "error":
+                raise value
+            if kind == "done":
+                return
+            yield value
+    finally:
+        stop.set()
+
+
+def stream_to_store(pages, sinks: List[Tuple[str, Any, str]], label: str, on_batch=None) -> Dict[str, int]:
+    """
+    Batch/write stage of the collection pipeline
+    pages yields {entity: [records]} per repository page and is consumed through prefetch(), so
+    writing one batch overlaps with fetching the next pages. sinks are (entity, store function,
+    watermark field). Records are grouped into batches of at least PIPELINE_WRITE_BATCH_SIZE
+    (a page is never split, so a repository's records are stored together); per-repository
+    watermarks advance after each stored batch and the org-wide one only once the whole stream
+    is stored. A failing sink stops receiving batches while the others continue; if fetching
+    fails, the records already fetched are stored before the error is raised.
+    Returns the number of records stored per entity.
+    """
+    buffers = {entity: [] for entity, _, _ in sinks}
+    stored = {entity: 0 for entity, _, _ in sinks}
+    newest: Dict[str, Optional[datetime]] = {entity: None for entity, _, _ in sinks}
+    failures: Dict[str, Exception] = {}
+
+    def flush(entity: str, store, watermark_field: str) -> None:
+        batch, buffers[entity] = buffers[entity], []
+        if not batch or entity in failures:
+            return
+        try:
+            collect_log.debug("[%s] Storing batch of %d %s...", label, len(batch), entity)
+            store(batch)
+        except Exception as e:
+            logging.error(f"[{label}] Error storing {entity}: {type(e).__name__}: {str(e)}")
+            import traceback
+            logging.error(f"[{label}] Full traceback: {traceback.format_exc()}")
+            failures[entity] = e
+            return
+        batch_newest = advance_watermarks(entity, batch, watermark_field, org_wide=False)
+        if batch_newest and (newest[entity] is None or batch_newest > newest[entity]):
+            newest[entity] = batch_newest
+        stored[entity] += len(batch)
+        if on_batch:
+            on_batch(entity, batch)
+
+    stream = prefetch(pages, PIPELINE_QUEUE_DEPTH)
+    try:
+        for page in stream:
+            for entity, store, watermark_field in sinks:
+                if entity in failures:
+                    continue
+                buffers[entity].extend(page.get(entity, []))
+                if len(buffers[entity]) >= PIPELINE_WRITE_BATCH_SIZE:
+                    flush(entity, store, watermark_field)
+            if len(failures) == len(sinks):
+                break
+    except Exception:
+        logging.warning(f"[{label}] Fetching from GitHub failed; storing the records fetched so far")
+        for sink in sinks:
+            flush(*sink)
+        raise
+    finally:
+        stream.close()
+
+    for sink in sinks:
+        flush(*sink)
+
+    for entity, _, _ in sinks:
+        if entity not in failures and newest[entity]:
+            advance_org_watermark(entity, newest[entity])
+
+    if failures:
+        raise Exception(f"Failed to store: {', '.join(failures)}") from next(iter(failures.values()))
+    return stored
+
+
+TEAMS_QUERY = f"""
+query($org: String!, $cursor: String) {{{RATE_LIMIT_FIELDS}
+  organization(login: $org) {{
+    teams(first: 100, after: $cursor) {{
+      pageInfo {{
+        hasNextPage
+        endCursor
+      }}
+      nodes {{
+        name
+        slug
+        repositories(first: 100) {{
+          pageInfo {{
+            hasNextPage
+            endCursor
+          }}
+          nodes {{
+            nameWithOwner
+          }}
+        }}
+      }}
+    }}
+  }}
+}}
+"""
+
+TEAM_REPOSITORIES_QUERY = f"""
+query($org: String!, $slug: String!, $cursor: String) {{{RATE_LIMIT_FIELDS}
+  organization(login: $org) {{
+    team(slug: $slug) {{
+      repositories(first: 100, after: $cursor) {{
+        pageInfo {{
+          hasNextPage
+          endCursor
+        }}
+        nodes {{
+          nameWithOwner
+        }}
+      }}
+    }}
+  }}
+}}
+"""
+
+
+class TeamRepositoryMap:
+    """
+    Org-wide "owner/repo" -> "Team A, Team B" map, cached in memory for ttl_seconds
+    Built from organization.teams { repositories } in a handful of paginated GraphQL queries
+    (one per 100 teams, plus follow-up pages only for teams with more than 100 repositories),
+    replacing one REST call per repository.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._teams: Optional[Dict[str, str]] = None
+        self._loaded_at = 0.0
+
+    def refresh(self, github_token: str) -> Dict[str, str]:
+        """Rebuild the map from GitHub and cache it"""
+        started = time.monotonic()
+        repo_teams: Dict[str, List[str]] = {}
+        team_count = 0
+        cursor = None
+        has_next_page = True
+
+        while has_next_page:
+            teams = github_graphql(github_token, TEAMS_QUERY, {"org": GITHUB_ORG, "cursor": cursor})["organization"]["teams"]
+            for team in teams["nodes"]:
+                team_count += 1
+                repositories = team["repositories"]
+                names = [repo["nameWithOwner"] for repo in repositories["nodes"]]
+                while repositories["pageInfo"]["hasNextPage"]:
+                    repositories = github_graphql(github_token, TEAM_REPOSITORIES_QUERY, {
+                        "org": GITHUB_ORG, "slug": team["slug"], "cursor": repositories["pageInfo"]["endCursor"]
+                    })["organization"]["team"]["repositories"]
+                    names.extend(repo["nameWithOwner"] for repo in repositories["nodes"])
+                for name in names:
+                    repo_teams.setdefault(name, []).append(team["name"])
+
+            has_next_page = teams["pageInfo"]["hasNextPage"]
+            cursor = teams["pageInfo"]["endCursor"]
+
+        # repositories.team is NVARCHAR(255)
+        team_map = {repo: ', '.join(sorted(names))[:255] for repo, names in repo_teams.items()}
+        with self._lock:
+            self._teams = team_map
+            self._loaded_at = time.monotonic()
+        logging.info(f"[team_map] Mapped {len(team_map)} repositories to {team_count} teams in {time.monotonic() - started:.1f}s")
+        return team_map
+
+    def get(self, github_token: str) -> Dict[str, str]:
+        """The cached map, rebuilt first when older than ttl_seconds; a stale (or empty) map is served if GitHub fails"""
+        with self._lock:
+            teams = self._teams
+            fresh = teams is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+        if fresh:
+            return teams
+        try:
+            return self.refresh(github_token)
+        except Exception as e:
+            logging.warning(f"[team_map] Refresh failed, using {'stale' if teams is not None else 'empty'} team map: {type(e).__name__}: {str(e)}")
+            return teams or {}
+
+
+team_map = TeamRepositoryMap(TEAM_MAP_TTL_SECONDS)
+
+
+class SqlConnectionPool:
+    """
+    Shared Azure SQL connection management for the store functions
+    Caches the DefaultAzureCredential and the Entra ID access token until near expiry and
+    keeps a small pool of open pyodbc connections that warm workers reuse across invocations.
+    Idle connections are validated with SELECT 1 before checkout.
+    """
+
+    SQL_COPT_SS_ACCESS_TOKEN = 1256  # pyodbc pre-connect attribute for Entra ID access tokens
+    TOKEN_SCOPE = "https://database.windows.net/.default"
+
+    def __init__(self, server: Optional[str], database: Optional[str], max_size: int = 4,
+                 token_refresh_margin_seconds: int = 300):
+        self.server = server
+        self.database = database
+        self.max_size = max_size
+        self.token_refresh_margin_seconds = token_refresh_margin_seconds
+        self._credential = None
+        self._access_token = None
+        self._token_struct: Optional[bytes] = None
+        self._idle: List[Tuple[Any, float]] = []  # (connection, token expires_on) pairs
+        self._checked_out: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._drivers_logged = False
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "connects": 0,
+            "connect_ms_total": 0.0,
+            "connect_ms_max": 0.0,
+            "validation_failures": 0,
+            "discarded": 0
+        }
+
+    @property
+    def connection_string(self) -> str:
+        return f"Driver={{ODBC Driver 18 for SQL Server}};Server=tcp:{self.server},1433;Database={self.database};Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30"
+
+    def _get_token_struct(self) -> Tuple[bytes, float]:
+        """Return the packed access token, fetching a new one only when near expiry"""
+        with self._lock:
+            if self._access_token is None or self._access_token.expires_on - time.time() <= self.token_refresh_margin_seconds:
+                if self._credential is None:
+                    self._credential = DefaultAzureCredential()
+                logging.info("[sql_pool] Getting access token for SQL Database...")
+                self._access_token = self._credential.get_token(self.TOKEN_SCOPE)
+                # Encode the token with length prefix using struct
+                # This is required for Azure SQL token-based authentication
+                token_bytes = self._access_token.token.encode('utf-16-le')
+                self._token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
+                logging.info("[sql_pool] Access token acquired successfully")
+            return self._token_struct, self._access_token.expires_on
+
+    def _connect(self) -> Tuple[Any, float]:
+        if not self._drivers_logged:
+            try:
+                logging.info(f"[sql_pool] Available ODBC drivers: {pyodbc.drivers()}")
+            except Exception as driver_error:
+                logging.warning(f"[sql_pool] Could not list ODBC drivers: {driver_error}")
+            self._drivers_logged = True
+
+        token_struct, expires_on = self._get_token_struct()
+        logging.info(f"[sql_pool] Connecting to SQL Server: {self.server}, Database: {self.database}")
+        started = time.perf_counter()
+        try:
+            conn = pyodbc.connect(self.connection_string, attrs_before={self.SQL_COPT_SS_ACCESS_TOKEN: token_struct})
+        except pyodbc.Error as pyo_err:
+            logging.error(f"[sql_pool] pyodbc.Error: {pyo_err}")
+            for arg in pyo_err.args:
+                logging.error(f"[sql_pool] Error arg: {arg}")
+            raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.stats["connects"] += 1
+            self.stats["connect_ms_total"] += elapsed_ms
+            self.stats["connect_ms_max"] = max(self.stats["connect_ms_max"], elapsed_ms)
+        logging.info(f"[sql_pool] Database connection established in {elapsed_ms:.0f} ms")
+        return conn, expires_on
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception as e:
+            logging.warning(f"[sql_pool] Pooled connection failed validation: {type(e).__name__}: {str(e)}")
+            return False
+
+    def _close_quietly(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @timed_stage("sql.connect")
+    def acquire(self):
+        """Check out a healthy connection, reusing an idle one when possible"""
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                break
+            conn, expires_on = entry
+            # Connections authenticated with an expiring token are retired with it
+            if expires_on - time.time() <= self.token_refresh_margin_seconds:
+                self._close_quietly(conn)
+                with self._lock:
+                    self.stats["discarded"] += 1
+                continue
+            if self._is_healthy(conn):
+                with self._lock:
+                    self.stats["hits"] += 1
+                    self._checked_out[id(conn)] = expires_on
+                return conn
+            self._close_quietly(conn)
+            with self._lock:
+                self.stats["validation_failures"] += 1
+                self.stats["discarded"] += 1
+
+        conn, expires_on = self._connect()
+        with self._lock:
+            self.stats["misses"] += 1
+            self._checked_out[id(conn)] = expires_on
+        return conn
+
+    def release(self, conn) -> None:
+        """Return a connection to the pool (or close it when the pool is full)"""
+        with self._lock:
+            expires_on = self._checked_out.pop(id(conn), None)
+            if expires_on is not None and len(self._idle) < self.max_size:
+                self._idle.append((conn, expires_on))
+                return
+        self._close_quietly(conn)
+
+    def discard(self, conn) -> None:
+        """Close a connection that is in an unknown state instead of pooling it"""
+        with self._lock:
+            self._checked_out.pop(id(conn), None)
+            self.stats["discarded"] += 1
+        self._close_quietly(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = len(self._checked_out)
+        stats["connect_ms_avg"] = round(stats["connect_ms_total"] / stats["connects"], 1) if stats["connects"] else 0.0
+        stats["connect_ms_total"] = round(stats["connect_ms_total"], 1)
+        stats["connect_ms_max"] = round(stats["connect_ms_max"], 1)
+        return stats
+
+
+sql_pool = SqlConnectionPool(
+    SQL_SERVER,
+    SQL_DATABASE,
+    max_size=SQL_POOL_SIZE,
+    token_refresh_margin_seconds=SQL_TOKEN_REFRESH_MARGIN_SECONDS
+)
+
+
+def parse_github_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Convert a GitHub ISO 8601 timestamp (e.g. 2024-05-01T12:00:00Z) to a naive UTC datetime for DATETIME2 columns"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def dedupe_rows(rows: List[tuple], key_columns: int) -> List[tuple]:
+    """
+    Keep the last row per key (the first key_columns values of each row)
+    A set-based MERGE fails if the source contains the same key twice
+    """
+    unique = {}
+    for row in rows:
+        unique[row[:key_columns]] = row
+    return list(unique.values())
+
+
+def create_temp_table(cursor, table: str, columns: List[Tuple[str, str]]) -> None:
+    """(Re)create a session #temp table"""
+    # Pooled connections keep their session, so a previous run's temp table may still exist
+    drop_temp_table(cursor, table)
+    cursor.execute(f"CREATE TABLE {table} ({', '.join(f'{name} {sql_type}' for name, sql_type in columns)})")
+
+
+def drop_temp_table(cursor, table: str) -> None:
+    cursor.execute(f"IF OBJECT_ID('tempdb..{table}') IS NOT NULL DROP TABLE {table}")
+
+
+@timed_stage("sql.merge")
+def bulk_merge(cursor, label: str, staging_table: str, staging_columns: List[Tuple[str, str]],
+               rows: List[tuple], merge_query: str, batch_size: Optional[int] = None) -> List[int]:
+    """
+    Bulk upsert rows through a session temp table
+    Each batch is sent in one round trip with fast_executemany into staging_table and then
+    applied to the target with a single set-based merge_query (which reads from staging_table).
+    Returns the number of rows affected by each batch's MERGE.
+    """
+    batch_size = batch_size or SQL_BULK_BATCH_SIZE
+    column_names = ", ".join(name for name, _ in staging_columns)
+    placeholders = ", ".join("?" for _ in staging_columns)
+
+    create_temp_table(cursor, staging_table, staging_columns)
+    cursor.fast_executemany = True
+
+    batch_counts = []
+    try:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(f"TRUNCATE TABLE {staging_table}")
+            cursor.executemany(f"INSERT INTO {staging_table} ({column_names}) VALUES ({placeholders})", batch)
+            cursor.execute(merge_query)
+            affected = cursor.rowcount
+            batch_counts.append(affected)
+    finally:
+        cursor.fast_executemany = False
+        drop_temp_table(cursor, staging_table)
+
+    log_event(sql_log, logging.DEBUG, f"[{label}] bulk_merge", table=staging_table, staged=len(rows), batches=len(batch_counts), merged=sum(batch_counts))
+    return batch_counts
+
+
+ORG_WATERMARK_KEY = "*"  # Watermark row tracking the newest item seen across the whole org
+
+
+def org_watermark_keys() -> List[str]:
+    """
+    Org-wide watermark rows for this run: "*", or one per held partition when sharding ("*0", "*7", ...)
+    Each instance only sees its own partitions, so a single org-wide row would let one instance
+    move the threshold past items another instance has not collected yet.
+    """
+    if not SHARDING_ENABLED:
+        return [ORG_WATERMARK_KEY]
+    return [f"{ORG_WATERMARK_KEY}{partition}" for partition in sorted(shard_coordinator.owned)]
+
+
+def org_watermark(watermarks: Dict[str, datetime]) -> Optional[datetime]:
+    """Oldest of the org_watermark_keys() values (None if any is missing)"""
+    values = [watermarks.get(key) for key in org_watermark_keys()]
+    if not values or any(value is None for value in values):
+        return None
+    return min(values)
+
+
+class LocalWatermarkStore:
+    """
+    Watermark store backed by a JSON file on local disk
+    Useful for local runs and single-instance deployments without the collection_watermarks table.
+    Layout: {entity_type: {repository: ISO 8601 timestamp}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, str]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, entity_type: str) -> Dict[str, datetime]:
+        with self._lock:
+            data = self._read().get(entity_type, {})
+        return {repo: datetime.fromisoformat(value) for repo, value in data.items()}
+
+    def advance(self, entity_type: str, newest: Dict[str, datetime]) -> None:
+        with self._lock:
+            data = self._read()
+            current = data.setdefault(entity_type, {})
+            for repo, watermark in newest.items():
+                if repo not in current or datetime.fromisoformat(current[repo]) < watermark:
+                    current[repo] = watermark.isoformat()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+
+class SqlWatermarkStore:
+    """Watermark store backed by the collection_watermarks table (shared by all instances)"""
+
+    def __init__(self, pool: SqlConnectionPool):
+        self.pool = pool
+
+    def load(self, entity_type: str) -> Dict[str, datetime]:
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT repository, watermark_at FROM collection_watermarks WHERE entity_type = ?", entity_type)
+            rows = cursor.fetchall()
+            cursor.close()
+        except Exception:
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+        return {row[0]: row[1].replace(tzinfo=timezone.utc) for row in rows}
+
+    def advance(self, entity_type: str, newest: Dict[str, datetime]) -> None:
+        merge_query = """
+        MERGE INTO collection_watermarks WITH (HOLDLOCK) AS target
+        USING #stg_watermarks AS source
+        ON target.repository = source.repository AND target.entity_type = source.entity_type
+        WHEN MATCHED AND source.watermark_at > target.watermark_at THEN
+            UPDATE SET watermark_at = source.watermark_at, updated_at = GETUTCDATE()
+        WHEN NOT MATCHED THEN
+            INSERT (repository, entity_type, watermark_at, updated_at)
+            VALUES (source.repository, source.entity_type, source.watermark_at, GETUTCDATE());
+        """
+        rows = [
+            (repo, entity_type, watermark.astimezone(timezone.utc).replace(tzinfo=None))
+            for repo, watermark in newest.items()
+        ]
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            bulk_merge(cursor, "watermarks", "#stg_watermarks", [
+                ("repository", "NVARCHAR(255) NOT NULL"),
+                ("entity_type", "NVARCHAR(50) NOT NULL"),
+                ("watermark_at", "DATETIME2 NOT NULL")
+            ], rows, merge_query)
+            conn.commit()
+            cursor.close()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+
+
+_watermark_store = None
+
+
+def get_watermark_store():
+    """Return the configured watermark store (None when WATERMARK_STORE=none)"""
+    global _watermark_store
+    if _watermark_store is None:
+        if WATERMARK_STORE == "sql":
+            _watermark_store = SqlWatermarkStore(sql_pool)
+        elif WATERMARK_STORE == "local":
+            _watermark_store = LocalWatermarkStore(WATERMARK_LOCAL_PATH)
+        elif WATERMARK_STORE != "none":
+            raise ValueError(f"Unknown WATERMARK_STORE '{WATERMARK_STORE}' (expected sql, local or none)")
+    return _watermark_store
+
+
+@timed_stage("watermarks")
+def load_watermarks(entity_type: str) -> Dict[str, datetime]:
+    """
+    Load per-repository watermarks for an entity type
+    Falls back to an empty map (full lookback window) if the store is disabled or unavailable
+    """
+    store = get_watermark_store()
+    if store is None:
+        return {}
+    try:
+        watermarks = store.load(entity_type)
+        watermark_log.info("[watermarks] Loaded %d %s watermarks", len(watermarks), entity_type)
+        return watermarks
+    except Exception as e:
+        watermark_log.warning("[watermarks] Could not load %s watermarks, scanning full lookback window: %s: %s", entity_type, type(e).__name__, e)
+        return {}
+
+
+def watermark_threshold(watermarks: Optional[Dict[str, datetime]], repository: str, lookback_hours: int) -> datetime:
+    """
+    Oldest timestamp still worth processing for a repository
+    The repository's watermark minus WATERMARK_OVERLAP_MINUTES; repositories without a watermark
+    fall back to the org-wide watermark and then to the fixed lookback window.
+    """
+    watermark = None
+    if watermarks:
+        if repository != ORG_WATERMARK_KEY:
+            watermark = watermarks.get(repository)
+        watermark = watermark or org_watermark(watermarks)
+    if watermark is None:
+        return datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
+    return watermark - timedelta(minutes=WATERMARK_OVERLAP_MINUTES)
+
+
+@timed_stage("watermarks")
+def advance_watermarks(entity_type: str, records: List[Dict[str, Any]], field: str, org_wide: bool = True) -> Optional[datetime]:
+    """
+    Record the newest `field` timestamp per repository (and org-wide) after a successful store
+    Watermarks only move forward; a failure here is logged and the next run re-reads the overlap.
+    With org_wide=False only the repositories in `records` move (for partial batches of a run);
+    the newest timestamp is returned for advance_org_watermark.
+    """
+    store = get_watermark_store()
+    if store is None or not records:
+        return None
+    newest: Dict[str, datetime] = {}
+    for record in records:
+        value = record.get(field)
+        if not value:
+            continue
+        timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        repo = record["repository"]
+        if repo not in newest or newest[repo] < timestamp:
+            newest[repo] = timestamp
+    if not newest:
+        return None
+    newest_overall = max(newest.values())
+    repositories_count = len(newest)
+    if org_wide:
+        for key in org_watermark_keys():
+            newest[key] = newest_overall
+    try:
+        store.advance(entity_type, newest)
+        watermark_log.debug("[watermarks] Advanced %s watermarks for %d repositories", entity_type, repositories_count)
+    except Exception as e:
+        watermark_log.warning("[watermarks] Could not advance %s watermarks: %s: %s", entity_type, type(e).__name__, e)
+    return newest_overall
+
+
+@timed_stage("watermarks")
+def advance_org_watermark(entity_type: str, timestamp: datetime) -> None:
+    """Move the org-wide watermark once every batch of a run has been stored"""
+    store = get_watermark_store()
+    if store is None:
+        return
+    try:
+        store.advance(entity_type, {key: timestamp for key in org_watermark_keys()})
+    except Exception as e:
+        watermark_log.warning("[watermarks] Could not advance %s org watermark: %s: %s", entity_type, type(e).__name__, e)
+
+
+def jump_consistent_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach): growing buckets from n to n+1 moves only 1/(n+1) of the keys"""
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return bucket
+
+
+def repository_partition(repository_id: str) -> int:
+    """Partition of a repository, from its GraphQL node ID (stable across renames and transfers)"""
+    digest = hashlib.sha1(repository_id.encode("utf-8")).digest()
+    return jump_consistent_hash(int.from_bytes(digest[:8], "big"), SHARD_PARTITIONS)
+
+
+class LocalLeaseStore:
+    """
+    Lease store in a JSON file, for several collector processes on one host
+    Layout: {lease_key: {"owner": instance id, "expires_at": epoch seconds}}. Updates hold an
+    exclusive flock on the file, so claims are atomic across processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _update(self, fn):
+        """Apply fn to the lease map under the process and file locks, persisting the result"""
+        import fcntl
+        with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                leases = {}
+                if os.path.exists(self.path):
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        leases = json.load(f)
+                result = fn(leases, time.time())
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(leases, f)
+                os.replace(tmp_path, self.path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def claim(self, lease_key: str, owner: str, seconds: int) -> bool:
+        def claim_lease(leases, now):
+            current = leases.get(lease_key)
+            if current and current["owner"] != owner and current["expires_at"] > now:
+                return False
+            leases[lease_key] = {"owner": owner, "expires_at": now + seconds}
+            return True
+        return self._update(claim_lease)
+
+    def release(self, lease_key: str, owner: str) -> None:
+        def release_lease(leases, now):
+            if leases.get(lease_key, {}).get("owner") == owner:
+                del leases[lease_key]
+        self._update(release_lease)
+
+    def live_leases(self) -> Dict[str, str]:
+        def live(leases, now):
+            for key in [key for key, lease in leases.items() if lease["expires_at"] <= now]:
+                del leases[key]
+            return {key: lease["owner"] for key, lease in leases.items()}
+        return self._update(live)
+
+
+class SqlLeaseStore:
+    """Lease store in the collector_leases table; expiry uses the database clock, so instance clock skew does not matter"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _execute(self, query: str, params: tuple, fetch: bool = False):
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            result = cursor.fetchall() if fetch else cursor.rowcount
+            conn.commit()
+            cursor.close()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+        return result
+
+    def claim(self, lease_key: str, owner: str, seconds: int) -> bool:
+        return self._execute("""
+            MERGE INTO collector_leases WITH (HOLDLOCK) AS target
+            USING (SELECT ? as lease_key) AS source
+            ON target.lease_key = source.lease_key
+            WHEN MATCHED AND (target.owner = ? OR target.expires_at <= GETUTCDATE()) THEN
+                UPDATE SET owner = ?, expires_at = DATEADD(SECOND, ?, GETUTCDATE()), renewed_at = GETUTCDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (lease_key, owner, expires_at, renewed_at)
+                VALUES (source.lease_key, ?, DATEADD(SECOND, ?, GETUTCDATE()), GETUTCDATE());
+        """, (lease_key, owner, owner, seconds, owner, seconds)) == 1
+
+    def release(self, lease_key: str, owner: str) -> None:
+        self._execute("DELETE FROM collector_leases WHERE lease_key = ? AND owner = ?", (lease_key, owner))
+
+    def live_leases(self) -> Dict[str, str]:
+        rows = self._execute("SELECT lease_key, owner FROM collector_leases WHERE expires_at > GETUTCDATE()", (), fetch=True)
+        return {row[0]: row[1] for row in rows}
+
+
+class ShardCoordinator:
+    """
+    Splits the org's repositories into consistent-hash partitions shared out through expiring leases
+    On every collection run an instance renews its membership lease, works out its share of the
+    partitions from the live members (partitions // members, plus one for the first
+    partitions % members members by id), releases any surplus, renews the partitions it keeps
+    and claims free or expired ones up to its share. Claims are atomic in the lease store, so a
+    partition is never held by two instances. When an instance joins, the others hand over their
+    surplus on their next run; when one leaves, its leases expire and the survivors claim them.
+    Partitions that are briefly unheld are caught up through their watermarks.
+    """
+
+    MEMBER_PREFIX = "member:"
+    PARTITION_PREFIX = "partition:"
+
+    def __init__(self, store, instance_id: str, partitions: int, lease_seconds: int):
+        self.store = store
+        self.instance_id = instance_id
+        self.partitions = partitions
+        self.lease_seconds = lease_seconds
+        self.owned: set = set()
+        self._lock = threading.Lock()
+        self.stats = {"rebalances": 0, "claimed": 0, "released": 0, "lost": 0, "members": 0}
+
+    def target_share(self, members: List[str]) -> int:
+        """Partitions this instance should hold among the sorted live members"""
+        rank = members.index(self.instance_id)
+        return self.partitions // len(members) + (1 if rank < self.partitions % len(members) else 0)
+
+    def rebalance(self) -> set:
+        """Renew, claim and release partition leases; returns the partitions held for this run"""
+        with self._lock:
+            self.store.claim(f"{self.MEMBER_PREFIX}{self.instance_id}", self.instance_id, self.lease_seconds)
+            leases = self.store.live_leases()
+            members = sorted({key[len(self.MEMBER_PREFIX):] for key in leases if key.startswith(self.MEMBER_PREFIX)} | {self.instance_id})
+            holders = {
+                int(key[len(self.PARTITION_PREFIX):]): owner
+                for key, owner in leases.items() if key.startswith(self.PARTITION_PREFIX)
+            }
+            target = self.target_share(members)
+
+            mine = sorted(partition for partition, owner in holders.items() if owner == self.instance_id and partition < self.partitions)
+            for partition in mine[target:]:
+                self.store.release(f"{self.PARTITION_PREFIX}{partition}", self.instance_id)
+                self.stats["released"] += 1
+            owned = set()
+            for partition in mine[:target]:
+                if self.store.claim(f"{self.PARTITION_PREFIX}{partition}", self.instance_id, self.lease_seconds):
+                    owned.add(partition)
+                else:
+                    self.stats["lost"] += 1
+            for partition in range(self.partitions):
+                if len(owned) >= target:
+                    break
+                if partition in holders or partition in owned:
+                    continue
+                if self.store.claim(f"{self.PARTITION_PREFIX}{partition}", self.instance_id, self.lease_seconds):
+                    owned.add(partition)
+                    self.stats["claimed"] += 1
+
+            self.owned = owned
+            self.stats["rebalances"] += 1
+            self.stats["members"] = len(members)
+            logging.info(f"[shards] {self.instance_id} holds {len(owned)}/{self.partitions} partitions "
+                         f"(share {target}, {len(members)} live instances): {sorted(owned)}")
+            return set(owned)
+
+    def owns(self, repository_id: str) -> bool:
+        return repository_partition(repository_id) in self.owned
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["instance_id"] = self.instance_id
+            stats["owned"] = sorted(self.owned)
+        return stats
+
+
+def get_lease_store():
+    """Return the lease store configured by SHARD_LEASE_STORE"""
+    if SHARD_LEASE_STORE == "sql":
+        return SqlLeaseStore(sql_pool)
+    if SHARD_LEASE_STORE == "local":
+        return LocalLeaseStore(SHARD_LEASE_PATH)
+    raise ValueError(f"Unknown SHARD_LEASE_STORE '{SHARD_LEASE_STORE}' (expected sql or local)")
+
+
+shard_coordinator = ShardCoordinator(get_lease_store(), SHARD_INSTANCE_ID, SHARD_PARTITIONS, SHARD_LEASE_SECONDS) if SHARDING_ENABLED else None
+
+
+def claim_collection_shards(label: str) -> bool:
+    """
+    Rebalance this instance's partitions before a collection run (no-op without SHARDING_ENABLED)
+    Returns False when the instance holds no partition this time, so the run has nothing to do.
+    """
+    if not SHARDING_ENABLED:
+        return True
+    owned = shard_coordinator.rebalance()
+    if not owned:
+        logging.info(f"[{label}] Skipped - {SHARD_INSTANCE_ID} holds no repository partitions this run")
+        return False
+    return True
+
+
+class LocalBackfillCheckpointStore:
+    """
+    Backfill checkpoints in a JSON file on local disk (local runs and the CLI)
+    Layout: {backfill_id: {"<entity>|<repository>": {"cursor", "items", "done"}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, backfill_id: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        with self._lock:
+            data = self._read().get(backfill_id, {})
+        return {tuple(key.split("|", 1)): value for key, value in data.items()}
+
+    def save(self, backfill_id: str, entity_type: str, repository: str, cursor: Optional[str], items: int, done: bool) -> None:
+        with self._lock:
+            data = self._read()
+            checkpoints = data.setdefault(backfill_id, {})
+            previous = checkpoints.get(f"{entity_type}|{repository}", {})
+            checkpoints[f"{entity_type}|{repository}"] = {"cursor": cursor, "items": previous.get("items", 0) + items, "done": done}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+
+class SqlBackfillCheckpointStore:
+    """Backfill checkpoints in the backfill_checkpoints table (survive instance recycling)"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def load(self, backfill_id: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT entity_type, repository, page_cursor, items_stored, completed
+                FROM backfill_checkpoints WHERE backfill_id = ?
+            """, backfill_id)
+            rows = cursor.fetchall()
+            cursor.close()
+        except Exception:
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+        return {(row[0], row[1]): {"cursor": row[2], "items": row[3], "done": bool(row[4])} for row in rows}
+
+    def save(self, backfill_id: str, entity_type: str, repository: str, cursor: Optional[str], items: int, done: bool) -> None:
+        conn = self.pool.acquire()
+        try:
+            sql_cursor = conn.cursor()
+            sql_cursor.execute("""
+                MERGE INTO backfill_checkpoints WITH (HOLDLOCK) AS target
+                USING (SELECT ? as backfill_id, ? as entity_type, ? as repository) AS source
+                ON target.backfill_id = source.backfill_id AND target.entity_type = source.entity_type
+                    AND target.repository = source.repository
+                WHEN MATCHED THEN
+                    UPDATE SET page_cursor = ?, items_stored = target.items_stored + ?, completed = ?, updated_at = GETUTCDATE()
+                WHEN NOT MATCHED THEN
+                    INSERT (backfill_id, entity_type, repository, page_cursor, items_stored, completed, updated_at)
+                    VALUES (source.backfill_id, source.entity_type, source.repository, ?, ?, ?, GETUTCDATE());
+            """, (backfill_id, entity_type, repository, cursor, items, done, cursor, items, done))
+            conn.commit()
+            sql_cursor.close()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+
+
+_backfill_checkpoint_store = None
+
+
+def get_backfill_checkpoint_store():
+    """Return the configured backfill checkpoint store"""
+    global _backfill_checkpoint_store
+    if _backfill_checkpoint_store is None:
+        if BACKFILL_CHECKPOINT_STORE == "sql":
+            _backfill_checkpoint_store = SqlBackfillCheckpointStore(sql_pool)
+        elif BACKFILL_CHECKPOINT_STORE == "local":
+            _backfill_checkpoint_store = LocalBackfillCheckpointStore(BACKFILL_CHECKPOINT_PATH)
+        else:
+            raise ValueError(f"Unknown BACKFILL_CHECKPOINT_STORE '{BACKFILL_CHECKPOINT_STORE}' (expected sql or local)")
+    return _backfill_checkpoint_store
+
+
+BACKFILL_REPOSITORIES_QUERY = f"""
+query($org: String!, $cursor: String) {{{RATE_LIMIT_FIELDS}
+  organization(login: $org) {{
+    repositories({repository_list_arguments()}) {{
+      pageInfo {{
+        hasNextPage
+        endCursor
+      }}
+      nodes {{
+        name
+        {REPOSITORY_ACTIVITY_FIELD}
+        owner {{
+          login
+        }}
+      }}
+    }}
+  }}
+}}
+"""
+
+# entity type -> (parser, record field bounded by the backfill's end date)
+BACKFILL_PARSERS = {
+    "deployments": (parse_repo_deployments, "created_at"),
+    "pull_requests": (parse_repo_pull_requests, "merged_at"),
+    "incidents": (parse_repo_incidents, "created_at")
+}
+
+
+class BackfillProgress:
+    """Thread-safe page/item counters for a backfill run, logging throughput every BACKFILL_PROGRESS_INTERVAL_SECONDS"""
+
+    def __init__(self, backfill_id: str, repositories: int):
+        self.backfill_id = backfill_id
+        self.repositories = repositories
+        self.started = time.monotonic()
+        self._last_logged = self.started
+        self._lock = threading.Lock()
+        self.items = {entity: 0 for entity in COLLECTION_ENTITIES}
+        self.pages = 0
+        self.repositories_done = 0
+
+    def record_page(self, entity: str, items: int) -> None:
+        with self._lock:
+            self.items[entity] += items
+            self.pages += 1
+            now = time.monotonic()
+            if now - self._last_logged < BACKFILL_PROGRESS_INTERVAL_SECONDS:
+                return
+            self._last_logged = now
+        summary = self.summary()
+        logging.info(f"[BACKFILL] {self.backfill_id}: {sum(summary['items'].values())} items in {summary['pages']} pages "
+                     f"({summary['items_per_second']} items/s), {summary['repositories_done']}/{self.repositories} repositories done")
+
+    def record_repository(self) -> None:
+        with self._lock:
+            self.repositories_done += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            items = dict(self.items)
+            return {
+                "items": items,
+                "pages": self.pages,
+                "repositories": self.repositories,
+                "repositories_done": self.repositories_done,
+                "elapsed_seconds": round(elapsed, 1),
+                "items_per_second": round(sum(items.values()) / elapsed, 1) if elapsed > 0 else 0.0
+            }
+
+
+def backfill_repository(github_token: str, backfill_id: str, repository: Dict[str, Any], entities: List[str],
+                        start: datetime, end: datetime, checkpoints: Dict[Tuple[str, str], Dict[str, Any]],
+                        progress: BackfillProgress, deadline: Optional[float]) -> bool:
+    """
+    Walk one repository's history for each entity from the newest page back to start
+    Every page is stored through the normal store functions and checkpointed right after, so a
+    crash or timeout replays at most one page (the MERGEs are idempotent). A repository deleted or
+    renamed since enumeration is logged and checkpointed as done. Returns False if the deadline
+    stopped it before the repository was finished.
+    """
+    owner, name = repository["owner"]["login"], repository["name"]
+    full_name = f"{owner}/{name}"
+    store = get_backfill_checkpoint_store()
+    stores = {
+        "deployments": lambda records: store_deployments(records, github_token),
+        "pull_requests": store_pull_requests,
+        "incidents": store_incidents
+    }
+
+    for entity in entities:
+        checkpoint = checkpoints.get((entity, full_name), {})
+        if checkpoint.get("done"):
+            continue
+        _, alias, order_field, _ = INNER_CONNECTIONS[entity]
+        parser, end_field = BACKFILL_PARSERS[entity]
+        query = build_inner_page_query(entity)
+        cursor = checkpoint.get("cursor")
+
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            variables = {"owner": owner, "name": name, "cursor": cursor}
+            if entity == "incidents":
+                variables["since"] = start.strftime("%Y-%m-%dT%H:%M:%SZ")
+            try:
+                node = github_graphql(github_token, query, variables)["repository"]
+            except GitHubNotFoundError as e:
+                logging.warning(f"[BACKFILL] {backfill_id}: skipping {full_name}, deleted or renamed since enumeration: {str(e)}")
+                node = None
+            if node is None:
+                store.save(backfill_id, entity, full_name, cursor, 0, True)
+                break
+            connection = node[alias]
+            records = [
+                record for record in parser({"name": name, "owner": {"login": owner}, alias: connection}, start)
+                if parse_github_datetime(record[end_field]) < end.replace(tzinfo=None)
+            ]
+            if records:
+                stores[entity](records)
+            done = not connection_needs_more(connection, order_field, start)
+            cursor = connection["pageInfo"]["endCursor"] or cursor
+            store.save(backfill_id, entity, full_name, cursor, len(records), done)
+            progress.record_page(entity, len(records))
+            if done:
+                break
+
+    progress.record_repository()
+    return True
+
+
+def run_backfill(start: datetime, end: datetime, entities: Optional[List[str]] = None,
+                 repositories: Optional[List[str]] = None, max_runtime_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Backfill deployments, merged PRs and incidents for [start, end) across the org (or the given repositories)
+    Repositories are processed BACKFILL_CONCURRENCY at a time; all GitHub calls go through the
+    shared rate-limit governor. The backfill id is derived from the parameters, so calling again
+    with the same range resumes from the stored checkpoints. Watermarks are not touched.
+    Returns the progress summary with "complete" telling whether another call is needed.
+    """
+    if not GITHUB_ORG:
+        raise ValueError("GITHUB_ORG_NAME must be set")
+    entities = [entity for entity in COLLECTION_ENTITIES if entity in (entities or COLLECTION_ENTITIES)]
+    start = start.astimezone(timezone.utc)
+    end = end.astimezone(timezone.utc)
+    backfill_id = f"{start:%Y%m%d}-{end:%Y%m%d}:{','.join(entities)}" + (f":{','.join(sorted(repositories))}" if repositories else "")
+    deadline = time.monotonic() + max_runtime_seconds if max_runtime_seconds else None
+
+    github_token = get_github_app_token()
+    checkpoints = get_backfill_checkpoint_store().load(backfill_id)
+
+    if repositories:
+        repos = [{"owner": {"login": full_name.split("/", 1)[0]}, "name": full_name.split("/", 1)[1]} for full_name in repositories]
+    else:
+        repos = list(itertools.chain.from_iterable(iter_repository_pages(github_token, BACKFILL_REPOSITORIES_QUERY, {})))
+
+    # Nothing can be deployed or merged after a repository's last push (plus the usual grace)
+    push_cutoff = start - timedelta(hours=DORMANT_REPO_GRACE_HOURS)
+    tasks = []
+    for repo in repos:
+        repo_entities = entities
+        if SKIP_DORMANT_REPOS and REPOSITORY_ACTIVITY_FIELD in repo and not repository_is_active(repo, push_cutoff):
+            repo_entities = [entity for entity in entities if entity not in PUSH_DRIVEN_ENTITIES]
+        if repo_entities:
+            tasks.append((repo, repo_entities))
+
+    progress = BackfillProgress(backfill_id, len(tasks))
+    logging.info(f"[BACKFILL] {backfill_id}: {len(tasks)} repositories, {len(checkpoints)} checkpoints, concurrency {BACKFILL_CONCURRENCY}")
+
+    finished = list(map_concurrently(
+        lambda task: backfill_repository(github_token, backfill_id, task[0], task[1], start, end, checkpoints, progress, deadline),
+        tasks,
+        BACKFILL_CONCURRENCY
+    ))
+
+    summary = progress.summary()
+    summary.update({"backfill_id": backfill_id, "from": start.isoformat(), "to": end.isoformat(), "complete": all(finished)})
+    logging.info(f"[BACKFILL] {backfill_id}: {'complete' if summary['complete'] else 'stopped at the deadline, call again to resume'} - {summary}")
+    return summary
+
+
+DEPLOYMENT_CHANGES_TABLE = "#deployment_changes"
+DEPLOYMENT_CHANGES_COLUMNS = [
+    ("change_action", "NVARCHAR(10) NOT NULL"),
+    ("deployment_date", "DATE NOT NULL"),
+    ("repository", "NVARCHAR(255) NOT NULL"),
+    ("environment", "NVARCHAR(50) NOT NULL"),
+    ("old_status", "NVARCHAR(50)"),
+    ("new_status", "NVARCHAR(50)"),
+    ("commit_sha", "NVARCHAR(40) NOT NULL"),
+    ("created_at", "DATETIME2 NOT NULL")
+]
+INCIDENT_CHANGES_TABLE = "#incident_changes"
+INCIDENT_CHANGES_COLUMNS = [
+    ("repository", "NVARCHAR(255) NOT NULL"),
+    ("issue_number", "INT NOT NULL"),
+    ("old_product", "NVARCHAR(255)"),
+    ("old_state", "NVARCHAR(50)"),
+    ("old_closed_at", "DATETIME2"),
+    ("new_product", "NVARCHAR(255)"),
+    ("new_state", "NVARCHAR(50)"),
+    ("new_closed_at", "DATETIME2")
+]
+UNSPECIFIED_PRODUCT = "(unspecified)"  # incident_restore_daily.product for incidents without a "Product Affected" field
+PULL_REQUEST_CHANGES_TABLE = "#pull_request_changes"
+PULL_REQUEST_CHANGES_COLUMNS = [
+    ("repository", "NVARCHAR(255) NOT NULL"),
+    ("merge_commit_sha", "NVARCHAR(40) NOT NULL")
+]
+
+
+@timed_stage("sql.daily_metrics")
+def update_daily_metrics(cursor) -> int:
+    """
+    Apply the deployment changes captured in #deployment_changes to deployment_metrics_daily
+    Only the (date, repository, environment) keys touched by the current write are visited,
+    and each gets a delta: +1 total per inserted deployment, and success/failure counts moved
+    by status transitions, whatever the deployment's age. Runs in the caller's transaction,
+    so the aggregate commits together with the rows it describes. Returns the rows merged.
+    """
+    try:
+        merge_query = f"""
+        MERGE INTO deployment_metrics_daily WITH (HOLDLOCK) AS target
+        USING (
+            SELECT 
+                deployment_date,
+                repository,
+                environment,
+                SUM(CASE WHEN change_action = 'INSERT' THEN 1 ELSE 0 END) as total_delta,
+                SUM(CASE WHEN new_status = 'SUCCESS' THEN 1 ELSE 0 END)
+                    - SUM(CASE WHEN old_status = 'SUCCESS' THEN 1 ELSE 0 END) as successful_delta,
+                SUM(CASE WHEN new_status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END)
+                    - SUM(CASE WHEN old_status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END) as failed_delta
+            FROM {DEPLOYMENT_CHANGES_TABLE}
+            GROUP BY deployment_date, repository, environment
+        ) AS source
+        ON target.date = source.deployment_date 
+            AND target.repository = source.repository 
+            AND target.environment = source.environment
+        WHEN MATCHED THEN
+            UPDATE SET 
+                total_deployments = target.total_deployments + source.total_delta,
+                successful_deployments = target.successful_deployments + source.successful_delta,
+                failed_deployments = target.failed_deployments + source.failed_delta,
+                calculated_at = GETUTCDATE()
+        WHEN NOT MATCHED THEN
+            INSERT (date, repository, environment, total_deployments, successful_deployments, failed_deployments, calculated_at)
+            VALUES (source.deployment_date, source.repository, source.environment, 
+                    source.total_delta, source.successful_delta, source.failed_delta, GETUTCDATE());
+        """
+        
+        cursor.execute(merge_query)
+        metrics_count = cursor.rowcount
+        sql_log.debug("[update_daily_metrics] Applied deltas to %d daily metric records", metrics_count)
+        return metrics_count
+        
+    except Exception as e:
+        sql_log.error("[update_daily_metrics] Error updating metrics: %s: %s", type(e).__name__, e)
+        raise
+
+
+@timed_stage("sql.lead_time_facts")
+def update_lead_time_facts(cursor, changed_commits_query: str, params: tuple = ()) -> int:
+    """
+    Recompute lead_time_facts for the (repository, commit_sha) pairs returned by changed_commits_query
+    Called from both sql_store_pull_requests and sql_store_deployments, so a fact appears as soon as the
+    second side of a PR/deployment match is stored, whichever arrives first. Each PR gets one row
+    per environment, holding the first deployment of its merge commit there; a fact never moves to
+    a later deployment, so it survives the retention job deleting the original one. Runs in the
+    caller's transaction. Returns the rows merged.
+    """
+    merge_query = f"""
+    WITH changed AS (
+        SELECT DISTINCT repository, commit_sha FROM ({changed_commits_query}) AS changed_commits
+    ),
+    first_deployments AS (
+        SELECT 
+            d.deployment_id,
+            d.repository,
+            d.commit_sha,
+            d.environment,
+            d.created_at,
+            ROW_NUMBER() OVER (PARTITION BY d.repository, d.commit_sha, d.environment ORDER BY d.created_at, d.deployment_id) as deploy_rank
+        FROM deployments d
+        JOIN changed c ON d.repository = c.repository AND d.commit_sha = c.commit_sha
+    )
+    MERGE INTO lead_time_facts WITH (HOLDLOCK) AS target
+    USING (
+        SELECT 
+            pr.repository,
+            pr.pr_number,
+            fd.environment,
+            pr.merge_commit_sha,
+            pr.created_at as pr_created_at,
+            pr.merged_at,
+            pr.first_commit_date,
+            fd.deployment_id as first_deployment_id,
+            fd.created_at as first_deployed_at
+        FROM changed c
+        JOIN pull_requests pr ON pr.repository = c.repository AND pr.merge_commit_sha = c.commit_sha
+        JOIN first_deployments fd ON fd.repository = c.repository AND fd.commit_sha = c.commit_sha AND fd.deploy_rank = 1
+    ) AS source
+    ON target.repository = source.repository
+        AND target.pr_number = source.pr_number
+        AND target.environment = source.environment
+    WHEN MATCHED AND source.first_deployed_at <= target.first_deployed_at THEN
+        UPDATE SET 
+            merge_commit_sha = source.merge_commit_sha,
+            pr_created_at = source.pr_created_at,
+            merged_at = source.merged_at,
+            first_commit_date = source.first_commit_date,
+            first_deployment_id = source.first_deployment_id,
+            first_deployed_at = source.first_deployed_at,
+            lead_time_minutes = DATEDIFF(MINUTE, COALESCE(source.first_commit_date, source.pr_created_at), source.first_deployed_at),
+            lead_time_from_pr_minutes = DATEDIFF(MINUTE, source.pr_created_at, source.first_deployed_at),
+            lead_time_from_merge_minutes = DATEDIFF(MINUTE, source.merged_at, source.first_deployed_at),
+            updated_at = GETUTCDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (repository, pr_number, environment, merge_commit_sha, pr_created_at, merged_at, first_commit_date,
+                first_deployment_id, first_deployed_at, lead_time_minutes, lead_time_from_pr_minutes, lead_time_from_merge_minutes, updated_at)
+        VALUES (source.repository, source.pr_number, source.environment, source.merge_commit_sha, source.pr_created_at,
+                source.merged_at, source.first_commit_date, source.first_deployment_id, source.first_deployed_at,
+                DATEDIFF(MINUTE, COALESCE(source.first_commit_date, source.pr_created_at), source.first_deployed_at),
+                DATEDIFF(MINUTE, source.pr_created_at, source.first_deployed_at),
+                DATEDIFF(MINUTE, source.merged_at, source.first_deployed_at),
+                GETUTCDATE());
+    """
+    try:
+        cursor.execute(merge_query, params)
+        facts_count = cursor.rowcount
+        sql_log.debug("[update_lead_time_facts] Merged %d lead time facts", facts_count)
+        return facts_count
+    except Exception as e:
+        sql_log.error("[update_lead_time_facts] Error updating lead time facts: %s: %s", type(e).__name__, e)
+        raise
+
+
+def incident_attribution_rule() -> str:
+    """Label stored with each deployment_incidents row, e.g. all/24h/production"""
+    return f"{INCIDENT_ATTRIBUTION_RULE}/{INCIDENT_ATTRIBUTION_WINDOW_HOURS}h/{INCIDENT_ATTRIBUTION_ENVIRONMENT}"
+
+
+@timed_stage("sql.incident_links")
+def update_deployment_incident_links(cursor, affected_incidents_query: str, params: tuple = ()) -> int:
+    """
+    Recompute deployment_incidents for the (repository, issue_number) pairs returned by affected_incidents_query
+    An incident is linked to the successful INCIDENT_ATTRIBUTION_ENVIRONMENT deployments of its repository
+    created up to INCIDENT_ATTRIBUTION_WINDOW_HOURS before it (all of them, or only the latest one).
+    Each lookup is an ordered range seek on IX_deployments_repo_env_created, so the cost follows the
+    number of affected incidents instead of deployments x incidents. Only links to deployments still
+    in the hot table are replaced: links to deployments archived by the retention job cannot be
+    recomputed and are kept as they are. Runs in the caller's transaction.
+    Returns the number of links written.
+    """
+    if INCIDENT_ATTRIBUTION_RULE not in ("all", "latest"):
+        raise ValueError(f"INCIDENT_ATTRIBUTION_RULE must be 'all' or 'latest', got '{INCIDENT_ATTRIBUTION_RULE}'")
+
+    create_temp_table(cursor, "#affected_incidents", [("repository", "NVARCHAR(255) NOT NULL"), ("issue_number", "INT NOT NULL")])
+    try:
+        cursor.execute(f"""
+            INSERT INTO #affected_incidents (repository, issue_number)
+            SELECT DISTINCT repository, issue_number FROM ({affected_incidents_query}) AS affected
+        """, params)
+        if cursor.rowcount == 0:
+            return 0
+
+        cursor.execute("""
+            DELETE links
+            FROM deployment_incidents links
+            JOIN #affected_incidents a ON links.repository = a.repository AND links.issue_number = a.issue_number
+            WHERE EXISTS (SELECT 1 FROM deployments d WHERE d.deployment_id = links.deployment_id)
+        """)
+
+        cursor.execute("""
+            INSERT INTO deployment_incidents (deployment_id, repository, issue_number, deployment_created_at, incident_created_at,
+                                              minutes_after_deployment, attribution_rule, linked_at)
+            SELECT 
+                d.deployment_id,
+                i.repository,
+                i.issue_number,
+                d.created_at,
+                i.created_at,
+                DATEDIFF(MINUTE, d.created_at, i.created_at),
+                ?,
+                GETUTCDATE()
+            FROM #affected_incidents a
+            JOIN incidents i ON i.repository = a.repository AND i.issue_number = a.issue_number
+            CROSS APPLY (
+                SELECT TOP (?) deployment_id, created_at
+                FROM deployments
+                WHERE repository = i.repository
+                    AND environment = ?
+                    AND status = 'SUCCESS'
+                    AND created_at <= i.created_at
+                    AND created_at >= DATEADD(HOUR, -?, i.created_at)
+                ORDER BY created_at DESC, deployment_id DESC
+            ) d
+        """, (
+            incident_attribution_rule(),
+            1 if INCIDENT_ATTRIBUTION_RULE == "latest" else 2147483647,
+            INCIDENT_ATTRIBUTION_ENVIRONMENT,
+            INCIDENT_ATTRIBUTION_WINDOW_HOURS
+        ))
+        links_count = cursor.rowcount
+        sql_log.debug("[update_deployment_incident_links] Wrote %d deployment/incident links (%s)", links_count, LazyLog(incident_attribution_rule))
+        return links_count
+    except Exception as e:
+        sql_log.error("[update_deployment_incident_links] Error updating links: %s: %s", type(e).__name__, e)
+        raise
+    finally:
+        drop_temp_table(cursor, "#affected_incidents")
+
+
+@timed_stage("sql.restore_daily")
+def update_incident_restore_daily(cursor) -> int:
+    """
+    Maintain incident_restore_daily for the (day, repository, product) keys touched by #incident_changes
+    An incident contributes to the day it was closed. Closing adds it to that key; reopening,
+    re-closing at another time or a product change retracts it from the key it counted in before.
+    Only touched keys are rebuilt, from their few closed incidents, so p50/p90 stay exact.
+    Runs in the caller's transaction. Returns the number of keys touched.
+    """
+    restore_keys = "#restore_keys"
+    create_temp_table(cursor, restore_keys, [
+        ("repository", "NVARCHAR(255) NOT NULL"),
+        ("product", "NVARCHAR(255) NOT NULL"),
+        ("restore_date", "DATE NOT NULL")
+    ])
+    try:
+        # Keys the incident counted in before (retraction) and counts in now
+        cursor.execute(f"""
+            INSERT INTO {restore_keys} (repository, product, restore_date)
+            SELECT DISTINCT repository, product, restore_date
+            FROM (
+                SELECT repository, ISNULL(old_product, ?) as product, CAST(old_closed_at AS DATE) as restore_date
+                FROM {INCIDENT_CHANGES_TABLE}
+                WHERE old_state = 'closed' AND old_closed_at IS NOT NULL
+                UNION ALL
+                SELECT repository, ISNULL(new_product, ?), CAST(new_closed_at AS DATE)
+                FROM {INCIDENT_CHANGES_TABLE}
+                WHERE new_state = 'closed' AND new_closed_at IS NOT NULL
+                    AND (old_state IS NULL OR old_state <> new_state
+                         OR old_closed_at IS NULL OR old_closed_at <> new_closed_at
+                         OR ISNULL(old_product, ?) <> ISNULL(new_product, ?))
+            ) AS touched
+        """, (UNSPECIFIED_PRODUCT, UNSPECIFIED_PRODUCT, UNSPECIFIED_PRODUCT, UNSPECIFIED_PRODUCT))
+        keys_count = cursor.rowcount
+        if keys_count == 0:
+            return 0
+
+        cursor.execute(f"""
+            DELETE r
+            FROM incident_restore_daily r
+            JOIN {restore_keys} k ON r.date = k.restore_date AND r.repository = k.repository AND r.product = k.product
+        """)
+
+        cursor.execute(f"""
+            INSERT INTO incident_restore_daily (date, repository, product, restored_incidents, mean_restore_minutes,
+                                                p50_restore_minutes, p90_restore_minutes, max_restore_minutes, calculated_at)
+            SELECT DISTINCT
+                k.restore_date,
+                k.repository,
+                k.product,
+                COUNT(*) OVER (PARTITION BY k.restore_date, k.repository, k.product),
+                AVG(CAST(r.restore_minutes AS FLOAT)) OVER (PARTITION BY k.restore_date, k.repository, k.product),
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY r.restore_minutes) OVER (PARTITION BY k.restore_date, k.repository, k.product),
+                PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY r.restore_minutes) OVER (PARTITION BY k.restore_date, k.repository, k.product),
+                MAX(r.restore_minutes) OVER (PARTITION BY k.restore_date, k.repository, k.product),
+                GETUTCDATE()
+            FROM {restore_keys} k
+            JOIN incidents i
+                ON i.repository = k.repository
+                AND ISNULL(i.product, ?) = k.product
+                AND i.state = 'closed'
+                AND i.closed_at >= k.restore_date
+                AND i.closed_at < DATEADD(DAY, 1, CAST(k.restore_date AS DATETIME2))
+            CROSS APPLY (SELECT DATEDIFF(MINUTE, i.created_at, i.closed_at) as restore_minutes) r
+        """, (UNSPECIFIED_PRODUCT,))
+        sql_log.debug("[update_incident_restore_daily] Rebuilt %d restore-time keys (%d non-empty)", keys_count, cursor.rowcount)
+        return keys_count
+    except Exception as e:
+        sql_log.error("[update_incident_restore_daily] Error updating restore aggregates: %s: %s", type(e).__name__, e)
+        raise
+    finally:
+        drop_temp_table(cursor, restore_keys)
+
+
+def sql_store_deployments(deployments: List[Dict[str, Any]], github_token: Optional[str] = None) -> None:
+    """
+    Store deployment data in Azure SQL Database using Entra ID authentication
+    """
+    store_log.debug("[store_deployments] Starting to store %d deployments", len(deployments))
+    
+    if not deployments:
+        store_log.debug("[store_deployments] No deployments to store")
+        return
+    
+    started = time.perf_counter()
+    # Resolve teams from the cached org-wide map before checking out a connection,
+    # so no GitHub call happens while the transaction is open
+    unique_repos = set(d['repository'] for d in deployments)
+    teams = team_map.get(github_token) if github_token else {}
+    repo_rows = [(repo, teams.get(repo)) for repo in unique_repos]
+    if store_log.isEnabledFor(logging.DEBUG):
+        store_log.debug("[store_deployments] Team map covers %d/%d repositories", sum(1 for _, team in repo_rows if team), len(repo_rows))
+    
+    conn = None
+    cursor = None
+    
+    try:
+        # Check out a pooled connection (token and credential are cached by the pool)
+        conn = sql_pool.acquire()
+        
+        cursor = CountingCursor(conn.cursor())
+        
+        # Auto-populate repositories table with team information
+        repo_merge_query = """
+        MERGE INTO repositories WITH (HOLDLOCK) AS target
+        USING #stg_repositories AS source
+        ON target.name = source.name
+        WHEN MATCHED AND target.team IS NULL AND source.team IS NOT NULL THEN
+            UPDATE SET team = source.team, updated_at = GETUTCDATE()
+        WHEN NOT MATCHED THEN
+            INSERT (name, team, is_active, created_at, updated_at)
+            VALUES (source.name, source.team, 1, GETUTCDATE(), GETUTCDATE());
+        """
+        repo_count = sum(bulk_merge(cursor, "store_deployments", "#stg_repositories",
+                                    [("name", "NVARCHAR(255) NOT NULL"), ("team", "NVARCHAR(255)")],
+                                    repo_rows, repo_merge_query))
+        
+        commit_transaction(conn)
+        if repo_count:
+            metrics_cache.invalidate("repositories")
+        
+        # Insert new deployments and apply newer status transitions, capturing every change
+        # so daily metrics are maintained for just the keys it touches
+        merge_query = f"""
+        MERGE INTO deployments WITH (HOLDLOCK) AS target
+        USING #stg_deployments AS source
+        ON target.deployment_id = source.deployment_id
+        WHEN MATCHED AND source.status_updated_at IS NOT NULL
+                     AND (target.status_updated_at IS NULL OR source.status_updated_at > target.status_updated_at) THEN
+            UPDATE SET status = source.status, status_updated_at = source.status_updated_at
+        WHEN NOT MATCHED THEN
+            INSERT (deployment_id, repository, environment, commit_sha, created_at, creator, status, status_updated_at, collected_at)
+            VALUES (source.deployment_id, source.repository, source.environment, source.commit_sha, source.created_at,
+                    source.creator, source.status, source.status_updated_at, source.collected_at)
+        OUTPUT $action, CAST(inserted.created_at AS DATE), inserted.repository, inserted.environment, deleted.status, inserted.status,
+               inserted.commit_sha, inserted.created_at
+        INTO {DEPLOYMENT_CHANGES_TABLE};
+        """
+        create_temp_table(cursor, DEPLOYMENT_CHANGES_TABLE, DEPLOYMENT_CHANGES_COLUMNS)
+        
+        collected_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = dedupe_rows([
+            (
+                deployment["deployment_id"],
+                deployment["repository"],
+                deployment["environment"],
+                deployment["commit_sha"],
+                parse_github_datetime(deployment["created_at"]),
+                deployment["creator"],
+                deployment["status"],
+                parse_github_datetime(deployment["status_updated_at"]),
+                collected_at
+            )
+            for deployment in deployments
+        ], key_columns=1)
+        
+        batch_counts = bulk_merge(cursor, "store_deployments", "#stg_deployments", [
+            ("deployment_id", "NVARCHAR(255) NOT NULL"),
+            ("repository", "NVARCHAR(255) NOT NULL"),
+            ("environment", "NVARCHAR(50) NOT NULL"),
+            ("commit_sha", "NVARCHAR(40) NOT NULL"),
+            ("created_at", "DATETIME2 NOT NULL"),
+            ("creator", "NVARCHAR(255)"),
+            ("status", "NVARCHAR(50)"),
+            ("status_updated_at", "DATETIME2"),
+            ("collected_at", "DATETIME2 NOT NULL")
+        ], rows, merge_query)
+        inserted_count = sum(batch_counts)
+        
+        # Update daily metrics and lead time facts in the same transaction
+        if inserted_count:
+            update_daily_metrics(cursor)
+            update_lead_time_facts(cursor, f"SELECT repository, commit_sha FROM {DEPLOYMENT_CHANGES_TABLE} WHERE change_action = 'INSERT'")
+            # New deployments and status transitions re-attribute the incidents that follow them
+            update_deployment_incident_links(cursor, f"""
+                SELECT i.repository, i.issue_number
+                FROM {DEPLOYMENT_CHANGES_TABLE} c
+                JOIN incidents i
+                    ON i.repository = c.repository
+                    AND i.created_at >= c.created_at
+                    AND i.created_at <= DATEADD(HOUR, ?, c.created_at)
+                WHERE c.environment = ?
+            """, (INCIDENT_ATTRIBUTION_WINDOW_HOURS, INCIDENT_ATTRIBUTION_ENVIRONMENT))
+        drop_temp_table(cursor, DEPLOYMENT_CHANGES_TABLE)
+        
+        commit_transaction(conn)
+        if inserted_count:
+            metrics_cache.invalidate("deployments")
+        log_event(store_log, logging.INFO, "[store_deployments] stored", records=len(deployments), staged=len(rows),
+                  changed=inserted_count, repositories=len(unique_repos), new_repositories=repo_count,
+                  batches=len(batch_counts), ms=round((time.perf_counter() - started) * 1000))
+        
+        # Verification is an extra query, so it only runs with store=DEBUG
+        if store_log.isEnabledFor(logging.DEBUG):
+            cursor.execute("SELECT COUNT(*) FROM deployments WHERE collected_at >= DATEADD(minute, -5, GETUTCDATE())")
+            result = cursor.fetchone()
+            store_log.debug("[store_deployments] VERIFICATION: %d records found in deployments table from last 5 minutes", result[0] if result else 0)
+        
+    except Exception as e:
+        store_log.error("[store_deployments] Database error: %s: %s", type(e).__name__, e, exc_info=True)
+        if conn:
+            try:
+                conn.rollback()
+                store_log.info("[store_deployments] Transaction rolled back")
+            except:
+                store_log.error("[store_deployments] Error during rollback")
+                sql_pool.discard(conn)
+                conn = None
+        raise
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception as cleanup_error:
+                store_log.error("[store_deployments] Error closing cursor: %s: %s", type(cleanup_error).__name__, cleanup_error)
+        if conn:
+            sql_pool.release(conn)
+            store_log.debug("[store_deployments] Connection returned to pool: %s", LazyLog(sql_pool.get_stats))
+
+
+def sql_store_repository_teams(teams: Dict[str, str]) -> None:
+    """
+    Sync repositories.team for already registered repositories from the org-wide team map
+    Unlike sql_store_deployments (which only fills a missing team), changed team ownership is applied too
+    """
+    store_log.info("[store_repository_teams] Syncing teams for %d repositories", len(teams))
+    
+    if not teams:
+        return
+    
+    conn = None
+    cursor = None
+    
+    try:
+        conn = sql_pool.acquire()
+        cursor = CountingCursor(conn.cursor())
+        
+        merge_query = """
+        MERGE INTO repositories WITH (HOLDLOCK) AS target
+        USING #stg_repository_teams AS source
+        ON target.name = source.name
+        WHEN MATCHED AND (target.team IS NULL OR target.team <> source.team) THEN
+            UPDATE SET team = source.team, updated_at = GETUTCDATE();
+        """
+        batch_counts = bulk_merge(cursor, "store_repository_teams", "#stg_repository_teams",
+                                  [("name", "NVARCHAR(255) NOT NULL"), ("team", "NVARCHAR(255) NOT NULL")],
+                                  sorted(teams.items()), merge_query)
+        commit_transaction(conn)
+        if sum(batch_counts):
+            metrics_cache.invalidate("repositories")
+        store_log.info("[store_repository_teams] Updated team for %d repositories", sum(batch_counts))
+        
+    except Exception as e:
+        store_log.error("[store_repository_teams] Database error: %s: %s", type(e).__name__, e)
+        if conn:
+            try:
+                conn.rollback()
+            except:
+                store_log.error("[store_repository_teams] Error during rollback")
+                sql_pool.discard(conn)
+                conn = None
+        raise
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception as cleanup_error:
+                store_log.error("[store_repository_teams] Error closing cursor: %s: %s", type(cleanup_error).__name__, cleanup_error)
+        if conn:
+            sql_pool.release(conn)
+
+
+def generate_summary(deployments: List[Dict[str, Any]], summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Generate summary statistics for the collected deployments
+    Pass the previous result as `summary` to accumulate it over streamed batches
+    """
+    if summary is None:
+        summary = {"total": 0}
+    if not deployments:
+        return summary
+    
+    if "by_repository" not in summary:
+        summary.update({"by_repository": {}, "by_status": {}, "successful": 0, "failed": 0})
+    summary["total"] += len(deployments)
+    
+    for deployment in deployments:
+        repo = deployment["repository"]
+        status = deployment["status"]
+        
+        summary["by_repository"][repo] = summary["by_repository"].get(repo, 0) + 1
+        summary["by_status"][status] = summary["by_status"].get(status, 0) + 1
+        
+        if status and status.upper() == "SUCCESS":
+            summary["successful"] += 1
+        elif status and status.upper() == "FAILURE":
+            summary["failed"] += 1
+    
+    return summary
+
+
+def sql_store_pull_requests(prs: List[Dict[str, Any]]) -> None:
+    """
+    Store pull request data in Azure SQL Database using Entra ID authentication
+    PRs are linked to deployments via merge_commit_sha for lead time calculation
+    """
+    store_log.debug("[store_pull_requests] Starting to store %d pull requests", len(prs))
+    
+    if not prs:
+        store_log.debug("[store_pull_requests] No pull requests to store")
+        return
+    
+    # Filter out PRs without merge commit SHA
+    valid_prs = [pr for pr in prs if pr.get("merge_commit_sha")]
+    if len(valid_prs) < len(prs):
+        store_log.warning("[store_pull_requests] Filtered out %d PRs without merge commit SHA", len(prs) - len(valid_prs))
+    
+    if not valid_prs:
+        store_log.debug("[store_pull_requests] No valid pull requests to store")
+        return
     
-    all_incidents = []
+    started = time.perf_counter()
+    conn = None
     cursor = None
-    has_next_page = True
     
-    while has_next_page:
-        variables = {"org": GITHUB_ORG, "cursor": cursor}
+    try:
+        # Check out a pooled connection (token and credential are cached by the pool)
+        conn = sql_pool.acquire()
         
-        response = requests.post(
-            "https://api.github.com/graphql",
-            json={"query": query, "variables": variables},
-            headers=headers,
-            timeout=30
-        )
+        cursor = CountingCursor(conn.cursor())
         
-        if response.status_code != 200:
-            logging.error(f"GitHub API error: {response.status_code} - {response.text}")
-            raise Exception(f"GitHub API returned {response.status_code}")
+        # Insert pull requests using a set-based MERGE for idempotent upserts
+        merge_query = f"""
+        MERGE INTO pull_requests WITH (HOLDLOCK) AS target
+        USING #stg_pull_requests AS source
+        ON target.repository = source.repository AND target.pr_number = source.pr_number
+        WHEN MATCHED THEN
+            UPDATE SET 
+                title = source.title,
+                author = source.author,
+                merged_at = source.merged_at,
+                merge_commit_sha = source.merge_commit_sha,
+                base_branch = source.base_branch,
+                first_commit_date = COALESCE(source.first_commit_date, target.first_commit_date),
+                collected_at = source.collected_at
+        WHEN NOT MATCHED THEN
+            INSERT (pr_number, repository, title, author, created_at, merged_at, merge_commit_sha, base_branch, first_commit_date, collected_at)
+            VALUES (source.pr_number, source.repository, source.title, source.author, source.created_at, source.merged_at,
+                    source.merge_commit_sha, source.base_branch, source.first_commit_date, source.collected_at)
+        OUTPUT inserted.repository, inserted.merge_commit_sha INTO {PULL_REQUEST_CHANGES_TABLE};
+        """
+        create_temp_table(cursor, PULL_REQUEST_CHANGES_TABLE, PULL_REQUEST_CHANGES_COLUMNS)
         
-        data = response.json()
+        collected_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = dedupe_rows([
+            (
+                pr["repository"],
+                pr["pr_number"],
+                pr["title"],
+                pr["author"],
+                parse_github_datetime(pr["created_at"]),
+                parse_github_datetime(pr["merged_at"]),
+                pr["merge_commit_sha"],
+                pr["base_branch"],
+                parse_github_datetime(pr.get("first_commit_date")),
+                collected_at
+            )
+            for pr in valid_prs
+        ], key_columns=2)
         
-        if "errors" in data:
-            logging.error(f"GraphQL errors: {data['errors']}")
-            raise Exception(f"GraphQL query failed: {data['errors']}")
+        batch_counts = bulk_merge(cursor, "store_pull_requests", "#stg_pull_requests", [
+            ("repository", "NVARCHAR(255) NOT NULL"),
+            ("pr_number", "INT NOT NULL"),
+            ("title", "NVARCHAR(500)"),
+            ("author", "NVARCHAR(255)"),
+            ("created_at", "DATETIME2 NOT NULL"),
+            ("merged_at", "DATETIME2 NOT NULL"),
+            ("merge_commit_sha", "NVARCHAR(40) NOT NULL"),
+            ("base_branch", "NVARCHAR(255) NOT NULL"),
+            ("first_commit_date", "DATETIME2"),
+            ("collected_at", "DATETIME2 NOT NULL")
+        ], rows, merge_query)
+        inserted_count = sum(batch_counts)
         
-        repos = data["data"]["organization"]["repositories"]["nodes"]
+        # Link the PRs to deployments that already arrived, in the same transaction
+        facts_count = update_lead_time_facts(cursor, f"SELECT repository, merge_commit_sha AS commit_sha FROM {PULL_REQUEST_CHANGES_TABLE}")
+        drop_temp_table(cursor, PULL_REQUEST_CHANGES_TABLE)
         
-        logging.info(f"Processing {len(repos)} repositories for incidents")
+        commit_transaction(conn)
+        if inserted_count:
+            metrics_cache.invalidate("pull_requests")
+        # Correlation stats come from the facts maintained above instead of a PR x deployment join
+        log_event(store_log, logging.INFO, "[store_pull_requests] stored", records=len(prs), staged=len(rows),
+                  changed=inserted_count, lead_time_facts=facts_count, batches=len(batch_counts),
+                  ms=round((time.perf_counter() - started) * 1000))
         
-        for repo in repos:
-            repo_name = repo["name"]
-            issues_in_repo = repo["issues"]["nodes"]
-            
-            if issues_in_repo:
-                logging.info(f"Repo '{repo_name}' has {len(issues_in_repo)} issues with incident+production labels")
-            
-            for issue in issues_in_repo:
-                # Filter by time window
-                created_at = datetime.fromisoformat(issue["createdAt"].replace("Z", "+00:00"))
-                hours_ago = (datetime.now(timezone.utc) - created_at).total_seconds() / 3600
-                
-                logging.debug(f"Issue #{issue['number']} in {repo_name}: created {hours_ago:.1f}h ago")
-                
-                if hours_ago <= INCIDENT_LOOKBACK_HOURS:
-                    # Verify both "incident" and "production" labels are present
-                    label_names = [label["name"].lower() for label in issue["labels"]["nodes"]]
-                    has_incident_label = any(label in ["incident", "production-incident"] for label in label_names)
-                    has_production_label = any(label in ["production", "environment:production", "env:production"] for label in label_names)
-                    
-                    if has_incident_label and has_production_label:
-                        # Extract product from issue body
-                        import re
-                        product = None
-                        if issue.get("bodyText"):
-                            # Parse product using regex pattern from GitHub issue form
-                            product_match = re.search(r'### Product Affected\s*\n\s*(.+)', issue["bodyText"])
-                            if product_match:
-                                product = product_match.group(1).strip()
-                                logging.debug(f"Extracted product '{product}' from issue #{issue['number']}")
-                            else:
-                                logging.debug(f"No product field found in issue #{issue['number']} body")
-                        
-                        # Convert labels list to JSON string
-                        import json
-                        labels_json = json.dumps([label["name"] for label in issue["labels"]["nodes"]])
-                        
-                        all_incidents.append({
-                            "issue_number": issue["number"],
-                            "repository": f"{repo['owner']['login']}/{repo_name}",
-                            "title": issue["title"],
-                            "created_at": issue["createdAt"],
-                            "closed_at": issue["closedAt"],
-                            "state": issue["state"].lower(),
-                            "labels": labels_json,
-                            "product": product,
-                            "creator": issue["author"]["login"] if issue["author"] else "unknown",
-                            "url": issue["url"]
-                        })
-                        logging.debug(f"Added incident #{issue['number']} from {repo_name}, created {hours_ago:.1f}h ago, product={product}")
-                    else:
-                        logging.debug(f"Skipping issue #{issue['number']} - missing required labels (incident={has_incident_label}, production={has_production_label})")
-                else:
-                    logging.debug(f"Skipping issue #{issue['number']} - created {hours_ago:.1f}h ago (outside {INCIDENT_LOOKBACK_HOURS}h window)")
+        # Verification is an extra query, so it only runs with store=DEBUG
+        if store_log.isEnabledFor(logging.DEBUG):
+            cursor.execute("SELECT COUNT(*) FROM pull_requests WHERE collected_at >= DATEADD(minute, -5, GETUTCDATE())")
+            result = cursor.fetchone()
+            store_log.debug("[store_pull_requests] VERIFICATION: %d records found in pull_requests table from last 5 minutes", result[0] if result else 0)
         
-        page_info = data["data"]["organization"]["repositories"]["pageInfo"]
-        has_next_page = page_info["hasNextPage"]
-        cursor = page_info["endCursor"]
-    
-    logging.info(f"Total incidents collected (last {INCIDENT_LOOKBACK_HOURS}h): {len(all_incidents)}")
-    return all_incidents
+    except Exception as e:
+        store_log.error("[store_pull_requests] Database error: %s: %s", type(e).__name__, e, exc_info=True)
+        if conn:
+            try:
+                conn.rollback()
+                store_log.info("[store_pull_requests] Transaction rolled back")
+            except:
+                store_log.error("[store_pull_requests] Error during rollback")
+                sql_pool.discard(conn)
+                conn = None
+        raise
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception as cleanup_error:
+                store_log.error("[store_pull_requests] Error closing cursor: %s: %s", type(cleanup_error).__name__, cleanup_error)
+        if conn:
+            sql_pool.release(conn)
+            store_log.debug("[store_pull_requests] Connection returned to pool: %s", LazyLog(sql_pool.get_stats))
 
 
-def get_repository_teams(github_token: str, owner: str, repo: str) -> Optional[str]:
-    """Fetch team names for a repository from GitHub API"""
+def sql_store_incidents(incidents: List[Dict[str, Any]]) -> None:
+    """
+    Store incident data in Azure SQL Database using Entra ID authentication
+    Incidents are GitHub Issues with labels "incident" AND "production"
+    """
+    store_log.debug("[store_incidents] Starting to store %d incidents", len(incidents))
+    
+    if not incidents:
+        store_log.debug("[store_incidents] No incidents to store")
+        return
+    
+    started = time.perf_counter()
+    conn = None
+    cursor = None
+    
     try:
-        headers = {
-            "Authorization": f"Bearer {github_token}",
-            "Accept": "application/vnd.github+json",
-            "X-GitHub-Api-Version": "2022-11-28"
-        }
+        # Check out a pooled connection (token and credential are cached by the pool)
+        conn = sql_pool.acquire()
         
-        response = requests.get(
-            f"https://api.github.com/repos/{owner}/{repo}/teams",
-            headers=headers,
-            timeout=30
-        )
+        cursor = CountingCursor(conn.cursor())
         
-        if response.status_code == 200:
-            teams = response.json()
-            if teams:
-                team_names = [team['name'] for team in teams]
-                return ', '.join(team_names)
-            return None
-        elif response.status_code == 404:
-            logging.debug(f"No teams found for {owner}/{repo} (404)")
+        # Insert incidents using a set-based MERGE for idempotent upserts
+        merge_query = f"""
+        MERGE INTO incidents WITH (HOLDLOCK) AS target
+        USING #stg_incidents AS source
+        ON target.repository = source.repository AND target.issue_number = source.issue_number
+        WHEN MATCHED THEN
+            UPDATE SET 
+                title = source.title,
+                closed_at = source.closed_at,
+                state = source.state,
+                labels = source.labels,
+                product = source.product,
+                creator = source.creator,
+                url = source.url,
+                collected_at = source.collected_at
+        WHEN NOT MATCHED THEN
+            INSERT (issue_number, repository, title, created_at, closed_at, state, labels, product, creator, url, collected_at)
+            VALUES (source.issue_number, source.repository, source.title, source.created_at, source.closed_at, source.state,
+                    source.labels, source.product, source.creator, source.url, source.collected_at)
+        OUTPUT inserted.repository, inserted.issue_number, deleted.product, deleted.state, deleted.closed_at,
+               inserted.product, inserted.state, inserted.closed_at
+        INTO {INCIDENT_CHANGES_TABLE};
+        """
+        create_temp_table(cursor, INCIDENT_CHANGES_TABLE, INCIDENT_CHANGES_COLUMNS)
+        
+        collected_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        rows = dedupe_rows([
+            (
+                incident["repository"],
+                incident["issue_number"],
+                incident["title"],
+                parse_github_datetime(incident["created_at"]),
+                parse_github_datetime(incident["closed_at"]),
+                incident["state"],
+                incident["labels"],
+                incident.get("product"),
+                incident["creator"],
+                incident["url"],
+                collected_at
+            )
+            for incident in incidents
+        ], key_columns=2)
+        
+        batch_counts = bulk_merge(cursor, "store_incidents", "#stg_incidents", [
+            ("repository", "NVARCHAR(255) NOT NULL"),
+            ("issue_number", "INT NOT NULL"),
+            ("title", "NVARCHAR(500)"),
+            ("created_at", "DATETIME2 NOT NULL"),
+            ("closed_at", "DATETIME2"),
+            ("state", "NVARCHAR(50) NOT NULL"),
+            ("labels", "NVARCHAR(4000)"),  # MAX types defeat fast_executemany buffering
+            ("product", "NVARCHAR(255)"),
+            ("creator", "NVARCHAR(255)"),
+            ("url", "NVARCHAR(500)"),
+            ("collected_at", "DATETIME2 NOT NULL")
+        ], rows, merge_query)
+        inserted_count = sum(batch_counts)
+        
+        # Attribute the stored incidents to deployments, in the same transaction
+        links_count = update_deployment_incident_links(cursor, f"SELECT repository, issue_number FROM {INCIDENT_CHANGES_TABLE}")
+        # Time-to-restore aggregates for incidents that were closed or reopened
+        update_incident_restore_daily(cursor)
+        drop_temp_table(cursor, INCIDENT_CHANGES_TABLE)
+        
+        commit_transaction(conn)
+        if inserted_count:
+            metrics_cache.invalidate("incidents")
+        log_event(store_log, logging.INFO, "[store_incidents] stored", records=len(incidents), staged=len(rows),
+                  changed=inserted_count, deployment_links=links_count, attribution=incident_attribution_rule(),
+                  batches=len(batch_counts), ms=round((time.perf_counter() - started) * 1000))
+        
+        # Verification is an extra query, so it only runs with store=DEBUG
+        if store_log.isEnabledFor(logging.DEBUG):
+            cursor.execute("SELECT COUNT(*) FROM incidents WHERE collected_at >= DATEADD(minute, -5, GETUTCDATE())")
+            result = cursor.fetchone()
+            store_log.debug("[store_incidents] VERIFICATION: %d records found in incidents table from last 5 minutes", result[0] if result else 0)
+        
+    except Exception as e:
+        store_log.error("[store_incidents] Database error: %s: %s", type(e).__name__, e, exc_info=True)
+        if conn:
+            try:
+                conn.rollback()
+                store_log.info("[store_incidents] Transaction rolled back")
+            except:
+                store_log.error("[store_incidents] Error during rollback")
+                sql_pool.discard(conn)
+                conn = None
+        raise
+    finally:
+        if cursor:
+            try:
+                cursor.close()
+            except Exception as cleanup_error:
+                store_log.error("[store_incidents] Error closing cursor: %s: %s", type(cleanup_error).__name__, cleanup_error)
+        if conn:
+            sql_pool.release(conn)
+            store_log.debug("[store_incidents] Connection returned to pool: %s", LazyLog(sql_pool.get_stats))
+
+
+class SqlDataStore:
+    """Write path and metric reads on Azure SQL (the sql_store_* functions above, sql_query_metric)"""
+
+    def store_deployments(self, deployments: List[Dict[str, Any]], github_token: Optional[str] = None) -> None:
+        sql_store_deployments(deployments, github_token)
+
+    def store_repository_teams(self, teams: Dict[str, str]) -> None:
+        sql_store_repository_teams(teams)
+
+    def store_pull_requests(self, prs: List[Dict[str, Any]]) -> None:
+        sql_store_pull_requests(prs)
+
+    def store_incidents(self, incidents: List[Dict[str, Any]]) -> None:
+        sql_store_incidents(incidents)
+
+    def query_metric(self, metric: str, start: datetime, end: datetime, granularity: str, repository: Optional[str] = None,
+                     team: Optional[str] = None, environment: Optional[str] = None) -> List[Dict[str, Any]]:
+        return sql_query_metric(metric, start, end, granularity, repository, team, environment)
+
+
+def sqlite_datetime(value: Optional[datetime]) -> Optional[str]:
+    """Naive UTC datetime as SQLite text ('YYYY-MM-DD HH:MM:SS', the format of SQLite's date functions)"""
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def sqlite_minutes(start: str, end: str) -> str:
+    """SQLite expression equivalent to DATEDIFF(MINUTE, start, end) (minute boundaries crossed)"""
+    return f"(CAST(strftime('%s', {end}) AS INTEGER) / 60 - CAST(strftime('%s', {start}) AS INTEGER) / 60)"
+
+
+def sqlite_period_expression(column: str, granularity: str) -> str:
+    """SQLite equivalent of metrics_period_expression ('YYYY-MM-DD' of the first day of the day/week/month)"""
+    if granularity == "day":
+        return f"date({column})"
+    if granularity == "week":
+        # strftime('%w') is 0 on Sunday; step back to Monday
+        return f"date({column}, '-' || ((CAST(strftime('%w', {column}) AS INTEGER) + 6) % 7) || ' days')"
+    if granularity == "month":
+        return f"strftime('%Y-%m-01', {column})"
+    raise ValueError(f"Unknown granularity '{granularity}' (expected day, week or month)")
+
+
+class PercentileCont:
+    """SQLite aggregate percentile_cont(value, fraction), as T-SQL PERCENTILE_CONT(fraction) WITHIN GROUP (ORDER BY value)"""
+
+    def __init__(self):
+        self.values = []
+        self.fraction = 0.5
+
+    def step(self, value, fraction) -> None:
+        if value is not None:
+            self.values.append(value)
+        self.fraction = fraction
+
+    def finalize(self) -> Optional[float]:
+        if not self.values:
             return None
+        values = sorted(self.values)
+        position = (len(values) - 1) * self.fraction
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class SqliteDataStore:
+    """
+    Write path on an embedded SQLite database with the schema.sql tables (sql/schema-sqlite.sql)
+    Same upsert rules and incremental aggregates as the Azure SQL path (daily metric deltas, lead
+    time facts, deployment/incident links, restore-time keys), written with INSERT ... ON CONFLICT
+    and TEMP tables, so collectors, backfills and webhooks run without a database server.
+    Writes are serialized on one connection; WAL keeps readers unblocked.
+    """
+
+    SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql", "schema-sqlite.sql")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.execute("PRAGMA temp_store=MEMORY")  # Staging and change tables never touch disk
+        self.conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache (default 2 MB) keeps index pages hot
+        self.conn.create_aggregate("percentile_cont", 2, PercentileCont)
+        with open(self.SCHEMA_PATH, "r", encoding="utf-8") as f:
+            self.conn.executescript(f.read())
+
+    def _write(self, label: str, write):
+        """Run write(cursor) in one transaction and return its result"""
+        with self._lock:
+            cursor = CountingCursor(self.conn.cursor())
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                result = write(cursor)
+                commit_transaction(self.conn)
+                return result
+            except Exception as e:
+                store_log.error("[%s] SQLite error: %s: %s", label, type(e).__name__, e)
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _stage(cursor, table: str, columns: List[str], rows: List[tuple]) -> None:
+        """(Re)create a TEMP table and fill it"""
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{table}")
+        cursor.execute(f"CREATE TEMP TABLE {table} ({', '.join(columns)})")
+        if rows:
+            cursor.executemany(f"INSERT INTO temp.{table} VALUES ({', '.join('?' * len(columns))})", rows)
+
+    def store_deployments(self, deployments: List[Dict[str, Any]], github_token: Optional[str] = None) -> None:
+        store_log.debug("[store_deployments] Starting to store %d deployments (SQLite)", len(deployments))
+        if not deployments:
+            store_log.debug("[store_deployments] No deployments to store")
+            return
+        started = time.perf_counter()
+
+        teams = team_map.get(github_token) if github_token else {}
+        repo_rows = [(repo, teams.get(repo)) for repo in set(d["repository"] for d in deployments)]
+        now = sqlite_datetime(datetime.now(timezone.utc).replace(tzinfo=None))
+        rows = dedupe_rows([
+            (
+                deployment["deployment_id"],
+                deployment["repository"],
+                deployment["environment"],
+                deployment["commit_sha"],
+                sqlite_datetime(parse_github_datetime(deployment["created_at"])),
+                deployment["creator"],
+                deployment["status"],
+                sqlite_datetime(parse_github_datetime(deployment["status_updated_at"])),
+                now
+            )
+            for deployment in deployments
+        ], key_columns=1)
+
+        def write(cursor):
+            changes_before = self.conn.total_changes
+            cursor.executemany("""
+                INSERT INTO repositories (name, team, is_active, created_at, updated_at) VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET team = excluded.team, updated_at = excluded.updated_at
+                WHERE repositories.team IS NULL AND excluded.team IS NOT NULL
+            """, [(name, team, now, now) for name, team in repo_rows])
+            repo_count = self.conn.total_changes - changes_before
+
+            self._stage(cursor, "stg_deployments", ["deployment_id", "repository", "environment", "commit_sha", "created_at",
+                                                    "creator", "status", "status_updated_at", "collected_at"], rows)
+            self._stage(cursor, "deployment_changes", [name for name, _ in DEPLOYMENT_CHANGES_COLUMNS], [])
+            # What the MERGE's OUTPUT clause captures on Azure SQL: inserts, and newer status transitions
+            cursor.execute("""
+                INSERT INTO temp.deployment_changes
+                SELECT 'INSERT', date(s.created_at), s.repository, s.environment, NULL, s.status, s.commit_sha, s.created_at
+                FROM temp.stg_deployments s
+                WHERE NOT EXISTS (SELECT 1 FROM deployments d WHERE d.deployment_id = s.deployment_id)
+                UNION ALL
+                SELECT 'UPDATE', date(d.created_at), d.repository, d.environment, d.status, s.status, d.commit_sha, d.created_at
+                FROM temp.stg_deployments s
+                JOIN deployments d ON d.deployment_id = s.deployment_id
+                WHERE s.status_updated_at IS NOT NULL
+                    AND (d.status_updated_at IS NULL OR s.status_updated_at > d.status_updated_at)
+            """)
+            changed_count = cursor.rowcount
+            cursor.execute("""
+                INSERT INTO deployments (deployment_id, repository, environment, commit_sha, created_at, creator, status, status_updated_at, collected_at)
+                SELECT * FROM temp.stg_deployments WHERE true
+                ON CONFLICT (deployment_id) DO UPDATE SET status = excluded.status, status_updated_at = excluded.status_updated_at
+                WHERE excluded.status_updated_at IS NOT NULL
+                    AND (deployments.status_updated_at IS NULL OR excluded.status_updated_at > deployments.status_updated_at)
+            """)
+
+            if changed_count:
+                self._update_daily_metrics(cursor, now)
+                self._update_lead_time_facts(cursor, "SELECT repository, commit_sha FROM temp.deployment_changes WHERE change_action = 'INSERT'", (), now)
+                self._update_deployment_incident_links(cursor, """
+                    SELECT i.repository, i.issue_number
+                    FROM temp.deployment_changes c
+                    JOIN incidents i
+                        ON i.repository = c.repository
+                        AND i.created_at >= c.created_at
+                        AND i.created_at <= datetime(c.created_at, ?)
+                    WHERE c.environment = ?
+                """, (f"+{INCIDENT_ATTRIBUTION_WINDOW_HOURS} hours", INCIDENT_ATTRIBUTION_ENVIRONMENT), now)
+            return repo_count, changed_count
+
+        repo_count, changed_count = self._write("store_deployments", write)
+        if repo_count:
+            metrics_cache.invalidate("repositories")
+        if changed_count:
+            metrics_cache.invalidate("deployments")
+        log_event(store_log, logging.INFO, "[store_deployments] stored", records=len(deployments), staged=len(rows), changed=changed_count,
+                  repositories=len(repo_rows), new_repositories=repo_count, ms=round((time.perf_counter() - started) * 1000))
+
+    def store_repository_teams(self, teams: Dict[str, str]) -> None:
+        store_log.info("[store_repository_teams] Syncing teams for %d repositories (SQLite)", len(teams))
+        if not teams:
+            return
+        now = sqlite_datetime(datetime.now(timezone.utc).replace(tzinfo=None))
+
+        def write(cursor):
+            changes_before = self.conn.total_changes
+            cursor.executemany("UPDATE repositories SET team = ?, updated_at = ? WHERE name = ? AND (team IS NULL OR team <> ?)",
+                               [(team, now, name, team) for name, team in sorted(teams.items())])
+            return self.conn.total_changes - changes_before
+
+        updated_count = self._write("store_repository_teams", write)
+        if updated_count:
+            metrics_cache.invalidate("repositories")
+        store_log.info("[store_repository_teams] Updated team for %d repositories", updated_count)
+
+    def store_pull_requests(self, prs: List[Dict[str, Any]]) -> None:
+        store_log.debug("[store_pull_requests] Starting to store %d pull requests (SQLite)", len(prs))
+        valid_prs = [pr for pr in prs if pr.get("merge_commit_sha")]
+        if len(valid_prs) < len(prs):
+            store_log.warning("[store_pull_requests] Filtered out %d PRs without merge commit SHA", len(prs) - len(valid_prs))
+        if not valid_prs:
+            store_log.debug("[store_pull_requests] No valid pull requests to store")
+            return
+        started = time.perf_counter()
+
+        now = sqlite_datetime(datetime.now(timezone.utc).replace(tzinfo=None))
+        rows = dedupe_rows([
+            (
+                pr["repository"],
+                pr["pr_number"],
+                pr["title"],
+                pr["author"],
+                sqlite_datetime(parse_github_datetime(pr["created_at"])),
+                sqlite_datetime(parse_github_datetime(pr["merged_at"])),
+                pr["merge_commit_sha"],
+                pr["base_branch"],
+                sqlite_datetime(parse_github_datetime(pr.get("first_commit_date"))),
+                now
+            )
+            for pr in valid_prs
+        ], key_columns=2)
+
+        def write(cursor):
+            self._stage(cursor, "stg_pull_requests", ["repository", "pr_number", "title", "author", "created_at", "merged_at",
+                                                      "merge_commit_sha", "base_branch", "first_commit_date", "collected_at"], rows)
+            cursor.execute("""
+                INSERT INTO pull_requests (repository, pr_number, title, author, created_at, merged_at, merge_commit_sha,
+                                           base_branch, first_commit_date, collected_at)
+                SELECT * FROM temp.stg_pull_requests WHERE true
+                ON CONFLICT (repository, pr_number) DO UPDATE SET
+                    title = excluded.title,
+                    author = excluded.author,
+                    merged_at = excluded.merged_at,
+                    merge_commit_sha = excluded.merge_commit_sha,
+                    base_branch = excluded.base_branch,
+                    first_commit_date = COALESCE(excluded.first_commit_date, pull_requests.first_commit_date),
+                    collected_at = excluded.collected_at
+            """)
+            return self._update_lead_time_facts(cursor, "SELECT repository, merge_commit_sha AS commit_sha FROM temp.stg_pull_requests", (), now)
+
+        facts_count = self._write("store_pull_requests", write)
+        metrics_cache.invalidate("pull_requests")
+        log_event(store_log, logging.INFO, "[store_pull_requests] stored", records=len(prs), staged=len(rows), lead_time_facts=facts_count,
+                  ms=round((time.perf_counter() - started) * 1000))
+
+    def store_incidents(self, incidents: List[Dict[str, Any]]) -> None:
+        store_log.debug("[store_incidents] Starting to store %d incidents (SQLite)", len(incidents))
+        if not incidents:
+            store_log.debug("[store_incidents] No incidents to store")
+            return
+        started = time.perf_counter()
+
+        now = sqlite_datetime(datetime.now(timezone.utc).replace(tzinfo=None))
+        rows = dedupe_rows([
+            (
+                incident["repository"],
+                incident["issue_number"],
+                incident["title"],
+                sqlite_datetime(parse_github_datetime(incident["created_at"])),
+                sqlite_datetime(parse_github_datetime(incident["closed_at"])),
+                incident["state"],
+                incident["labels"],
+                incident.get("product"),
+                incident["creator"],
+                incident["url"],
+                now
+            )
+            for incident in incidents
+        ], key_columns=2)
+
+        def write(cursor):
+            self._stage(cursor, "stg_incidents", ["repository", "issue_number", "title", "created_at", "closed_at", "state",
+                                                  "labels", "product", "creator", "url", "collected_at"], rows)
+            self._stage(cursor, "incident_changes", [name for name, _ in INCIDENT_CHANGES_COLUMNS], [])
+            # Old values first: every staged incident is updated, as in the Azure SQL MERGE
+            cursor.execute("""
+                INSERT INTO temp.incident_changes
+                SELECT s.repository, s.issue_number, i.product, i.state, i.closed_at, s.product, s.state, s.closed_at
+                FROM temp.stg_incidents s
+                LEFT JOIN incidents i ON i.repository = s.repository AND i.issue_number = s.issue_number
+            """)
+            cursor.execute("""
+                INSERT INTO incidents (repository, issue_number, title, created_at, closed_at, state, labels, product, creator, url, collected_at)
+                SELECT * FROM temp.stg_incidents WHERE true
+                ON CONFLICT (repository, issue_number) DO UPDATE SET
+                    title = excluded.title,
+                    closed_at = excluded.closed_at,
+                    state = excluded.state,
+                    labels = excluded.labels,
+                    product = excluded.product,
+                    creator = excluded.creator,
+                    url = excluded.url,
+                    collected_at = excluded.collected_at
+            """)
+            links_count = self._update_deployment_incident_links(cursor, "SELECT repository, issue_number FROM temp.incident_changes", (), now)
+            self._update_incident_restore_daily(cursor, now)
+            return links_count
+
+        links_count = self._write("store_incidents", write)
+        metrics_cache.invalidate("incidents")
+        log_event(store_log, logging.INFO, "[store_incidents] stored", records=len(incidents), staged=len(rows), deployment_links=links_count,
+                  attribution=incident_attribution_rule(), ms=round((time.perf_counter() - started) * 1000))
+
+    @timed_stage("sql.daily_metrics")
+    def _update_daily_metrics(self, cursor, now: str) -> int:
+        """update_daily_metrics on temp.deployment_changes"""
+        cursor.execute("""
+            INSERT INTO deployment_metrics_daily (date, repository, environment, total_deployments, successful_deployments,
+                                                  failed_deployments, calculated_at)
+            SELECT
+                deployment_date,
+                repository,
+                environment,
+                SUM(CASE WHEN change_action = 'INSERT' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN new_status = 'SUCCESS' THEN 1 ELSE 0 END)
+                    - SUM(CASE WHEN old_status = 'SUCCESS' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN new_status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END)
+                    - SUM(CASE WHEN old_status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END),
+                ?
+            FROM temp.deployment_changes
+            WHERE true
+            GROUP BY deployment_date, repository, environment
+            ON CONFLICT (date, repository, environment) DO UPDATE SET
+                total_deployments = total_deployments + excluded.total_deployments,
+                successful_deployments = successful_deployments + excluded.successful_deployments,
+                failed_deployments = failed_deployments + excluded.failed_deployments,
+                calculated_at = excluded.calculated_at
+        """, (now,))
+        return cursor.rowcount
+
+    @timed_stage("sql.lead_time_facts")
+    def _update_lead_time_facts(self, cursor, changed_commits_query: str, params: tuple, now: str) -> int:
+        """update_lead_time_facts: first deployment per environment, never moved to a later one"""
+        cursor.execute(f"""
+            WITH changed AS (
+                SELECT DISTINCT repository, commit_sha FROM ({changed_commits_query})
+            ),
+            first_deployments AS (
+                SELECT
+                    d.deployment_id,
+                    d.repository,
+                    d.commit_sha,
+                    d.environment,
+                    d.created_at,
+                    ROW_NUMBER() OVER (PARTITION BY d.repository, d.commit_sha, d.environment ORDER BY d.created_at, d.deployment_id) as deploy_rank
+                FROM deployments d
+                JOIN changed c ON d.repository = c.repository AND d.commit_sha = c.commit_sha
+            )
+            INSERT INTO lead_time_facts (repository, pr_number, environment, merge_commit_sha, pr_created_at, merged_at, first_commit_date,
+                                         first_deployment_id, first_deployed_at, lead_time_minutes, lead_time_from_pr_minutes,
+                                         lead_time_from_merge_minutes, updated_at)
+            SELECT
+                pr.repository,
+                pr.pr_number,
+                fd.environment,
+                pr.merge_commit_sha,
+                pr.created_at,
+                pr.merged_at,
+                pr.first_commit_date,
+                fd.deployment_id,
+                fd.created_at,
+                {sqlite_minutes("COALESCE(pr.first_commit_date, pr.created_at)", "fd.created_at")},
+                {sqlite_minutes("pr.created_at", "fd.created_at")},
+                {sqlite_minutes("pr.merged_at", "fd.created_at")},
+                ?
+            FROM changed c
+            JOIN pull_requests pr ON pr.repository = c.repository AND pr.merge_commit_sha = c.commit_sha
+            JOIN first_deployments fd ON fd.repository = c.repository AND fd.commit_sha = c.commit_sha AND fd.deploy_rank = 1
+            WHERE true
+            ON CONFLICT (repository, pr_number, environment) DO UPDATE SET
+                merge_commit_sha = excluded.merge_commit_sha,
+                pr_created_at = excluded.pr_created_at,
+                merged_at = excluded.merged_at,
+                first_commit_date = excluded.first_commit_date,
+                first_deployment_id = excluded.first_deployment_id,
+                first_deployed_at = excluded.first_deployed_at,
+                lead_time_minutes = excluded.lead_time_minutes,
+                lead_time_from_pr_minutes = excluded.lead_time_from_pr_minutes,
+                lead_time_from_merge_minutes = excluded.lead_time_from_merge_minutes,
+                updated_at = excluded.updated_at
+            WHERE excluded.first_deployed_at <= lead_time_facts.first_deployed_at
+        """, params + (now,))
+        return cursor.rowcount
+
+    @timed_stage("sql.incident_links")
+    def _update_deployment_incident_links(self, cursor, affected_incidents_query: str, params: tuple, now: str) -> int:
+        """update_deployment_incident_links, with ROW_NUMBER() in place of CROSS APPLY (SELECT TOP ...)"""
+        if INCIDENT_ATTRIBUTION_RULE not in ("all", "latest"):
+            raise ValueError(f"INCIDENT_ATTRIBUTION_RULE must be 'all' or 'latest', got '{INCIDENT_ATTRIBUTION_RULE}'")
+
+        self._stage(cursor, "affected_incidents", ["repository", "issue_number"], [])
+        cursor.execute(f"INSERT INTO temp.affected_incidents SELECT DISTINCT repository, issue_number FROM ({affected_incidents_query})", params)
+        if cursor.rowcount == 0:
+            return 0
+
+        cursor.execute("""
+            DELETE FROM deployment_incidents
+            WHERE (repository, issue_number) IN (SELECT repository, issue_number FROM temp.affected_incidents)
+                AND EXISTS (SELECT 1 FROM deployments d WHERE d.deployment_id = deployment_incidents.deployment_id)
+        """)
+        cursor.execute(f"""
+            INSERT INTO deployment_incidents (deployment_id, repository, issue_number, deployment_created_at, incident_created_at,
+                                              minutes_after_deployment, attribution_rule, linked_at)
+            SELECT deployment_id, repository, issue_number, deployment_created_at, incident_created_at,
+                   {sqlite_minutes("deployment_created_at", "incident_created_at")}, ?, ?
+            FROM (
+                SELECT
+                    d.deployment_id,
+                    i.repository,
+                    i.issue_number,
+                    d.created_at as deployment_created_at,
+                    i.created_at as incident_created_at,
+                    ROW_NUMBER() OVER (PARTITION BY i.repository, i.issue_number ORDER BY d.created_at DESC, d.deployment_id DESC) as deploy_rank
+                FROM temp.affected_incidents a
+                JOIN incidents i ON i.repository = a.repository AND i.issue_number = a.issue_number
+                JOIN deployments d
+                    ON d.repository = i.repository
+                    AND d.environment = ?
+                    AND d.status = 'SUCCESS'
+                    AND d.created_at <= i.created_at
+                    AND d.created_at >= datetime(i.created_at, ?)
+            )
+            WHERE deploy_rank <= ?
+        """, (
+            incident_attribution_rule(),
+            now,
+            INCIDENT_ATTRIBUTION_ENVIRONMENT,
+            f"-{INCIDENT_ATTRIBUTION_WINDOW_HOURS} hours",
+            1 if INCIDENT_ATTRIBUTION_RULE == "latest" else 2147483647
+        ))
+        return cursor.rowcount
+
+    @timed_stage("sql.restore_daily")
+    def _update_incident_restore_daily(self, cursor, now: str) -> int:
+        """update_incident_restore_daily on temp.incident_changes (percentiles through the percentile_cont aggregate)"""
+        self._stage(cursor, "restore_keys", ["repository", "product", "restore_date"], [])
+        cursor.execute("""
+            INSERT INTO temp.restore_keys
+            SELECT DISTINCT repository, product, restore_date
+            FROM (
+                SELECT repository, IFNULL(old_product, ?) as product, date(old_closed_at) as restore_date
+                FROM temp.incident_changes
+                WHERE old_state = 'closed' AND old_closed_at IS NOT NULL
+                UNION ALL
+                SELECT repository, IFNULL(new_product, ?), date(new_closed_at)
+                FROM temp.incident_changes
+                WHERE new_state = 'closed' AND new_closed_at IS NOT NULL
+                    AND (old_state IS NULL OR old_state <> new_state
+                         OR old_closed_at IS NULL OR old_closed_at <> new_closed_at
+                         OR IFNULL(old_product, ?) <> IFNULL(new_product, ?))
+            )
+        """, (UNSPECIFIED_PRODUCT, UNSPECIFIED_PRODUCT, UNSPECIFIED_PRODUCT, UNSPECIFIED_PRODUCT))
+        keys_count = cursor.rowcount
+        if keys_count == 0:
+            return 0
+
+        cursor.execute("""
+            DELETE FROM incident_restore_daily
+            WHERE (date, repository, product) IN (SELECT restore_date, repository, product FROM temp.restore_keys)
+        """)
+        cursor.execute(f"""
+            INSERT INTO incident_restore_daily (date, repository, product, restored_incidents, mean_restore_minutes,
+                                                p50_restore_minutes, p90_restore_minutes, max_restore_minutes, calculated_at)
+            SELECT
+                k.restore_date,
+                k.repository,
+                k.product,
+                COUNT(*),
+                AVG(r.restore_minutes),
+                percentile_cont(r.restore_minutes, 0.5),
+                percentile_cont(r.restore_minutes, 0.9),
+                MAX(r.restore_minutes),
+                ?
+            FROM temp.restore_keys k
+            JOIN (
+                SELECT repository, IFNULL(product, ?) as product, closed_at, {sqlite_minutes("created_at", "closed_at")} as restore_minutes
+                FROM incidents
+                WHERE state = 'closed' AND closed_at IS NOT NULL
+            ) r
+                ON r.repository = k.repository
+                AND r.product = k.product
+                AND r.closed_at >= k.restore_date
+                AND r.closed_at < date(k.restore_date, '+1 day')
+            GROUP BY k.restore_date, k.repository, k.product
+        """, (now, UNSPECIFIED_PRODUCT))
+        return keys_count
+
+    def query_metric(self, metric: str, start: datetime, end: datetime, granularity: str, repository: Optional[str] = None,
+                     team: Optional[str] = None, environment: Optional[str] = None) -> List[Dict[str, Any]]:
+        """sql_query_metric on the SQLite tables (lead time percentiles through the percentile_cont aggregate)"""
+        environment = environment or INCIDENT_ATTRIBUTION_ENVIRONMENT
+        # date columns hold 'YYYY-MM-DD', datetime columns 'YYYY-MM-DD HH:MM:SS'
+        days = [start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")]
+        times = [sqlite_datetime(start), sqlite_datetime(end)]
+        if metric == "deployment_frequency":
+            join, where, params = metrics_filters("a", "date", repository, team, sqlite=True)
+            query = f"""
+                SELECT {sqlite_period_expression('a.date', granularity)} AS period,
+                       SUM(a.total_deployments), SUM(a.successful_deployments), SUM(a.failed_deployments)
+                FROM deployment_metrics_daily a {join}
+                WHERE a.environment = ? AND {where}
+                GROUP BY period
+                ORDER BY period
+            """
+            columns = ["period", "deployments", "successful_deployments", "failed_deployments"]
+            queries = [(query, [environment] + days + params)]
+        elif metric == "lead_time":
+            join, where, params = metrics_filters("a", "first_deployed_at", repository, team, sqlite=True)
+            query = f"""
+                SELECT {sqlite_period_expression('a.first_deployed_at', granularity)} AS period,
+                       COUNT(*), AVG(CAST(a.lead_time_minutes AS REAL)),
+                       percentile_cont(a.lead_time_minutes, 0.5), percentile_cont(a.lead_time_minutes, 0.9)
+                FROM lead_time_facts a {join}
+                WHERE a.environment = ? AND {where}
+                GROUP BY period
+                ORDER BY period
+            """
+            columns = ["period", "changes", "mean_lead_time_minutes", "p50_lead_time_minutes", "p90_lead_time_minutes"]
+            queries = [(query, [environment] + times + params)]
+        elif metric == "change_failure_rate":
+            # deployment_incidents only links successful deployments to INCIDENT_ATTRIBUTION_ENVIRONMENT
+            environment = INCIDENT_ATTRIBUTION_ENVIRONMENT
+            join, where, params = metrics_filters("a", "date", repository, team, sqlite=True)
+            link_join, link_where, link_params = metrics_filters("a", "deployment_created_at", repository, team, sqlite=True)
+            columns = ["period", "deployments", "failed_deployments", "change_failure_rate"]
+            queries = [
+                (f"""
+                SELECT {sqlite_period_expression('a.date', granularity)} AS period, SUM(a.successful_deployments)
+                FROM deployment_metrics_daily a {join}
+                WHERE a.environment = ? AND {where}
+                GROUP BY period
+                """, [environment] + days + params),
+                (f"""
+                SELECT {sqlite_period_expression('a.deployment_created_at', granularity)} AS period, COUNT(DISTINCT a.deployment_id)
+                FROM deployment_incidents a {link_join}
+                WHERE {link_where}
+                GROUP BY period
+                """, times + link_params)
+            ]
+        elif metric == "time_to_restore":
+            join, where, params = metrics_filters("a", "date", repository, team, sqlite=True)
+            query = f"""
+                SELECT {sqlite_period_expression('a.date', granularity)} AS period, SUM(a.restored_incidents),
+                       SUM(a.mean_restore_minutes * a.restored_incidents) / SUM(a.restored_incidents),
+                       MAX(a.max_restore_minutes)
+                FROM incident_restore_daily a {join}
+                WHERE {where}
+                GROUP BY period
+                ORDER BY period
+            """
+            columns = ["period", "restored_incidents", "mean_restore_minutes", "max_restore_minutes"]
+            queries = [(query, days + params)]
         else:
-            logging.warning(f"Failed to fetch teams for {owner}/{repo}: {response.status_code}")
-            return None
-    except Exception as e:
-        logging.warning(f"Error fetching teams for {owner}/{repo}: {type(e).__name__}: {str(e)}")
+            raise ValueError(f"Unknown metric '{metric}'")
+
+        with self._lock:
+            cursor = self.conn.cursor()
+            try:
+                results = [cursor.execute(query, query_params).fetchall() for query, query_params in queries]
+            finally:
+                cursor.close()
+        return metric_rows(metric, columns, results)
+
+
+_data_store = None
+
+
+def get_data_store():
+    """Return the configured data store (DATA_STORE)"""
+    global _data_store
+    if _data_store is None:
+        if DATA_STORE == "sql":
+            _data_store = SqlDataStore()
+        elif DATA_STORE == "sqlite":
+            _data_store = SqliteDataStore(DATA_STORE_PATH)
+        else:
+            raise ValueError(f"Unknown DATA_STORE '{DATA_STORE}' (expected sql or sqlite)")
+    return _data_store
+
+
+def store_deployments(deployments: List[Dict[str, Any]], github_token: Optional[str] = None) -> None:
+    """Store deployments (and the aggregates they touch) in the configured data store"""
+    with telemetry_span("store.deployments"):
+        get_data_store().store_deployments(deployments, github_token)
+    telemetry_count("rows_written", len(deployments))
+
+
+def store_repository_teams(teams: Dict[str, str]) -> None:
+    """Sync repositories.team in the configured data store"""
+    get_data_store().store_repository_teams(teams)
+
+
+def store_pull_requests(prs: List[Dict[str, Any]]) -> None:
+    """Store merged pull requests (and the lead time facts they complete) in the configured data store"""
+    with telemetry_span("store.pull_requests"):
+        get_data_store().store_pull_requests(prs)
+    telemetry_count("rows_written", len(prs))
+
+
+def store_incidents(incidents: List[Dict[str, Any]]) -> None:
+    """Store incidents (with their deployment links and restore-time aggregates) in the configured data store"""
+    with telemetry_span("store.incidents"):
+        get_data_store().store_incidents(incidents)
+    telemetry_count("rows_written", len(incidents))
+
+
+def verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Check the X-Hub-Signature-256 header against GITHUB_WEBHOOK_SECRET"""
+    if not GITHUB_WEBHOOK_SECRET or not signature:
+        return False
+    expected = "sha256=" + hmac.new(GITHUB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def get_pull_request_first_commit_date(github_token: str, repository: str, pr_number: int) -> Optional[str]:
+    """Authored date of a PR's first commit (canonical DORA T1), which the pull_request webhook does not carry"""
+    response = github_request(
+        "GET",
+        f"{GITHUB_API_URL}/repos/{repository}/pulls/{pr_number}/commits",
+        {
+            "Authorization": f"Bearer {github_token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28"
+        },
+        params={"per_page": 1}
+    )
+    if response.status_code != 200:
+        logging.warning(f"[webhook] Could not fetch first commit of {repository}#{pr_number}: {response.status_code}")
+        return None
+    commits = response.json()
+    return commits[0]["commit"]["author"]["date"] if commits else None
+
+
+def normalize_deployment_event(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """deployment / deployment_status payload -> collect_github_deployments record (None if filtered out)"""
+    deployment = payload["deployment"]
+    environments_filter = get_environments_filter()
+    if environments_filter and deployment["environment"] not in environments_filter:
+        return None
+
+    status = payload.get("deployment_status")
+    return {
+        # The GraphQL collectors key deployments by node ID
+        "deployment_id": deployment["node_id"],
+        "repository": payload["repository"]["full_name"],
+        "environment": deployment["environment"],
+        "commit_sha": deployment["sha"],
+        "created_at": deployment["created_at"],
+        "creator": deployment["creator"]["login"] if deployment.get("creator") else "unknown",
+        "status": status["state"].upper() if status else "pending",
+        "status_updated_at": status["created_at"] if status else None
+    }
+
+
+def normalize_pull_request_event(payload: Dict[str, Any], github_token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Closed-and-merged pull_request payload -> collect_github_pull_requests record (None if not relevant)"""
+    pr = payload["pull_request"]
+    if payload.get("action") != "closed" or not pr.get("merged") or pr["base"]["ref"] != BASE_BRANCH:
+        return None
+
+    repository = payload["repository"]["full_name"]
+    first_commit_date = None
+    if github_token:
+        try:
+            first_commit_date = get_pull_request_first_commit_date(github_token, repository, pr["number"])
+        except Exception as e:
+            # The reconciliation sweep fills it in; the store keeps an existing value when this is None
+            logging.warning(f"[webhook] Error fetching first commit of {repository}#{pr['number']}: {type(e).__name__}: {str(e)}")
+
+    return {
+        "pr_number": pr["number"],
+        "repository": repository,
+        "title": pr["title"],
+        "author": pr["user"]["login"] if pr.get("user") else "unknown",
+        "created_at": pr["created_at"],
+        "merged_at": pr["merged_at"],
+        "merge_commit_sha": pr.get("merge_commit_sha"),
+        "base_branch": pr["base"]["ref"],
+        "first_commit_date": first_commit_date
+    }
+
+
+def normalize_issue_event(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """issues payload -> collect_github_incidents record (None unless labelled incident + production)"""
+    issue = payload["issue"]
+    labels = [label["name"] for label in issue.get("labels", [])]
+    has_incident_label, has_production_label = incident_label_flags(labels)
+    if not (has_incident_label and has_production_label):
         return None
 
-def update_daily_metrics(cursor, conn):
-    """Calculate and update daily deployment metrics by aggregating deployment data"""
+    return {
+        "issue_number": issue["number"],
+        "repository": payload["repository"]["full_name"],
+        "title": issue["title"],
+        "created_at": issue["created_at"],
+        "updated_at": issue["updated_at"],
+        "closed_at": issue.get("closed_at"),
+        "state": issue["state"].lower(),
+        "labels": json.dumps(labels),
+        "product": extract_incident_product(issue.get("body")),
+        "creator": issue["user"]["login"] if issue.get("user") else "unknown",
+        "url": issue["html_url"]
+    }
+
+
+@app.route(route="github/webhook", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
+def github_webhook(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GitHub webhook endpoint for deployment, deployment_status, pull_request and issues events
+    Deliveries are authenticated by their HMAC signature, normalized into the collector record
+    shapes and written through the same store functions. Watermarks are not advanced here, so
+    the timer collectors still reconcile anything a lost delivery missed.
+    """
+    event = req.headers.get("X-GitHub-Event", "")
+    delivery = req.headers.get("X-GitHub-Delivery", "unknown")
+    body = req.get_body()
+
+    if not verify_webhook_signature(body, req.headers.get("X-Hub-Signature-256")):
+        logging.warning(f"[WEBHOOK] Rejected delivery {delivery} ({event}): invalid or missing signature")
+        return func.HttpResponse("Invalid signature", status_code=401)
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return func.HttpResponse("Invalid JSON payload", status_code=400)
+
+    if event == "ping":
+        return func.HttpResponse(json.dumps({"status": "pong"}), status_code=200, mimetype="application/json")
+
+    logging.info(f"[WEBHOOK] Delivery {delivery}: {event}.{payload.get('action', '')} for {payload.get('repository', {}).get('full_name')}")
+
+    try:
+        if event in ("deployment", "deployment_status"):
+            record = normalize_deployment_event(payload)
+            if record:
+                # Tokens are cached, and only needed when the team map has to be rebuilt
+                store_deployments([record], get_github_app_token())
+        elif event == "pull_request":
+            record = normalize_pull_request_event(payload, get_github_app_token() if payload.get("action") == "closed" else None)
+            if record:
+                store_pull_requests([record])
+        elif event == "issues":
+            record = normalize_issue_event(payload)
+            if record:
+                store_incidents([record])
+        else:
+            record = None
+    except Exception as e:
+        logging.error(f"[WEBHOOK] Error processing delivery {delivery} ({event}): {type(e).__name__}: {str(e)}")
+        import traceback
+        logging.error(f"[WEBHOOK] Full traceback: {traceback.format_exc()}")
+        # 5xx lets the delivery be redelivered from the GitHub UI/API; the sweep catches it otherwise
+        return func.HttpResponse("Failed to store event", status_code=500)
+
+    return func.HttpResponse(
+        json.dumps({"event": event, "delivery": delivery, "stored": record is not None}),
+        status_code=200,
+        mimetype="application/json"
+    )
+
+
+@app.route(route="backfill", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+def backfill(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Historical backfill for a date range, resumable across calls
+    POST /api/backfill?from=2024-01-01&to=2024-07-01[&entities=deployments,pull_requests][&repos=org/a,org/b]
+    Runs for up to BACKFILL_MAX_RUNTIME_SECONDS; repeat the same call until "complete" is true.
+    """
+    try:
+        start = datetime.strptime(req.params.get("from", ""), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        end = datetime.strptime(req.params["to"], "%Y-%m-%d").replace(tzinfo=timezone.utc) if req.params.get("to") else datetime.now(timezone.utc)
+    except ValueError:
+        return func.HttpResponse("from/to must be dates (YYYY-MM-DD)", status_code=400)
+    entities = [entity.strip() for entity in req.params.get("entities", "").split(",") if entity.strip()] or None
+    if entities and any(entity not in COLLECTION_ENTITIES for entity in entities):
+        return func.HttpResponse(f"entities must be among: {', '.join(COLLECTION_ENTITIES)}", status_code=400)
+    repositories = [repo.strip() for repo in req.params.get("repos", "").split(",") if "/" in repo] or None
+
+    try:
+        summary = run_backfill(start, end, entities, repositories, BACKFILL_MAX_RUNTIME_SECONDS)
+    except Exception as e:
+        logging.error(f"[BACKFILL] Error running backfill: {type(e).__name__}: {str(e)}")
+        import traceback
+        logging.error(f"[BACKFILL] Full traceback: {traceback.format_exc()}")
+        return func.HttpResponse("Backfill failed; call again to resume from the last checkpoint", status_code=500)
+
+    return func.HttpResponse(json.dumps(summary), status_code=200, mimetype="application/json")
+
+
+# Raw tables covered by the retention job, in processing order. Key columns come first in each
+# column list (the MERGE key used on rehydration); keep_extra_hours holds rows back past the horizon
+RETENTION_TABLES = {
+    "deployments": {
+        "date_column": "created_at",
+        "filter": "",
+        "key_columns": 1,
+        # Deployments stay until every incident that could be attributed to them is archived too
+        "keep_extra_hours": INCIDENT_ATTRIBUTION_WINDOW_HOURS,
+        "columns": [
+            ("deployment_id", "NVARCHAR(255) NOT NULL"),
+            ("repository", "NVARCHAR(255) NOT NULL"),
+            ("environment", "NVARCHAR(50) NOT NULL"),
+            ("commit_sha", "NVARCHAR(40) NOT NULL"),
+            ("created_at", "DATETIME2 NOT NULL"),
+            ("creator", "NVARCHAR(255)"),
+            ("status", "NVARCHAR(50)"),
+            ("status_updated_at", "DATETIME2"),
+            ("collected_at", "DATETIME2 NOT NULL")
+        ]
+    },
+    "pull_requests": {
+        "date_column": "merged_at",
+        "filter": "",
+        "key_columns": 2,
+        "keep_extra_hours": 0,
+        "columns": [
+            ("repository", "NVARCHAR(255) NOT NULL"),
+            ("pr_number", "INT NOT NULL"),
+            ("title", "NVARCHAR(500)"),
+            ("author", "NVARCHAR(255)"),
+            ("created_at", "DATETIME2 NOT NULL"),
+            ("merged_at", "DATETIME2 NOT NULL"),
+            ("merge_commit_sha", "NVARCHAR(40) NOT NULL"),
+            ("base_branch", "NVARCHAR(255) NOT NULL"),
+            ("first_commit_date", "DATETIME2"),
+            ("collected_at", "DATETIME2 NOT NULL")
+        ]
+    },
+    "incidents": {
+        # Open incidents are never archived, however old
+        "date_column": "closed_at",
+        "filter": "AND state = 'closed'",
+        "key_columns": 2,
+        "keep_extra_hours": 0,
+        "columns": [
+            ("repository", "NVARCHAR(255) NOT NULL"),
+            ("issue_number", "INT NOT NULL"),
+            ("title", "NVARCHAR(500)"),
+            ("created_at", "DATETIME2 NOT NULL"),
+            ("closed_at", "DATETIME2"),
+            ("state", "NVARCHAR(50) NOT NULL"),
+            ("labels", "NVARCHAR(4000)"),  # Rehydration stages these types; MAX types defeat fast_executemany buffering
+            ("product", "NVARCHAR(255)"),
+            ("creator", "NVARCHAR(255)"),
+            ("url", "NVARCHAR(500)"),
+            ("collected_at", "DATETIME2 NOT NULL")
+        ]
+    }
+}
+
+
+class LocalArchiveStore:
+    """Parquet archive in a local (or mounted) directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def write(self, path: str, data: bytes) -> None:
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+    def read(self, path: str) -> bytes:
+        with open(os.path.join(self.root, path), "rb") as f:
+            return f.read()
+
+    def list(self, prefix: str) -> List[str]:
+        directory = os.path.join(self.root, prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f"{prefix}{name}" for name in os.listdir(directory) if name.endswith(".parquet"))
+
+
+class BlobArchiveStore:
+    """Parquet archive in an Azure Blob Storage container, authenticated with the Function App's identity"""
+
+    def __init__(self, container_url: str):
+        from azure.storage.blob import ContainerClient
+        self.container = ContainerClient.from_container_url(container_url, credential=DefaultAzureCredential())
+
+    def write(self, path: str, data: bytes) -> None:
+        self.container.upload_blob(path, data, overwrite=True)
+
+    def read(self, path: str) -> bytes:
+        return self.container.download_blob(path).readall()
+
+    def list(self, prefix: str) -> List[str]:
+        return sorted(blob.name for blob in self.container.list_blobs(name_starts_with=prefix) if blob.name.endswith(".parquet"))
+
+
+_archive_store = None
+
+
+def get_archive_store():
+    """Return the archive store configured by RETENTION_ARCHIVE_LOCATION"""
+    global _archive_store
+    if _archive_store is None:
+        if not RETENTION_ARCHIVE_LOCATION:
+            raise ValueError("RETENTION_ARCHIVE_LOCATION is not set (local directory or Blob container URL)")
+        if RETENTION_ARCHIVE_LOCATION.startswith("https://"):
+            _archive_store = BlobArchiveStore(RETENTION_ARCHIVE_LOCATION)
+        else:
+            _archive_store = LocalArchiveStore(RETENTION_ARCHIVE_LOCATION)
+    return _archive_store
+
+
+def archive_partition_prefix(table: str, day) -> str:
+    """Hive-style partition folder, e.g. deployments/date=2024-05-01/"""
+    return f"{table}/date={day.isoformat()}/"
+
+
+def archive_schema(columns: List[Tuple[str, str]]):
+    """Arrow schema for a RETENTION_TABLES column list"""
+    import pyarrow as pa
+    arrow_types = {"NVARCHAR": pa.string(), "DATETIME2": pa.timestamp("us"), "INT": pa.int32()}
+    return pa.schema([(name, arrow_types[sql_type.split("(")[0].split()[0]]) for name, sql_type in columns])
+
+
+def rows_to_parquet(columns: List[Tuple[str, str]], rows: List[tuple]) -> bytes:
+    """Serialize rows (in column order) to a compressed Parquet file"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = archive_schema(columns)
+    arrays = [pa.array([row[index] for row in rows], type=field.type) for index, field in enumerate(schema)]
+    sink = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_arrays(arrays, schema=schema), sink, compression=RETENTION_ARCHIVE_COMPRESSION)
+    return sink.getvalue().to_pybytes()
+
+
+def rollup_archive_day(cursor, table: str, start: datetime, end: datetime) -> None:
+    """
+    Make sure the aggregates fed by table's rows in [start, end) exist before they are deleted
+    Aggregates are normally maintained at ingestion time, so this only fills keys that are
+    missing (e.g. rows stored before an aggregate table existed); existing keys are never
+    recomputed, which keeps a run that was interrupted halfway through its deletes safe to repeat.
+    """
+    if table == "deployments":
+        cursor.execute("""
+            INSERT INTO deployment_metrics_daily (date, repository, environment, total_deployments, successful_deployments, failed_deployments, calculated_at)
+            SELECT 
+                CAST(d.created_at AS DATE),
+                d.repository,
+                d.environment,
+                COUNT(*),
+                SUM(CASE WHEN d.status = 'SUCCESS' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN d.status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END),
+                GETUTCDATE()
+            FROM deployments d
+            WHERE d.created_at >= ? AND d.created_at < ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM deployment_metrics_daily m
+                    WHERE m.date = CAST(d.created_at AS DATE) AND m.repository = d.repository AND m.environment = d.environment
+                )
+            GROUP BY CAST(d.created_at AS DATE), d.repository, d.environment
+        """, (start, end))
+        update_lead_time_facts(cursor, "SELECT repository, commit_sha FROM deployments WHERE created_at >= ? AND created_at < ?", (start, end))
+    elif table == "pull_requests":
+        update_lead_time_facts(cursor, "SELECT repository, merge_commit_sha AS commit_sha FROM pull_requests WHERE merged_at >= ? AND merged_at < ?", (start, end))
+    elif table == "incidents":
+        cursor.execute("""
+            WITH restores AS (
+                SELECT 
+                    CAST(closed_at AS DATE) as restore_date,
+                    repository,
+                    ISNULL(product, ?) as product,
+                    DATEDIFF(MINUTE, created_at, closed_at) as restore_minutes
+                FROM incidents
+                WHERE state = 'closed' AND closed_at >= ? AND closed_at < ?
+            ),
+            stats AS (
+                SELECT DISTINCT
+                    restore_date,
+                    repository,
+                    product,
+                    COUNT(*) OVER (PARTITION BY restore_date, repository, product) as restored_incidents,
+                    AVG(CAST(restore_minutes AS FLOAT)) OVER (PARTITION BY restore_date, repository, product) as mean_restore_minutes,
+                    PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY restore_minutes) OVER (PARTITION BY restore_date, repository, product) as p50_restore_minutes,
+                    PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY restore_minutes) OVER (PARTITION BY restore_date, repository, product) as p90_restore_minutes,
+                    MAX(restore_minutes) OVER (PARTITION BY restore_date, repository, product) as max_restore_minutes
+                FROM restores
+            )
+            INSERT INTO incident_restore_daily (date, repository, product, restored_incidents, mean_restore_minutes,
+                                                p50_restore_minutes, p90_restore_minutes, max_restore_minutes, calculated_at)
+            SELECT s.restore_date, s.repository, s.product, s.restored_incidents, s.mean_restore_minutes,
+                   s.p50_restore_minutes, s.p90_restore_minutes, s.max_restore_minutes, GETUTCDATE()
+            FROM stats s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM incident_restore_daily r
+                WHERE r.date = s.restore_date AND r.repository = s.repository AND r.product = s.product
+            )
+        """, (UNSPECIFIED_PRODUCT, start, end))
+
+
+def archive_day(table: str, day, run_id: str) -> Dict[str, int]:
+    """
+    Roll up, archive and delete one day of a raw table
+    The day's rows are written to <table>/date=<day>/part-<run_id>.parquet before anything is
+    deleted. Deletes are bounded by the highest exported id, so rows that arrive meanwhile are
+    left for the next run, and are committed every RETENTION_DELETE_BATCH_SIZE rows so no
+    long-running lock is ever held on the hot table.
+    """
+    spec = RETENTION_TABLES[table]
+    date_column = spec["date_column"]
+    column_names = [name for name, _ in spec["columns"]]
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    range_filter = f"{date_column} >= ? AND {date_column} < ? {spec['filter']}"
+    
+    conn = sql_pool.acquire()
     try:
-        logging.info("[update_daily_metrics] Calculating daily metrics from deployments...")
-        
-        # Aggregate metrics for today using MERGE to handle updates
-        merge_query = """
-        MERGE INTO deployment_metrics_daily AS target
-        USING (
-            SELECT 
-                CAST(created_at AS DATE) as deployment_date,
-                repository,
-                environment,
-                COUNT(*) as total_deployments,
-                SUM(CASE WHEN status = 'SUCCESS' THEN 1 ELSE 0 END) as successful_deployments,
-                SUM(CASE WHEN status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END) as failed_deployments
-            FROM deployments
-            WHERE created_at >= DATEADD(day, -1, GETUTCDATE())
-            GROUP BY CAST(created_at AS DATE), repository, environment
-        ) AS source
-        ON target.date = source.deployment_date 
-            AND target.repository = source.repository 
-            AND target.environment = source.environment
-        WHEN MATCHED THEN
-            UPDATE SET 
-                total_deployments = source.total_deployments,
-                successful_deployments = source.successful_deployments,
-                failed_deployments = source.failed_deployments,
-                calculated_at = GETUTCDATE()
-        WHEN NOT MATCHED THEN
-            INSERT (date, repository, environment, total_deployments, successful_deployments, failed_deployments, calculated_at)
-            VALUES (source.deployment_date, source.repository, source.environment, 
-                    source.total_deployments, source.successful_deployments, source.failed_deployments, GETUTCDATE());
-        """
-        
-        cursor.execute(merge_query)
+        cursor = conn.cursor()
+        rollup_archive_day(cursor, table, start, end)
         conn.commit()
+        metrics_cache.invalidate(table)
         
-        # Get count of updated metrics
-        cursor.execute("SELECT COUNT(*) FROM deployment_metrics_daily WHERE calculated_at >= DATEADD(minute, -1, GETUTCDATE())")
-        metrics_count = cursor.fetchone()[0]
-        logging.info(f"[update_daily_metrics] Successfully updated {metrics_count} daily metric records")
+        cursor.execute(f"SELECT id, {', '.join(column_names)} FROM {table} WHERE {range_filter} ORDER BY id", (start, end))
+        rows = []
+        max_id = None
+        while True:
+            batch = cursor.fetchmany(SQL_BULK_BATCH_SIZE)
+            if not batch:
+                break
+            max_id = batch[-1][0]
+            rows.extend(tuple(row[1:]) for row in batch)
+        if not rows:
+            cursor.close()
+            sql_pool.release(conn)
+            return {"archived": 0, "deleted": 0}
         
-    except Exception as e:
-        logging.error(f"[update_daily_metrics] Error updating metrics: {type(e).__name__}: {str(e)}")
+        path = f"{archive_partition_prefix(table, day)}part-{run_id}.parquet"
+        data = rows_to_parquet(spec["columns"], rows)
+        get_archive_store().write(path, data)
+        logging.info(f"[retention] {table} {day}: archived {len(rows)} rows to {path} ({len(data)} bytes)")
+        
+        deleted = 0
+        while True:
+            cursor.execute(f"DELETE TOP (?) FROM {table} WHERE {range_filter} AND id <= ?",
+                           (RETENTION_DELETE_BATCH_SIZE, start, end, max_id))
+            chunk = cursor.rowcount
+            conn.commit()
+            deleted += chunk
+            if chunk < RETENTION_DELETE_BATCH_SIZE:
+                break
+        logging.info(f"[retention] {table} {day}: deleted {deleted} rows from the hot table")
+        cursor.close()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        sql_pool.discard(conn)
         raise
+    sql_pool.release(conn)
+    return {"archived": len(rows), "deleted": deleted}
 
 
-def store_deployments(deployments: List[Dict[str, Any]], github_token: Optional[str] = None) -> None:
+def archive_candidate_days(table: str, cutoff: datetime, limit: int) -> List[Any]:
+    """Oldest days of table with rows before cutoff (at most limit)"""
+    spec = RETENTION_TABLES[table]
+    conn = sql_pool.acquire()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT DISTINCT TOP (?) CAST({spec['date_column']} AS DATE) as archive_day
+            FROM {table}
+            WHERE {spec['date_column']} < ? {spec['filter']}
+            ORDER BY archive_day
+        """, (limit, cutoff))
+        days = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    except Exception:
+        sql_pool.discard(conn)
+        raise
+    sql_pool.release(conn)
+    return days
+
+
+def run_retention(now: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
     """
-    Store deployment data in Azure SQL Database using Entra ID authentication
+    Archive and delete every whole day older than the retention horizon, table by table
+    Returns per-table day/row counts. At most RETENTION_MAX_DAYS_PER_RUN days are processed per
+    table; the rest is picked up by the next run.
     """
-    logging.info(f"[store_deployments] Starting to store {len(deployments)} deployments")
-    
-    if not deployments:
-        logging.info("No deployments to store")
-        return
-    
-    conn = None
-    cursor = None
+    now = now or datetime.now(timezone.utc)
+    run_id = now.strftime("%Y%m%dT%H%M%SZ")
+    horizon = datetime.combine((now - timedelta(days=RETENTION_DAYS)).date(), datetime.min.time())
+    results = {}
+    for table, spec in RETENTION_TABLES.items():
+        cutoff = horizon - timedelta(hours=spec["keep_extra_hours"])
+        # Only whole days are archived, so a partition is never split across runs
+        cutoff = datetime.combine(cutoff.date(), datetime.min.time())
+        totals = {"days": 0, "archived": 0, "deleted": 0}
+        for day in archive_candidate_days(table, cutoff, RETENTION_MAX_DAYS_PER_RUN):
+            counts = archive_day(table, day, run_id)
+            totals["days"] += 1
+            totals["archived"] += counts["archived"]
+            totals["deleted"] += counts["deleted"]
+        logging.info(f"[retention] {table}: {totals['days']} days before {cutoff.date()} archived ({totals['archived']} rows)")
+        results[table] = totals
+    return results
+
+
+def read_archive(table: str, start_day, end_day) -> List[tuple]:
+    """
+    Read the archived rows of table for the days start_day..end_day (inclusive)
+    Rows come back in RETENTION_TABLES column order. A row archived more than once (e.g. after
+    being rehydrated) is returned once, from its newest part file.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    spec = RETENTION_TABLES[table]
+    column_names = [name for name, _ in spec["columns"]]
+    store = get_archive_store()
+    rows = []
+    day = start_day
+    while day <= end_day:
+        # part-<run_id> names sort chronologically
+        for path in store.list(archive_partition_prefix(table, day)):
+            part = pq.read_table(pa.BufferReader(store.read(path)), columns=column_names)
+            rows.extend(zip(*(part.column(name).to_pylist() for name in column_names)))
+        day += timedelta(days=1)
+    return dedupe_rows(rows, spec["key_columns"])
+
+
+def rehydrate_archive(table: str, start_day, end_day) -> int:
+    """
+    Copy an archived date range back into the hot table, for backfills or audits
+    Rows already present are left alone. The aggregate tables still include the archived rows,
+    so they are not touched; rehydrated rows older than the horizon are archived again (to a new
+    part file) by the next retention run. Returns the rows inserted.
+    """
+    spec = RETENTION_TABLES[table]
+    rows = read_archive(table, start_day, end_day)
+    logging.info(f"[retention] Rehydrating {len(rows)} archived {table} rows ({start_day} to {end_day})")
+    if not rows:
+        return 0
     
+    column_names = [name for name, _ in spec["columns"]]
+    key_names = column_names[:spec["key_columns"]]
+    merge_query = f"""
+    MERGE INTO {table} WITH (HOLDLOCK) AS target
+    USING #stg_rehydrate AS source
+    ON {' AND '.join(f'target.{name} = source.{name}' for name in key_names)}
+    WHEN NOT MATCHED THEN
+        INSERT ({', '.join(column_names)})
+        VALUES ({', '.join(f'source.{name}' for name in column_names)});
+    """
+    conn = sql_pool.acquire()
     try:
-        # Get access token for SQL Database using Managed Identity
-        logging.info("[store_deployments] Getting access token for SQL Database...")
-        credential = DefaultAzureCredential()
-        token = credential.get_token("https://database.windows.net/.default")
-        logging.info("[store_deployments] Access token acquired successfully")
-        
-        # List available ODBC drivers
-        logging.info("[store_deployments] Checking available ODBC drivers...")
-        try:
-            available_drivers = [driver for driver in pyodbc.drivers()]
-            logging.info(f"[store_deployments] Available ODBC drivers: {available_drivers}")
-        except Exception as driver_error:
-            logging.warning(f"[store_deployments] Could not list ODBC drivers: {driver_error}")
-        
-        # Connection string for Entra ID authentication
-        connection_string = f"Driver={{ODBC Driver 18 for SQL Server}};Server=tcp:{SQL_SERVER},1433;Database={SQL_DATABASE};Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30"
-        logging.info(f"[store_deployments] Connecting to SQL Server: {SQL_SERVER}, Database: {SQL_DATABASE}")
-        
-        # SQL_COPT_SS_ACCESS_TOKEN constant for pyodbc
-        SQL_COPT_SS_ACCESS_TOKEN = 1256
-        
-        # Encode the token properly with length prefix using struct
-        # This is required for Azure SQL token-based authentication
-        token_bytes = token.token.encode('utf-16-le')
-        token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
-        logging.info(f"[store_deployments] Token encoded and packed, length: {len(token_struct)} bytes")
-        
-        # Attempt connection
-        logging.info("[store_deployments] Attempting pyodbc.connect()...")
-        print("[DEBUG] About to call pyodbc.connect()")
-        try:
-            conn = pyodbc.connect(connection_string, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct})
-            print("[DEBUG] pyodbc.connect() returned successfully")
-            logging.info("[store_deployments] Database connection established successfully")
-        except pyodbc.Error as pyo_err:
-            print(f"[DEBUG] pyodbc.Error caught: {pyo_err}")
-            logging.error(f"[store_deployments] pyodbc.Error: {pyo_err}")
-            for arg in pyo_err.args:
-                logging.error(f"[store_deployments] Error arg: {arg}")
-            raise
-        except Exception as conn_ex:
-            print(f"[DEBUG] Exception caught: {type(conn_ex).__name__}: {conn_ex}")
-            logging.error(f"[store_deployments] Connection exception: {type(conn_ex).__name__}: {conn_ex}")
-            raise
-        
         cursor = conn.cursor()
-        print("[DEBUG] Cursor created successfully")
-        logging.info("[store_deployments] Database cursor created")
-        
-        # Auto-populate repositories table with team information
-        logging.info("[store_deployments] Ensuring repositories are registered...")
-        unique_repos = set(d['repository'] for d in deployments)
-        repo_insert_query = """
-        MERGE INTO repositories AS target
-        USING (SELECT ? AS name, ? AS team) AS source
-        ON target.name = source.name
-        WHEN MATCHED AND target.team IS NULL AND source.team IS NOT NULL THEN
-            UPDATE SET team = source.team, updated_at = GETUTCDATE()
-        WHEN NOT MATCHED THEN
-            INSERT (name, team, is_active, created_at, updated_at)
-            VALUES (?, ?, 1, GETUTCDATE(), GETUTCDATE());
-        """
-        
-        for repo in unique_repos:
-            team_name = None
-            if github_token:
-                # Parse owner/repo from full name
-                parts = repo.split('/')
-                if len(parts) == 2:
-                    owner, repo_name = parts
-                    logging.info(f"[store_deployments] Fetching teams for {repo}...")
-                    team_name = get_repository_teams(github_token, owner, repo_name)
-                    if team_name:
-                        logging.info(f"[store_deployments] Found teams for {repo}: {team_name}")
-            
-            cursor.execute(repo_insert_query, repo, team_name, repo, team_name)
-        
-        conn.commit()
-        logging.info(f"[store_deployments] Registered {len(unique_repos)} repositories")
-        
-        # Insert deployments (ignore duplicates)
-        logging.info("[store_deployments] Preparing to insert deployments...")
-        insert_query = """
-        MERGE INTO deployments AS target
-        USING (SELECT ? AS deployment_id) AS source
-        ON target.deployment_id = source.deployment_id
-        WHEN NOT MATCHED THEN
-            INSERT (deployment_id, repository, environment, commit_sha, created_at, creator, status, status_updated_at, collected_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
-        """
-        
-        inserted_count = 0
-        for idx, deployment in enumerate(deployments, 1):
-            try:
-                logging.info(f"[store_deployments] Inserting deployment {idx}/{len(deployments)}: {deployment['deployment_id']}")
-                cursor.execute(insert_query, 
-                    deployment["deployment_id"],
-                    deployment["deployment_id"],
-                    deployment["repository"],
-                    deployment["environment"],
-                    deployment["commit_sha"],
-                    deployment["created_at"],
-                    deployment["creator"],
-                    deployment["status"],
-                    deployment["status_updated_at"],
-                    datetime.now(timezone.utc).isoformat()
-                )
-                inserted_count += 1
-            except Exception as insert_error:
-                logging.error(f"[store_deployments] Error inserting deployment {deployment['deployment_id']}: {type(insert_error).__name__}: {str(insert_error)}")
-                raise
-        
-        logging.info(f"[store_deployments] Committing transaction with {inserted_count} deployments...")
+        inserted = sum(bulk_merge(cursor, "retention", "#stg_rehydrate", spec["columns"], rows, merge_query))
         conn.commit()
-        logging.info(f"[store_deployments] Successfully stored {inserted_count} deployments")
-        
-        # Verify records were inserted
-        cursor.execute("SELECT COUNT(*) FROM deployments WHERE collected_at >= DATEADD(minute, -5, GETUTCDATE())")
-        result = cursor.fetchone()
-        count = result[0] if result else 0
-        logging.info(f"[store_deployments] VERIFICATION: {count} records found in deployments table from last 5 minutes")
-        
-        # Update daily metrics
-        logging.info("[store_deployments] Updating daily metrics...")
-        update_daily_metrics(cursor, conn)
-        
-    except Exception as e:
-        logging.error(f"[store_deployments] Database error: {type(e).__name__}: {str(e)}")
-        import traceback
-        logging.error(f"[store_deployments] Traceback: {traceback.format_exc()}")
-        if conn:
-            try:
-                conn.rollback()
-                logging.info("[store_deployments] Transaction rolled back")
-            except:
-                logging.error("[store_deployments] Error during rollback")
+        cursor.close()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        sql_pool.discard(conn)
         raise
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-                logging.info("[store_deployments] Cursor closed")
-            except Exception as cleanup_error:
-                logging.error(f"[store_deployments] Error closing cursor: {type(cleanup_error).__name__}: {str(cleanup_error)}")
-        if conn:
-            try:
-                conn.close()
-                logging.info("[store_deployments] Connection closed")
-            except Exception as cleanup_error:
-                logging.error(f"[store_deployments] Error closing connection: {type(cleanup_error).__name__}: {str(cleanup_error)}")
+    sql_pool.release(conn)
+    logging.info(f"[retention] Rehydrated {inserted} {table} rows")
+    return inserted
 
 
-def generate_summary(deployments: List[Dict[str, Any]]) -> Dict[str, Any]:
+@app.route(route="archive/rehydrate", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+def archive_rehydrate(req: func.HttpRequest) -> func.HttpResponse:
     """
-    Generate summary statistics for the collected deployments
+    Rehydrate an archived range into the hot tables
+    POST /api/archive/rehydrate?table=deployments&from=2024-01-01&to=2024-01-31
     """
-    if not deployments:
-        return {"total": 0}
-    
-    summary = {
-        "total": len(deployments),
-        "by_repository": {},
-        "by_status": {},
-        "successful": 0,
-        "failed": 0
-    }
-    
-    for deployment in deployments:
-        repo = deployment["repository"]
-        status = deployment["status"]
-        
-        summary["by_repository"][repo] = summary["by_repository"].get(repo, 0) + 1
-        summary["by_status"][status] = summary["by_status"].get(status, 0) + 1
-        
-        if status and status.upper() == "SUCCESS":
-            summary["successful"] += 1
-        elif status and status.upper() == "FAILURE":
-            summary["failed"] += 1
-    
-    return summary
+    if DATA_STORE != "sql":
+        return func.HttpResponse(f"Archive rehydration requires DATA_STORE=sql (configured: {DATA_STORE})", status_code=400)
+    table = req.params.get("table", "")
+    if table not in RETENTION_TABLES:
+        return func.HttpResponse(f"table must be one of: {', '.join(RETENTION_TABLES)}", status_code=400)
+    try:
+        start_day = datetime.strptime(req.params.get("from", ""), "%Y-%m-%d").date()
+        end_day = datetime.strptime(req.params.get("to", req.params.get("from", "")), "%Y-%m-%d").date()
+    except ValueError:
+        return func.HttpResponse("from/to must be dates (YYYY-MM-DD)", status_code=400)
+    if end_day < start_day:
+        return func.HttpResponse("to must not be before from", status_code=400)
 
+    try:
+        inserted = rehydrate_archive(table, start_day, end_day)
+    except Exception as e:
+        logging.error(f"[REHYDRATE] Error rehydrating {table} {start_day}..{end_day}: {type(e).__name__}: {str(e)}")
+        return func.HttpResponse("Failed to rehydrate archive", status_code=500)
 
-def store_pull_requests(prs: List[Dict[str, Any]]) -> None:
+    return func.HttpResponse(
+        json.dumps({"table": table, "from": start_day.isoformat(), "to": end_day.isoformat(), "rehydrated": inserted}),
+        status_code=200,
+        mimetype="application/json"
+    )
+
+
+class MetricsQueryCache:
     """
-    Store pull request data in Azure SQL Database using Entra ID authentication
-    PRs are linked to deployments via merge_commit_sha for lead time calculation
+    In-process LRU + TTL cache of metrics API responses
+    Each entry remembers the data version of every table its query read; store functions bump
+    the version of the tables they wrote, so affected entries are recomputed on the next request
+    while unrelated ones keep being served. Writes made by other instances only show after the TTL.
     """
-    logging.info(f"[store_pull_requests] Starting to store {len(prs)} pull requests")
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[int, ...], str, str]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
     
-    if not prs:
-        logging.info("[store_pull_requests] No pull requests to store")
-        return
+    def versions(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        """Current data versions of tables; capture them before querying, then pass them to put()"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
     
-    # Filter out PRs without merge commit SHA
-    valid_prs = [pr for pr in prs if pr.get("merge_commit_sha")]
-    if len(valid_prs) < len(prs):
-        logging.warning(f"[store_pull_requests] Filtered out {len(prs) - len(valid_prs)} PRs without merge commit SHA")
+    def get(self, key: str, tables: Tuple[str, ...]) -> Optional[Tuple[str, str]]:
+        """(body, etag) if the entry is fresh and none of its tables changed since it was computed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                expires_at, versions, body, etag = entry
+                if expires_at > time.monotonic() and versions == tuple(self._versions.get(table, 0) for table in tables):
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return body, etag
+                del self._entries[key]
+            self._misses += 1
+            return None
     
-    if not valid_prs:
-        logging.info("[store_pull_requests] No valid pull requests to store")
-        return
+    def put(self, key: str, versions: Tuple[int, ...], body: str, etag: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, versions, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
     
-    conn = None
-    cursor = None
+    def invalidate(self, *tables: str) -> None:
+        """Mark tables as changed (called after a store function commits)"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self._invalidations += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+
+metrics_cache = MetricsQueryCache(METRICS_CACHE_MAX_ENTRIES, METRICS_CACHE_TTL_SECONDS)
+
+METRICS_GRANULARITIES = ("day", "week", "month")
+
+# Raw tables each metric's aggregates are derived from (the cache invalidation keys)
+METRIC_TABLES = {
+    "deployment_frequency": ("deployments",),
+    "lead_time": ("deployments", "pull_requests"),
+    "change_failure_rate": ("deployments", "incidents"),
+    "time_to_restore": ("incidents",)
+}
+
+
+def metrics_period_expression(column: str, granularity: str) -> str:
+    """T-SQL for the first day of the day/week (Monday)/month containing column"""
+    if granularity == "day":
+        return f"CAST({column} AS DATE)"
+    if granularity == "week":
+        # 1900-01-01 was a Monday
+        return f"DATEADD(DAY, -(DATEDIFF(DAY, '19000101', {column}) % 7), CAST({column} AS DATE))"
+    return f"DATEFROMPARTS(YEAR({column}), MONTH({column}), 1)"
+
+
+def metrics_filters(alias: str, date_column: str, repository: Optional[str], team: Optional[str],
+                    sqlite: bool = False) -> Tuple[str, str, list]:
+    """(JOIN, WHERE, params) restricting alias to [from, to) and the optional repository / team (T-SQL, or SQLite)"""
+    join = ""
+    where = [f"{alias}.{date_column} >= ?", f"{alias}.{date_column} < ?"]
+    params = []
+    if repository:
+        where.append(f"{alias}.repository = ?")
+        params.append(repository)
+    if team:
+        # repositories.team lists every owning team as "a, b"
+        join = f"JOIN repositories r ON r.name = {alias}.repository"
+        where.append("', ' || r.team || ', ' LIKE ? ESCAPE '\\'" if sqlite else "', ' + r.team + ', ' LIKE ? ESCAPE '\\'")
+        escaped = team.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+        params.append(f"%, {escaped}, %")
+    return join, " AND ".join(where), params
+
+
+def query_metric(metric: str, start: datetime, end: datetime, granularity: str, repository: Optional[str] = None,
+                 team: Optional[str] = None, environment: Optional[str] = None) -> List[Dict[str, Any]]:
+    """One row per period for a DORA metric, read from the aggregate tables of the configured data store"""
+    return get_data_store().query_metric(metric, start, end, granularity, repository, team, environment)
+
+
+def sql_query_metric(metric: str, start: datetime, end: datetime, granularity: str, repository: Optional[str] = None,
+                     team: Optional[str] = None, environment: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    One row per period for a DORA metric, read from the Azure SQL aggregate tables
+    deployment_frequency: deployment_metrics_daily; lead_time: lead_time_facts (exact percentiles);
+    change_failure_rate: deployment_metrics_daily + deployment_incidents; time_to_restore:
+    incident_restore_daily (count-weighted mean and max, since daily percentiles cannot be combined)
+    """
+    environment = environment or INCIDENT_ATTRIBUTION_ENVIRONMENT
+    if metric == "deployment_frequency":
+        join, where, params = metrics_filters("a", "date", repository, team)
+        query = f"""
+            SELECT p.period, SUM(a.total_deployments), SUM(a.successful_deployments), SUM(a.failed_deployments)
+            FROM deployment_metrics_daily a {join}
+            CROSS APPLY (SELECT {metrics_period_expression('a.date', granularity)} AS period) p
+            WHERE a.environment = ? AND {where}
+            GROUP BY p.period
+            ORDER BY p.period
+        """
+        columns = ["period", "deployments", "successful_deployments", "failed_deployments"]
+        queries = [(query, [environment, start, end] + params)]
+    elif metric == "lead_time":
+        join, where, params = metrics_filters("a", "first_deployed_at", repository, team)
+        query = f"""
+            SELECT DISTINCT
+                p.period,
+                COUNT(*) OVER (PARTITION BY p.period),
+                AVG(CAST(a.lead_time_minutes AS FLOAT)) OVER (PARTITION BY p.period),
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY a.lead_time_minutes) OVER (PARTITION BY p.period),
+                PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY a.lead_time_minutes) OVER (PARTITION BY p.period)
+            FROM lead_time_facts a {join}
+            CROSS APPLY (SELECT {metrics_period_expression('a.first_deployed_at', granularity)} AS period) p
+            WHERE a.environment = ? AND {where}
+            ORDER BY p.period
+        """
+        columns = ["period", "changes", "mean_lead_time_minutes", "p50_lead_time_minutes", "p90_lead_time_minutes"]
+        queries = [(query, [environment, start, end] + params)]
+    elif metric == "change_failure_rate":
+        # deployment_incidents only links successful deployments to INCIDENT_ATTRIBUTION_ENVIRONMENT
+        environment = INCIDENT_ATTRIBUTION_ENVIRONMENT
+        join, where, params = metrics_filters("a", "date", repository, team)
+        link_join, link_where, link_params = metrics_filters("a", "deployment_created_at", repository, team)
+        columns = ["period", "deployments", "failed_deployments", "change_failure_rate"]
+        queries = [
+            (f"""
+            SELECT p.period, SUM(a.successful_deployments)
+            FROM deployment_metrics_daily a {join}
+            CROSS APPLY (SELECT {metrics_period_expression('a.date', granularity)} AS period) p
+            WHERE a.environment = ? AND {where}
+            GROUP BY p.period
+            """, [environment, start, end] + params),
+            (f"""
+            SELECT p.period, COUNT(DISTINCT a.deployment_id)
+            FROM deployment_incidents a {link_join}
+            CROSS APPLY (SELECT {metrics_period_expression('a.deployment_created_at', granularity)} AS period) p
+            WHERE {link_where}
+            GROUP BY p.period
+            """, [start, end] + link_params)
+        ]
+    elif metric == "time_to_restore":
+        join, where, params = metrics_filters("a", "date", repository, team)
+        query = f"""
+            SELECT p.period, SUM(a.restored_incidents),
+                   SUM(a.mean_restore_minutes * a.restored_incidents) / SUM(a.restored_incidents),
+                   MAX(a.max_restore_minutes)
+            FROM incident_restore_daily a {join}
+            CROSS APPLY (SELECT {metrics_period_expression('a.date', granularity)} AS period) p
+            WHERE {where}
+            GROUP BY p.period
+            ORDER BY p.period
+        """
+        columns = ["period", "restored_incidents", "mean_restore_minutes", "max_restore_minutes"]
+        queries = [(query, [start, end] + params)]
+    else:
+        raise ValueError(f"Unknown metric '{metric}'")
     
+    conn = sql_pool.acquire()
     try:
-        # Get access token for SQL Database using Managed Identity
-        logging.info("[store_pull_requests] Getting access token for SQL Database...")
-        credential = DefaultAzureCredential()
-        token = credential.get_token("https://database.windows.net/.default")
-        logging.info("[store_pull_requests] Access token acquired successfully")
-        
-        # Connection string for Entra ID authentication
-        connection_string = f"Driver={{ODBC Driver 18 for SQL Server}};Server=tcp:{SQL_SERVER},1433;Database={SQL_DATABASE};Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30"
-        logging.info(f"[store_pull_requests] Connecting to SQL Server: {SQL_SERVER}, Database: {SQL_DATABASE}")
-        
-        # SQL_COPT_SS_ACCESS_TOKEN constant for pyodbc
-        SQL_COPT_SS_ACCESS_TOKEN = 1256
-        
-        # Encode the token properly with length prefix using struct
-        token_bytes = token.token.encode('utf-16-le')
-        token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
-        logging.info(f"[store_pull_requests] Token encoded and packed, length: {len(token_struct)} bytes")
-        
-        # Attempt connection
-        logging.info("[store_pull_requests] Attempting pyodbc.connect()...")
-        conn = pyodbc.connect(connection_string, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct})
-        logging.info("[store_pull_requests] Database connection established successfully")
-        
         cursor = conn.cursor()
-        logging.info("[store_pull_requests] Database cursor created")
-        
-        # Insert pull requests using MERGE for idempotent upserts
-        logging.info("[store_pull_requests] Preparing to insert pull requests...")
-        merge_query = """
-        MERGE INTO pull_requests AS target
-        USING (SELECT ? AS repository, ? AS pr_number) AS source
-        ON target.repository = source.repository AND target.pr_number = source.pr_number
-        WHEN MATCHED THEN
-            UPDATE SET 
-                title = ?,
-                author = ?,
-                merged_at = ?,
-                merge_commit_sha = ?,
-                base_branch = ?,
-                first_commit_date = ?,
-                collected_at = ?
-        WHEN NOT MATCHED THEN
-            INSERT (pr_number, repository, title, author, created_at, merged_at, merge_commit_sha, base_branch, first_commit_date, collected_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-        """
-        
-        inserted_count = 0
-        for idx, pr in enumerate(valid_prs, 1):
-            try:
-                logging.debug(f"[store_pull_requests] Processing PR {idx}/{len(valid_prs)}: {pr['repository']}#{pr['pr_number']}")
-                cursor.execute(merge_query,
-                    # USING clause
-                    pr["repository"],
-                    pr["pr_number"],
-                    # WHEN MATCHED UPDATE
-                    pr["title"],
-                    pr["author"],
-                    pr["merged_at"],
-                    pr["merge_commit_sha"],
-                    pr["base_branch"],
-                    pr.get("first_commit_date"),
-                    datetime.now(timezone.utc).isoformat(),
-                    # WHEN NOT MATCHED INSERT
-                    pr["pr_number"],
-                    pr["repository"],
-                    pr["title"],
-                    pr["author"],
-                    pr["created_at"],
-                    pr["merged_at"],
-                    pr["merge_commit_sha"],
-                    pr["base_branch"],
-                    pr.get("first_commit_date"),
-                    datetime.now(timezone.utc).isoformat()
-                )
-                inserted_count += 1
-            except Exception as insert_error:
-                logging.error(f"[store_pull_requests] Error inserting PR {pr['repository']}#{pr['pr_number']}: {type(insert_error).__name__}: {str(insert_error)}")
-                raise
-        
-        logging.info(f"[store_pull_requests] Committing transaction with {inserted_count} pull requests...")
-        conn.commit()
-        logging.info(f"[store_pull_requests] Successfully stored {inserted_count} pull requests")
-        
-        # Verify records were inserted
-        cursor.execute("SELECT COUNT(*) FROM pull_requests WHERE collected_at >= DATEADD(minute, -5, GETUTCDATE())")
-        result = cursor.fetchone()
-        count = result[0] if result else 0
-        logging.info(f"[store_pull_requests] VERIFICATION: {count} records found in pull_requests table from last 5 minutes")
-        
-        # Log correlation stats
-        cursor.execute("""
-            SELECT COUNT(DISTINCT pr.id) as pr_count, 
-                   COUNT(DISTINCT d.id) as deployment_count,
-                   COUNT(DISTINCT pr.merge_commit_sha) as unique_commits
-            FROM pull_requests pr
-            LEFT JOIN deployments d ON pr.merge_commit_sha = d.commit_sha
-            WHERE pr.collected_at >= DATEADD(hour, -1, GETUTCDATE())
-        """)
-        stats = cursor.fetchone()
-        if stats:
-            logging.info(f"[store_pull_requests] CORRELATION: {stats[0]} PRs, {stats[1]} matching deployments, {stats[2]} unique commits in last hour")
-        else:
-            logging.info("[store_pull_requests] CORRELATION: No correlation data available")
-        
-    except Exception as e:
-        logging.error(f"[store_pull_requests] Database error: {type(e).__name__}: {str(e)}")
-        import traceback
-        logging.error(f"[store_pull_requests] Traceback: {traceback.format_exc()}")
-        if conn:
-            try:
-                conn.rollback()
-                logging.info("[store_pull_requests] Transaction rolled back")
-            except:
-                logging.error("[store_pull_requests] Error during rollback")
+        results = []
+        for query, query_params in queries:
+            cursor.execute(query, query_params)
+            results.append(cursor.fetchall())
+        cursor.close()
+    except Exception:
+        sql_pool.discard(conn)
         raise
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-                logging.debug("[store_pull_requests] Cursor closed")
-            except Exception as cleanup_error:
-                logging.error(f"[store_pull_requests] Error closing cursor: {type(cleanup_error).__name__}: {str(cleanup_error)}")
-        if conn:
-            try:
-                conn.close()
-                logging.debug("[store_pull_requests] Connection closed")
-            except Exception as cleanup_error:
-                logging.error(f"[store_pull_requests] Error closing connection: {type(cleanup_error).__name__}: {str(cleanup_error)}")
+    sql_pool.release(conn)
+    return metric_rows(metric, columns, results)
 
 
-def store_incidents(incidents: List[Dict[str, Any]]) -> None:
+def metric_rows(metric: str, columns: List[str], results: List[List[tuple]]) -> List[Dict[str, Any]]:
+    """API rows from the result sets of a metric's queries (change_failure_rate joins its two sets by period)"""
+    def value(raw):
+        if isinstance(raw, float):
+            return round(raw, 2)
+        return raw.isoformat() if hasattr(raw, "isoformat") else raw
+    
+    if metric == "change_failure_rate":
+        successful = {row[0]: row[1] for row in results[0]}
+        failed = {row[0]: row[1] for row in results[1]}
+        return [
+            {
+                "period": value(period),
+                "deployments": successful.get(period, 0),
+                "failed_deployments": failed.get(period, 0),
+                "change_failure_rate": round(failed.get(period, 0) / successful[period], 4) if successful.get(period) else None
+            }
+            for period in sorted(set(successful) | set(failed))
+        ]
+    return [dict(zip(columns, (value(raw) for raw in row))) for row in results[0]]
+
+
+@app.route(route="metrics/{metric}", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def metrics_api(req: func.HttpRequest) -> func.HttpResponse:
     """
-    Store incident data in Azure SQL Database using Entra ID authentication
-    Incidents are GitHub Issues with labels "incident" AND "production"
+    DORA metrics read API for dashboards and bots, served from the aggregate tables
+    GET /api/metrics/{deployment_frequency|lead_time|change_failure_rate|time_to_restore}
+        ?from=2024-01-01&to=2024-04-01&granularity=week[&repo=org/name][&team=Platform][&environment=production]
+    Responses are cached in process and carry an ETag; If-None-Match answers 304 without touching SQL.
     """
-    logging.info(f"[store_incidents] Starting to store {len(incidents)} incidents")
-    
-    if not incidents:
-        logging.info("[store_incidents] No incidents to store")
-        return
+    metric = req.route_params.get("metric", "")
+    if metric not in METRIC_TABLES:
+        return func.HttpResponse(f"metric must be one of: {', '.join(METRIC_TABLES)}", status_code=404)
+    granularity = req.params.get("granularity", "week").lower()
+    if granularity not in METRICS_GRANULARITIES:
+        return func.HttpResponse(f"granularity must be one of: {', '.join(METRICS_GRANULARITIES)}", status_code=400)
+    try:
+        end = datetime.strptime(req.params["to"], "%Y-%m-%d") if req.params.get("to") else datetime.combine(datetime.now(timezone.utc).date() + timedelta(days=1), datetime.min.time())
+        start = datetime.strptime(req.params["from"], "%Y-%m-%d") if req.params.get("from") else end - timedelta(days=METRICS_DEFAULT_RANGE_DAYS)
+    except ValueError:
+        return func.HttpResponse("from/to must be dates (YYYY-MM-DD)", status_code=400)
+    if end <= start:
+        return func.HttpResponse("to must be after from", status_code=400)
+    repository = req.params.get("repo") or None
+    team = req.params.get("team") or None
+    environment = req.params.get("environment") or None
     
-    conn = None
-    cursor = None
+    tables = METRIC_TABLES[metric] + (("repositories",) if team else ())
+    key = json.dumps([metric, start.date().isoformat(), end.date().isoformat(), granularity, repository, team, environment])
+    headers = {"Cache-Control": "no-cache"}
+    cached = metrics_cache.get(key, tables)
+    if cached:
+        body, etag = cached
+    else:
+        versions = metrics_cache.versions(tables)
+        try:
+            data = query_metric(metric, start, end, granularity, repository, team, environment)
+        except Exception as e:
+            logging.error(f"[METRICS-API] Error querying {metric}: {type(e).__name__}: {str(e)}")
+            return func.HttpResponse("Failed to query metrics", status_code=500)
+        body = json.dumps({
+            "metric": metric,
+            "granularity": granularity,
+            "from": start.date().isoformat(),
+            "to": end.date().isoformat(),
+            "repository": repository,
+            "team": team,
+            "data": data
+        })
+        etag = f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]}"'
+        metrics_cache.put(key, versions, body, etag)
     
-    try:
-        # Get access token for SQL Database using Managed Identity
-        logging.info("[store_incidents] Getting access token for SQL Database...")
-        credential = DefaultAzureCredential()
-        token = credential.get_token("https://database.windows.net/.default")
-        logging.info("[store_incidents] Access token acquired successfully")
-        
-        # Connection string for Entra ID authentication
-        connection_string = f"Driver={{ODBC Driver 18 for SQL Server}};Server=tcp:{SQL_SERVER},1433;Database={SQL_DATABASE};Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30"
-        logging.info(f"[store_incidents] Connecting to SQL Server: {SQL_SERVER}, Database: {SQL_DATABASE}")
-        
-        # SQL_COPT_SS_ACCESS_TOKEN constant for pyodbc
-        SQL_COPT_SS_ACCESS_TOKEN = 1256
-        
-        # Encode the token properly with length prefix using struct
-        token_bytes = token.token.encode('utf-16-le')
-        token_struct = struct.pack(f'<I{len(token_bytes)}s', len(token_bytes), token_bytes)
-        logging.info(f"[store_incidents] Token encoded and packed, length: {len(token_struct)} bytes")
-        
-        # Attempt connection
-        logging.info("[store_incidents] Attempting pyodbc.connect()...")
-        conn = pyodbc.connect(connection_string, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: token_struct})
-        logging.info("[store_incidents] Database connection established successfully")
-        
-        cursor = conn.cursor()
-        logging.info("[store_incidents] Database cursor created")
-        
-        # Insert incidents using MERGE for idempotent upserts
-        logging.info("[store_incidents] Preparing to insert incidents...")
-        merge_query = """
-        MERGE INTO incidents AS target
-        USING (SELECT ? AS repository, ? AS issue_number) AS source
-        ON target.repository = source.repository AND target.issue_number = source.issue_number
-        WHEN MATCHED THEN
-            UPDATE SET 
-                title = ?,
-                closed_at = ?,
-                state = ?,
-                labels = ?,
-                product = ?,
-                creator = ?,
-                url = ?,
-                collected_at = ?
-        WHEN NOT MATCHED THEN
-            INSERT (issue_number, repository, title, created_at, closed_at, state, labels, product, creator, url, collected_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-        """
-        
-        inserted_count = 0
-        for idx, incident in enumerate(incidents, 1):
-            try:
-                logging.debug(f"[store_incidents] Processing incident {idx}/{len(incidents)}: {incident['repository']}#{incident['issue_number']}")
-                cursor.execute(merge_query,
-                    # USING clause
-                    incident["repository"],
-                    incident["issue_number"],
-                    # WHEN MATCHED UPDATE
-                    incident["title"],
-                    incident["closed_at"],
-                    incident["state"],
-                    incident["labels"],
-                    incident.get("product"),
-                    incident["creator"],
-                    incident["url"],
-                    datetime.now(timezone.utc).isoformat(),
-                    # WHEN NOT MATCHED INSERT
-                    incident["issue_number"],
-                    incident["repository"],
-                    incident["title"],
-                    incident["created_at"],
-                    incident["closed_at"],
-                    incident["state"],
-                    incident["labels"],
-                    incident.get("product"),
-                    incident["creator"],
-                    incident["url"],
-                    datetime.now(timezone.utc).isoformat()
-                )
-                inserted_count += 1
-            except Exception as insert_error:
-                logging.error(f"[store_incidents] Error inserting incident {incident['repository']}#{incident['issue_number']}: {type(insert_error).__name__}: {str(insert_error)}")
-                raise
-        
-        logging.info(f"[store_incidents] Committing transaction with {inserted_count} incidents...")
-        conn.commit()
-        logging.info(f"[store_incidents] Successfully stored {inserted_count} incidents")
-        
-        # Verify records were inserted
-        cursor.execute("SELECT COUNT(*) FROM incidents WHERE collected_at >= DATEADD(minute, -5, GETUTCDATE())")
-        result = cursor.fetchone()
-        count = result[0] if result else 0
-        logging.info(f"[store_incidents] VERIFICATION: {count} records found in incidents table from last 5 minutes")
-        
-        # Log correlation preview stats (deployments with incidents in 24h window)
-        cursor.execute("""
-            SELECT COUNT(DISTINCT d.id) as deployment_count,
-                   COUNT(DISTINCT i.id) as incident_count
-            FROM deployments d
-            LEFT JOIN incidents i 
-                ON d.repository = i.repository
-                AND i.created_at >= d.created_at
-                AND i.created_at <= DATEADD(HOUR, 24, d.created_at)
-            WHERE d.created_at >= DATEADD(day, -1, GETUTCDATE())
-        """)
-        stats = cursor.fetchone()
-        if stats:
-            logging.info(f"[store_incidents] CORRELATION PREVIEW: {stats[0]} deployments, {stats[1]} incidents in last 24h")
-        else:
-            logging.info("[store_incidents] CORRELATION PREVIEW: No correlation data available")
-        
-    except Exception as e:
-        logging.error(f"[store_incidents] Database error: {type(e).__name__}: {str(e)}")
-        import traceback
-        logging.error(f"[store_incidents] Traceback: {traceback.format_exc()}")
-        if conn:
-            try:
-                conn.rollback()
-                logging.info("[store_incidents] Transaction rolled back")
-            except:
-                logging.error("[store_incidents] Error during rollback")
-        raise
-    finally:
-        if cursor:
-            try:
-                cursor.close()
-                logging.debug("[store_incidents] Cursor closed")
-            except Exception as cleanup_error:
-                logging.error(f"[store_incidents] Error closing cursor: {type(cleanup_error).__name__}: {str(cleanup_error)}")
-        if conn:
-            try:
-                conn.close()
-                logging.debug("[store_incidents] Connection closed")
-            except Exception as cleanup_error:
-                logging.error(f"[store_incidents] Error closing connection: {type(cleanup_error).__name__}: {str(cleanup_error)}")
+    headers["ETag"] = etag
+    if_none_match = req.headers.get("If-None-Match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return func.HttpResponse(status_code=304, headers=headers)
+    return func.HttpResponse(body, status_code=200, mimetype="application/json", headers=headers)
 
 
 @app.route(route="health", methods=["GET"])
@@ -1243,8 +5298,21 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
     """
     Health check endpoint
     """
+    body = {
+        "status": "healthy",
+        "service": "dora-metrics-collector",
+        "sql_pool": sql_pool.get_stats(),
+        "github_rate_limit": github_rate_limiter.get_stats(),
+        "metrics_cache": metrics_cache.get_stats(),
+        "recent_runs": [
+            {key: run[key] for key in ("run", "status", "started_at", "wall_seconds", "bottleneck")}
+            for run in list(recent_runs)
+        ]
+    }
+    if shard_coordinator:
+        body["shards"] = shard_coordinator.get_stats()
     return func.HttpResponse(
-        '{"status": "healthy", "service": "dora-metrics-collector"}',
+        json.dumps(body),
         status_code=200,
         mimetype="application/json"
     )
@@ -0,0 +1,354 @@
+"""
+Vectorized DORA metrics engine
+Loads deployment, pull request and incident columns into NumPy arrays and computes deployment
+frequency, lead time for changes, change failure rate and time to restore per repository, team
+or product and per day, week or month. Same semantics as the SQL side (vw_lead_time_analysis /
+lead_time_facts, vw_cfr_analysis / deployment_incidents with the "all" attribution rule,
+incident_restore_daily), but with sort/searchsorted joins and bincount grouping instead of
+row-by-row joins, so millions of rows take seconds.
+
+Results are column dicts ({"group": array, "period": array, ...}); to_records() turns them into
+JSON-friendly rows.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DIMENSIONS = ("repository", "team", "product")
+PERIODS = ("day", "week", "month")
+UNASSIGNED_TEAM = "(unassigned)"
+UNSPECIFIED_PRODUCT = "(unspecified)"  # Same placeholder as incident_restore_daily.product
+NO_TIME = np.iinfo(np.int64).min  # Missing timestamp (NULL) in the int64 epoch-second columns
+
+
+def to_epoch_seconds(values: Sequence[Any]) -> np.ndarray:
+    """datetimes / ISO strings / datetime64 (None allowed) -> int64 epoch seconds, NO_TIME for missing"""
+    if isinstance(values, np.ndarray) and values.dtype == np.int64:
+        return values
+    array = np.array([value.replace(tzinfo=None) if isinstance(value, datetime) else value for value in values],
+                     dtype="datetime64[s]")
+    seconds = array.astype(np.int64)
+    seconds[np.isnat(array)] = NO_TIME
+    return seconds
+
+
+def factorize(values: Sequence[Any], missing: str = "") -> Tuple[np.ndarray, np.ndarray]:
+    """(codes, labels) for a string column; None becomes `missing`"""
+    array = np.array([missing if value is None else value for value in values], dtype=object)
+    labels, codes = np.unique(array.astype(str), return_inverse=True)
+    return codes.astype(np.int64), labels
+
+
+def period_codes(seconds: np.ndarray, period: str) -> np.ndarray:
+    """Period index of epoch seconds: days, Monday-based weeks or calendar months since 1970"""
+    days = seconds // 86400
+    if period == "day":
+        return days
+    if period == "week":
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    if period == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    raise ValueError(f"period must be one of {PERIODS}, got '{period}'")
+
+
+def period_starts(codes: np.ndarray, period: str) -> np.ndarray:
+    """First day (datetime64[D]) of each period code"""
+    if period == "day":
+        return codes.astype("datetime64[D]")
+    if period == "week":
+        return (codes * 7 - 3).astype("datetime64[D]")
+    return codes.astype("datetime64[M]").astype("datetime64[D]")
+
+
+def minutes_between(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Minute boundaries crossed between start and end, like T-SQL DATEDIFF(MINUTE, start, end)"""
+    return end // 60 - start // 60
+
+
+def grouped_percentiles(groups: np.ndarray, values: np.ndarray, group_count: int, quantiles: Sequence[float]) -> List[np.ndarray]:
+    """
+    Per-group linear-interpolated percentiles (PERCENTILE_CONT) of values
+    One lexsort for all groups; each group's order statistics are then read at computed offsets.
+    Groups without values get NaN.
+    """
+    order = np.lexsort((values, groups))
+    sorted_values = values[order].astype(np.float64)
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    results = []
+    for quantile in quantiles:
+        result = np.full(group_count, np.nan)
+        present = counts > 0
+        position = quantile * (counts[present] - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        fraction = position - lower
+        base = starts[present]
+        result[present] = sorted_values[base + lower] * (1 - fraction) + sorted_values[base + upper] * fraction
+        results.append(result)
+    return results
+
+
+class MetricsEngine:
+    """
+    DORA metrics over in-memory columns
+    deployments: repository, environment, status, commit_sha, created_at
+    pull_requests: repository, merge_commit_sha, created_at, merged_at, first_commit_date
+    incidents: repository, product, state, created_at, closed_at
+    repositories (optional): name, team, product
+    Timestamps may be datetimes, ISO strings, datetime64 or int64 epoch seconds (naive UTC).
+    """
+
+    def __init__(self, deployments: Dict[str, Sequence[Any]], pull_requests: Dict[str, Sequence[Any]],
+                 incidents: Dict[str, Sequence[Any]], repositories: Optional[Dict[str, Sequence[Any]]] = None,
+                 environment: str = "production", attribution_window_hours: int = 24):
+        self.environment = environment
+        self.attribution_window_seconds = attribution_window_hours * 3600
+
+        # One repository dictionary shared by every table, so codes compare across tables
+        repository_names = np.unique(np.concatenate([
+            np.asarray(deployments["repository"], dtype=object).astype(str),
+            np.asarray(pull_requests["repository"], dtype=object).astype(str),
+            np.asarray(incidents["repository"], dtype=object).astype(str),
+            np.asarray((repositories or {}).get("name", []), dtype=object).astype(str)
+        ]))
+        self.repositories = repository_names
+
+        def repository_codes(values) -> np.ndarray:
+            return np.searchsorted(repository_names, np.asarray(values, dtype=object).astype(str)).astype(np.int64)
+
+        # Repository -> team / product lookups, indexed by repository code
+        repo_team = np.full(len(repository_names), UNASSIGNED_TEAM, dtype=object)
+        repo_product = np.full(len(repository_names), UNSPECIFIED_PRODUCT, dtype=object)
+        if repositories:
+            codes = repository_codes(repositories["name"])
+            repo_team[codes] = [team or UNASSIGNED_TEAM for team in repositories.get("team", [None] * len(codes))]
+            repo_product[codes] = [product or UNSPECIFIED_PRODUCT for product in repositories.get("product", [None] * len(codes))]
+        self.team_codes, self.teams = factorize(repo_team)
+        self.repo_product_codes, self.repo_products = factorize(repo_product)
+
+        # Deployments in the tracked environment only
+        environment_mask = np.asarray(deployments["environment"], dtype=object).astype(str) == environment
+        self.deploy_repo = repository_codes(deployments["repository"])[environment_mask]
+        self.deploy_time = to_epoch_seconds(deployments["created_at"])[environment_mask]
+        self.deploy_success = (np.asarray(deployments["status"], dtype=object).astype(str) == "SUCCESS")[environment_mask]
+        commit_values = np.asarray(deployments["commit_sha"], dtype=object)[environment_mask]
+        pr_commit_values = np.asarray(pull_requests["merge_commit_sha"], dtype=object)
+        # Commit dictionary shared by deployments and PRs (for the lead time join)
+        commit_codes, self._commits = factorize(np.concatenate([commit_values, pr_commit_values]))
+        self.deploy_commit = commit_codes[:len(commit_values)]
+        self.pr_commit = commit_codes[len(commit_values):]
+        self.pr_has_commit = np.array([value is not None for value in pr_commit_values], dtype=bool)
+
+        self.pr_repo = repository_codes(pull_requests["repository"])
+        self.pr_created = to_epoch_seconds(pull_requests["created_at"])
+        self.pr_merged = to_epoch_seconds(pull_requests["merged_at"])
+        self.pr_first_commit = to_epoch_seconds(pull_requests["first_commit_date"])
+
+        self.incident_repo = repository_codes(incidents["repository"])
+        self.incident_product_codes, self.incident_products = factorize(incidents["product"], missing=UNSPECIFIED_PRODUCT)
+        self.incident_closed = np.asarray(incidents["state"], dtype=object).astype(str) == "closed"
+        self.incident_created = to_epoch_seconds(incidents["created_at"])
+        self.incident_closed_at = to_epoch_seconds(incidents["closed_at"])
+
+    @property
+    def size(self) -> Dict[str, int]:
+        return {"deployments": len(self.deploy_repo), "pull_requests": len(self.pr_repo), "incidents": len(self.incident_repo)}
+
+    def _dimension(self, by: str, repo_codes: np.ndarray, product_codes: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(codes, labels) of the grouping dimension for rows identified by repository code"""
+        if by == "repository":
+            return repo_codes, self.repositories
+        if by == "team":
+            return self.team_codes[repo_codes], self.teams
+        if by == "product":
+            if product_codes is not None:
+                return product_codes, self.incident_products
+            return self.repo_product_codes[repo_codes], self.repo_products
+        raise ValueError(f"by must be one of {DIMENSIONS}, got '{by}'")
+
+    @staticmethod
+    def _group(dimension_codes: np.ndarray, seconds: np.ndarray, period: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(group index per row, dimension code per group, period code per group)"""
+        periods = period_codes(seconds, period)
+        period_offset = periods.min() if len(periods) else 0
+        span = (periods.max() - period_offset + 1) if len(periods) else 1
+        keys = dimension_codes * span + (periods - period_offset)
+        unique_keys, group_index = np.unique(keys, return_inverse=True)
+        return group_index, unique_keys // span, unique_keys % span + period_offset
+
+    def _result(self, labels: np.ndarray, group_dimensions: np.ndarray, group_periods: np.ndarray,
+                period: str, **columns: np.ndarray) -> Dict[str, np.ndarray]:
+        result = {"group": labels[group_dimensions], "period": period_starts(group_periods, period)}
+        result.update(columns)
+        return result
+
+    def deployment_frequency(self, by: str = "repository", period: str = "day") -> Dict[str, np.ndarray]:
+        """Deployments to the tracked environment and how many succeeded, per group and period"""
+        dimension, labels = self._dimension(by, self.deploy_repo)
+        group_index, group_dimensions, group_periods = self._group(dimension, self.deploy_time, period)
+        group_count = len(group_dimensions)
+        return self._result(
+            labels, group_dimensions, group_periods, period,
+            deployments=np.bincount(group_index, minlength=group_count),
+            successful_deployments=np.bincount(group_index, weights=self.deploy_success, minlength=group_count).astype(np.int64)
+        )
+
+    def lead_time_pairs(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (PR index, first deployment time, lead time minutes) for PRs whose merge commit reached the environment
+        The first deployment per (repository, commit) is found with one lexsort; PRs are then
+        joined to it with searchsorted on the combined key, as lead_time_facts does in SQL.
+        """
+        commit_count = len(self._commits) + 1
+        deploy_keys = self.deploy_repo * commit_count + self.deploy_commit
+        order = np.lexsort((self.deploy_time, deploy_keys))
+        sorted_keys = deploy_keys[order]
+        first = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])) if len(sorted_keys) else np.zeros(0, dtype=bool)
+        first_keys = sorted_keys[first]
+        first_times = self.deploy_time[order][first]
+
+        pr_keys = self.pr_repo * commit_count + self.pr_commit
+        position = np.searchsorted(first_keys, pr_keys)
+        position_clipped = np.minimum(position, max(len(first_keys) - 1, 0))
+        matched = self.pr_has_commit & (position < len(first_keys))
+        if len(first_keys):
+            matched &= first_keys[position_clipped] == pr_keys
+        pr_index = np.nonzero(matched)[0]
+        deployed_at = first_times[position_clipped[pr_index]]
+        start = np.where(self.pr_first_commit[pr_index] != NO_TIME, self.pr_first_commit[pr_index], self.pr_created[pr_index])
+        return pr_index, deployed_at, minutes_between(start, deployed_at)
+
+    def lead_time(self, by: str = "repository", period: str = "week") -> Dict[str, np.ndarray]:
+        """Lead time for changes (first commit, or PR creation, to first deployment) per group and deployment period"""
+        pr_index, deployed_at, minutes = self.lead_time_pairs()
+        dimension, labels = self._dimension(by, self.pr_repo[pr_index])
+        group_index, group_dimensions, group_periods = self._group(dimension, deployed_at, period)
+        group_count = len(group_dimensions)
+        counts = np.bincount(group_index, minlength=group_count)
+        p50, p90 = grouped_percentiles(group_index, minutes, group_count, (0.5, 0.9))
+        return self._result(
+            labels, group_dimensions, group_periods, period,
+            changes=counts,
+            mean_lead_time_minutes=np.bincount(group_index, weights=minutes, minlength=group_count) / np.maximum(counts, 1),
+            p50_lead_time_minutes=p50,
+            p90_lead_time_minutes=p90
+        )
+
+    def failed_deployments(self) -> np.ndarray:
+        """
+        Whether each successful deployment has an incident in its repository within the attribution window
+        Incidents are sorted once by (repository, created_at); each deployment's window is then two
+        searchsorted bounds, so the range join costs O((D + I) log I).
+        """
+        # (repository, time) packed into one int64 key; times relative to the earliest incident fit in 2^39 seconds
+        offset = self.incident_created.min() if len(self.incident_created) else 0
+        incident_keys = np.sort(self.incident_repo * (1 << 40) + (self.incident_created - offset))
+        window_start = self.deploy_repo * (1 << 40) + (self.deploy_time - offset)
+        window_end = window_start + self.attribution_window_seconds
+        return np.searchsorted(incident_keys, window_end, side="right") > np.searchsorted(incident_keys, window_start, side="left")
+
+    def change_failure_rate(self, by: str = "repository", period: str = "month") -> Dict[str, np.ndarray]:
+        """Share of successful deployments followed by an incident within the attribution window"""
+        success = self.deploy_success
+        failed = self.failed_deployments()[success]
+        dimension, labels = self._dimension(by, self.deploy_repo[success])
+        group_index, group_dimensions, group_periods = self._group(dimension, self.deploy_time[success], period)
+        group_count = len(group_dimensions)
+        deployments = np.bincount(group_index, minlength=group_count)
+        failed_counts = np.bincount(group_index, weights=failed, minlength=group_count).astype(np.int64)
+        return self._result(
+            labels, group_dimensions, group_periods, period,
+            deployments=deployments,
+            failed_deployments=failed_counts,
+            change_failure_rate=failed_counts / np.maximum(deployments, 1)
+        )
+
+    def time_to_restore(self, by: str = "repository", period: str = "month") -> Dict[str, np.ndarray]:
+        """Restore time distribution of closed incidents per group and period they were closed in"""
+        closed = self.incident_closed & (self.incident_closed_at != NO_TIME)
+        repo_codes = self.incident_repo[closed]
+        dimension, labels = self._dimension(by, repo_codes, self.incident_product_codes[closed] if by == "product" else None)
+        minutes = minutes_between(self.incident_created[closed], self.incident_closed_at[closed])
+        group_index, group_dimensions, group_periods = self._group(dimension, self.incident_closed_at[closed], period)
+        group_count = len(group_dimensions)
+        counts = np.bincount(group_index, minlength=group_count)
+        p50, p90 = grouped_percentiles(group_index, minutes, group_count, (0.5, 0.9))
+        max_minutes = np.full(group_count, np.iinfo(np.int64).min)
+        np.maximum.at(max_minutes, group_index, minutes)
+        return self._result(
+            labels, group_dimensions, group_periods, period,
+            restored_incidents=counts,
+            mean_restore_minutes=np.bincount(group_index, weights=minutes, minlength=group_count) / np.maximum(counts, 1),
+            p50_restore_minutes=p50,
+            p90_restore_minutes=p90,
+            max_restore_minutes=max_minutes
+        )
+
+    def compute(self, metric: str, by: str = "repository", period: str = "week") -> Dict[str, np.ndarray]:
+        """Dispatch by metric name: deployment_frequency, lead_time, change_failure_rate or time_to_restore"""
+        metrics = {
+            "deployment_frequency": self.deployment_frequency,
+            "lead_time": self.lead_time,
+            "change_failure_rate": self.change_failure_rate,
+            "time_to_restore": self.time_to_restore
+        }
+        if metric not in metrics:
+            raise ValueError(f"metric must be one of {list(metrics)}, got '{metric}'")
+        return metrics[metric](by, period)
+
+    @classmethod
+    def from_database(cls, conn, start: datetime, end: datetime, lead_time_lookback_days: int = 90,
+                      environment: str = "production", attribution_window_hours: int = 24) -> "MetricsEngine":
+        """
+        Load the columns for [start, end) from the DORA database (a pyodbc connection)
+        PRs merged up to lead_time_lookback_days before start are included so changes deployed in
+        the range are matched to their PRs; incidents are loaded if open or closed in the range.
+        """
+        def columns(query: str, params: tuple, names: List[str]) -> Dict[str, List[Any]]:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            data = {name: [] for name in names}
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                for row in rows:
+                    for name, value in zip(names, row):
+                        data[name].append(value)
+            cursor.close()
+            return data
+
+        deployments = columns(
+            "SELECT repository, environment, status, commit_sha, created_at FROM deployments WHERE created_at >= ? AND created_at < ?",
+            (start, end), ["repository", "environment", "status", "commit_sha", "created_at"])
+        pull_requests = columns(
+            "SELECT repository, merge_commit_sha, created_at, merged_at, first_commit_date FROM pull_requests "
+            "WHERE merged_at >= DATEADD(DAY, ?, ?) AND merged_at < ?",
+            (-lead_time_lookback_days, start, end), ["repository", "merge_commit_sha", "created_at", "merged_at", "first_commit_date"])
+        incidents = columns(
+            "SELECT repository, product, state, created_at, closed_at FROM incidents "
+            "WHERE created_at < ? AND (closed_at IS NULL OR closed_at >= ?)",
+            (end, start), ["repository", "product", "state", "created_at", "closed_at"])
+        repositories = columns("SELECT name, team, product FROM repositories", (), ["name", "team", "product"])
+        return cls(deployments, pull_requests, incidents, repositories, environment, attribution_window_hours)
+
+
+def to_records(result: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Column dict -> list of JSON-friendly row dicts (periods as YYYY-MM-DD, NaN as None)"""
+    names = list(result)
+    columns = []
+    for name in names:
+        column = result[name]
+        if np.issubdtype(column.dtype, np.datetime64):
+            columns.append([str(value) for value in column.astype("datetime64[D]")])
+        elif np.issubdtype(column.dtype, np.floating):
+            columns.append([None if np.isnan(value) else round(float(value), 2) for value in column])
+        elif np.issubdtype(column.dtype, np.integer):
+            columns.append([int(value) for value in column])
+        else:
+            columns.append([str(value) for value in column])
+    return [dict(zip(names, row)) for row in zip(*columns)]
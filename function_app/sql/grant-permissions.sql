@@ -13,7 +13,9 @@ GO
 
 -- Step 2: Grant data writer permissions (INSERT, UPDATE, DELETE)
 -- Required for: deployments, deployment_metrics_daily, repositories,
---               pull_requests, incidents tables
+--               pull_requests, lead_time_facts, incidents, deployment_incidents,
+--               incident_restore_daily, collection_watermarks,
+--               backfill_checkpoints, collector_leases tables
 ALTER ROLE db_datawriter ADD MEMBER [dora-metrics-deploy-frequency];
 GO
 
@@ -40,7 +42,9 @@ SELECT
 FROM sys.objects 
 WHERE type IN ('U', 'V')
     AND name IN ('deployments', 'deployment_metrics_daily', 'repositories', 
-                 'pull_requests', 'incidents', 'vw_cfr_analysis', 'vw_lead_time_analysis')
+                 'pull_requests', 'lead_time_facts', 'incidents', 'deployment_incidents',
+                 'incident_restore_daily', 'collection_watermarks', 'backfill_checkpoints',
+                 'collector_leases', 'vw_cfr_analysis', 'vw_lead_time_analysis')
 ORDER BY type_desc, name;
 GO
 
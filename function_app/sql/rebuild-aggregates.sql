@@ -0,0 +1,150 @@
+-- ============================================================================
+-- DORA Metrics - Rebuild incrementally maintained tables
+-- The collector maintains these tables at ingestion time, touching only the keys
+-- each write affects. Run this once after upgrading an existing database, or
+-- whenever they need to be re-derived from the raw tables.
+-- ============================================================================
+
+-- ============================================================================
+-- 1. deployment_metrics_daily
+-- ============================================================================
+BEGIN TRANSACTION;
+
+DELETE FROM deployment_metrics_daily;
+
+INSERT INTO deployment_metrics_daily (date, repository, environment, total_deployments, successful_deployments, failed_deployments, calculated_at)
+SELECT
+    CAST(created_at AS DATE) as deployment_date,
+    repository,
+    environment,
+    COUNT(*) as total_deployments,
+    SUM(CASE WHEN status = 'SUCCESS' THEN 1 ELSE 0 END) as successful_deployments,
+    SUM(CASE WHEN status IN ('FAILURE', 'ERROR') THEN 1 ELSE 0 END) as failed_deployments,
+    GETUTCDATE()
+FROM deployments WITH (TABLOCKX)
+GROUP BY CAST(created_at AS DATE), repository, environment;
+
+COMMIT TRANSACTION;
+GO
+
+-- ============================================================================
+-- 2. lead_time_facts
+-- ============================================================================
+BEGIN TRANSACTION;
+
+DELETE FROM lead_time_facts;
+
+WITH first_deployments AS (
+    SELECT
+        deployment_id,
+        repository,
+        commit_sha,
+        environment,
+        created_at,
+        ROW_NUMBER() OVER (PARTITION BY repository, commit_sha, environment ORDER BY created_at, deployment_id) as deploy_rank
+    FROM deployments WITH (TABLOCKX)
+)
+INSERT INTO lead_time_facts (repository, pr_number, environment, merge_commit_sha, pr_created_at, merged_at, first_commit_date,
+                             first_deployment_id, first_deployed_at, lead_time_minutes, lead_time_from_pr_minutes,
+                             lead_time_from_merge_minutes, updated_at)
+SELECT
+    pr.repository,
+    pr.pr_number,
+    fd.environment,
+    pr.merge_commit_sha,
+    pr.created_at,
+    pr.merged_at,
+    pr.first_commit_date,
+    fd.deployment_id,
+    fd.created_at,
+    DATEDIFF(MINUTE, COALESCE(pr.first_commit_date, pr.created_at), fd.created_at),
+    DATEDIFF(MINUTE, pr.created_at, fd.created_at),
+    DATEDIFF(MINUTE, pr.merged_at, fd.created_at),
+    GETUTCDATE()
+FROM pull_requests pr
+JOIN first_deployments fd
+    ON fd.repository = pr.repository
+    AND fd.commit_sha = pr.merge_commit_sha
+    AND fd.deploy_rank = 1;
+
+COMMIT TRANSACTION;
+GO
+
+-- ============================================================================
+-- 3. deployment_incidents
+-- Uses the default attribution rule (INCIDENT_ATTRIBUTION_RULE=all,
+-- INCIDENT_ATTRIBUTION_WINDOW_HOURS=24, INCIDENT_ATTRIBUTION_ENVIRONMENT=production);
+-- adjust the literals below if the Function App is configured differently.
+-- Links to deployments already archived by the retention job are kept.
+-- ============================================================================
+BEGIN TRANSACTION;
+
+DELETE FROM deployment_incidents
+WHERE deployment_id IN (SELECT deployment_id FROM deployments);
+
+INSERT INTO deployment_incidents (deployment_id, repository, issue_number, deployment_created_at, incident_created_at,
+                                  minutes_after_deployment, attribution_rule, linked_at)
+SELECT
+    d.deployment_id,
+    i.repository,
+    i.issue_number,
+    d.created_at,
+    i.created_at,
+    DATEDIFF(MINUTE, d.created_at, i.created_at),
+    'all/24h/production',
+    GETUTCDATE()
+FROM incidents i
+JOIN deployments d
+    ON d.repository = i.repository
+    AND d.environment = 'production'
+    AND d.status = 'SUCCESS'
+    AND d.created_at <= i.created_at
+    AND d.created_at >= DATEADD(HOUR, -24, i.created_at);
+
+COMMIT TRANSACTION;
+GO
+
+-- ============================================================================
+-- 4. incident_restore_daily
+-- ============================================================================
+BEGIN TRANSACTION;
+
+DELETE FROM incident_restore_daily;
+
+WITH restores AS (
+    SELECT
+        CAST(closed_at AS DATE) as restore_date,
+        repository,
+        ISNULL(product, '(unspecified)') as product,
+        DATEDIFF(MINUTE, created_at, closed_at) as restore_minutes
+    FROM incidents WITH (TABLOCKX)
+    WHERE state = 'closed' AND closed_at IS NOT NULL
+)
+INSERT INTO incident_restore_daily (date, repository, product, restored_incidents, mean_restore_minutes,
+                                    p50_restore_minutes, p90_restore_minutes, max_restore_minutes, calculated_at)
+SELECT DISTINCT
+    restore_date,
+    repository,
+    product,
+    COUNT(*) OVER (PARTITION BY restore_date, repository, product),
+    AVG(CAST(restore_minutes AS FLOAT)) OVER (PARTITION BY restore_date, repository, product),
+    PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY restore_minutes) OVER (PARTITION BY restore_date, repository, product),
+    PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY restore_minutes) OVER (PARTITION BY restore_date, repository, product),
+    MAX(restore_minutes) OVER (PARTITION BY restore_date, repository, product),
+    GETUTCDATE()
+FROM restores;
+
+COMMIT TRANSACTION;
+GO
+
+-- ============================================================================
+-- VERIFICATION
+-- ============================================================================
+SELECT 'deployment_metrics_daily' as table_name, COUNT(*) as row_count FROM deployment_metrics_daily
+UNION ALL
+SELECT 'lead_time_facts', COUNT(*) FROM lead_time_facts
+UNION ALL
+SELECT 'deployment_incidents', COUNT(*) FROM deployment_incidents
+UNION ALL
+SELECT 'incident_restore_daily', COUNT(*) FROM incident_restore_daily;
+GO
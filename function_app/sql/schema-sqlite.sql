@@ -0,0 +1,124 @@
+-- ============================================================================
+-- DORA Metrics - SQLite schema (DATA_STORE=sqlite)
+-- Same tables, keys and indexes as schema.sql for the write path, for local runs, CI and
+-- benchmarks. Applied automatically by SqliteDataStore; timestamps are UTC text
+-- ('YYYY-MM-DD HH:MM:SS'), dates 'YYYY-MM-DD'.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS deployments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deployment_id TEXT NOT NULL UNIQUE,
+    repository TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    creator TEXT,
+    status TEXT,
+    status_updated_at TEXT,
+    collected_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_deployments_repo_commit ON deployments (repository, commit_sha);
+CREATE INDEX IF NOT EXISTS IX_deployments_repo_env_created ON deployments (repository, environment, created_at);
+
+CREATE TABLE IF NOT EXISTS deployment_metrics_daily (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    repository TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    total_deployments INTEGER NOT NULL,
+    successful_deployments INTEGER NOT NULL,
+    failed_deployments INTEGER NOT NULL,
+    calculated_at TEXT NOT NULL,
+    CONSTRAINT UQ_metrics_daily UNIQUE (date, repository, environment)
+);
+
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    team TEXT,
+    product TEXT,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS pull_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pr_number INTEGER NOT NULL,
+    repository TEXT NOT NULL,
+    title TEXT,
+    author TEXT,
+    created_at TEXT NOT NULL,
+    merged_at TEXT NOT NULL,
+    merge_commit_sha TEXT NOT NULL,
+    base_branch TEXT NOT NULL,
+    first_commit_date TEXT,
+    collected_at TEXT NOT NULL,
+    CONSTRAINT UQ_pr_repo_number UNIQUE (repository, pr_number)
+);
+CREATE INDEX IF NOT EXISTS IX_pr_repo_merge_commit ON pull_requests (repository, merge_commit_sha);
+
+CREATE TABLE IF NOT EXISTS lead_time_facts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    repository TEXT NOT NULL,
+    pr_number INTEGER NOT NULL,
+    environment TEXT NOT NULL,
+    merge_commit_sha TEXT NOT NULL,
+    pr_created_at TEXT NOT NULL,
+    merged_at TEXT NOT NULL,
+    first_commit_date TEXT,
+    first_deployment_id TEXT NOT NULL,
+    first_deployed_at TEXT NOT NULL,
+    lead_time_minutes INTEGER NOT NULL,
+    lead_time_from_pr_minutes INTEGER NOT NULL,
+    lead_time_from_merge_minutes INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    CONSTRAINT UQ_lead_time_pr_environment UNIQUE (repository, pr_number, environment)
+);
+CREATE INDEX IF NOT EXISTS IX_lead_time_deployed_at ON lead_time_facts (environment, first_deployed_at);
+
+CREATE TABLE IF NOT EXISTS incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    issue_number INTEGER NOT NULL,
+    repository TEXT NOT NULL,
+    title TEXT,
+    created_at TEXT NOT NULL,
+    closed_at TEXT,
+    state TEXT NOT NULL,
+    labels TEXT,
+    product TEXT,
+    creator TEXT,
+    url TEXT,
+    collected_at TEXT NOT NULL,
+    CONSTRAINT UQ_incident_repo_number UNIQUE (repository, issue_number)
+);
+CREATE INDEX IF NOT EXISTS IX_incidents_repo_created ON incidents (repository, created_at);
+CREATE INDEX IF NOT EXISTS IX_incidents_repo_closed ON incidents (repository, closed_at);
+
+CREATE TABLE IF NOT EXISTS incident_restore_daily (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    repository TEXT NOT NULL,
+    product TEXT NOT NULL,
+    restored_incidents INTEGER NOT NULL,
+    mean_restore_minutes REAL NOT NULL,
+    p50_restore_minutes REAL NOT NULL,
+    p90_restore_minutes REAL NOT NULL,
+    max_restore_minutes INTEGER NOT NULL,
+    calculated_at TEXT NOT NULL,
+    CONSTRAINT UQ_restore_daily UNIQUE (date, repository, product)
+);
+
+CREATE TABLE IF NOT EXISTS deployment_incidents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deployment_id TEXT NOT NULL,
+    repository TEXT NOT NULL,
+    issue_number INTEGER NOT NULL,
+    deployment_created_at TEXT NOT NULL,
+    incident_created_at TEXT NOT NULL,
+    minutes_after_deployment INTEGER NOT NULL,
+    attribution_rule TEXT NOT NULL,
+    linked_at TEXT NOT NULL,
+    CONSTRAINT UQ_deployment_incident UNIQUE (deployment_id, repository, issue_number)
+);
+CREATE INDEX IF NOT EXISTS IX_deployment_incidents_incident ON deployment_incidents (repository, issue_number);
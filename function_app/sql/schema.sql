@@ -2,9 +2,9 @@
 -- DORA Metrics - Unified Database Schema
 -- Creates all tables for the four DORA metrics:
 --   1. Deployment Frequency (deployments, deployment_metrics_daily, repositories)
---   2. Lead Time for Changes (pull_requests)
---   3. Change Failure Rate (incidents)
---   4. Time to Restore Service (uses incidents.created_at and incidents.closed_at)
+--   2. Lead Time for Changes (pull_requests, lead_time_facts)
+--   3. Change Failure Rate (incidents, deployment_incidents)
+--   4. Time to Restore Service (incident_restore_daily, derived from incidents.created_at and incidents.closed_at)
 --
 -- Run this script in Azure Portal Query Editor or Azure Data Studio
 -- Connect to: sql-dora-metrics-dfoggi.database.windows.net
@@ -30,11 +30,14 @@ CREATE TABLE deployments (
     collected_at DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
     INDEX IX_deployments_repository (repository),
     INDEX IX_deployments_created_at (created_at),
-    INDEX IX_deployments_environment (environment)
+    INDEX IX_deployments_environment (environment),
+    INDEX IX_deployments_repo_commit (repository, commit_sha),
+    INDEX IX_deployments_repo_env_created (repository, environment, created_at) INCLUDE (status)
 );
 GO
 
 -- Daily aggregated deployment metrics table
+-- Maintained incrementally by store_deployments; rebuild with rebuild-aggregates.sql
 CREATE TABLE deployment_metrics_daily (
     id INT IDENTITY(1,1) PRIMARY KEY,
     date DATE NOT NULL,
@@ -89,6 +92,31 @@ CREATE TABLE pull_requests (
 );
 GO
 
+-- Lead time facts: one row per merged PR and environment it reached
+-- Maintained at ingestion time by store_pull_requests and store_deployments (whichever side of
+-- the merge_commit_sha = commit_sha match arrives last); first_deployed_at is the first deployment
+-- of the merge commit to that environment
+CREATE TABLE lead_time_facts (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    repository NVARCHAR(255) NOT NULL,
+    pr_number INT NOT NULL,
+    environment NVARCHAR(50) NOT NULL,
+    merge_commit_sha NVARCHAR(40) NOT NULL,
+    pr_created_at DATETIME2 NOT NULL,
+    merged_at DATETIME2 NOT NULL,
+    first_commit_date DATETIME2,
+    first_deployment_id NVARCHAR(255) NOT NULL,
+    first_deployed_at DATETIME2 NOT NULL,
+    lead_time_minutes INT NOT NULL,  -- First commit (or PR creation) to first deployment (canonical DORA)
+    lead_time_from_pr_minutes INT NOT NULL,
+    lead_time_from_merge_minutes INT NOT NULL,
+    updated_at DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
+    CONSTRAINT UQ_lead_time_pr_environment UNIQUE (repository, pr_number, environment),
+    INDEX IX_lead_time_deployed_at (environment, first_deployed_at) INCLUDE (repository, lead_time_minutes),
+    INDEX IX_lead_time_repo_deployed_at (repository, first_deployed_at)
+);
+GO
+
 -- ============================================================================
 -- 3. CHANGE FAILURE RATE / TIME TO RESTORE TABLE
 -- ============================================================================
@@ -113,16 +141,101 @@ CREATE TABLE incidents (
     INDEX IX_incidents_created_at (created_at),
     INDEX IX_incidents_state (state),
     INDEX IX_incidents_product (product),
-    INDEX IX_incidents_collected_at (collected_at)
+    INDEX IX_incidents_collected_at (collected_at),
+    INDEX IX_incidents_repo_created (repository, created_at),
+    INDEX IX_incidents_repo_closed (repository, closed_at),
+    INDEX IX_incidents_closed_at (closed_at)  -- Retention job: oldest closed days first
+);
+GO
+
+-- Daily time-to-restore aggregates (by day the incidents were closed)
+-- Maintained at ingestion time by store_incidents: closing an incident adds it to its key,
+-- reopening it retracts it
+CREATE TABLE incident_restore_daily (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    date DATE NOT NULL,
+    repository NVARCHAR(255) NOT NULL,
+    product NVARCHAR(255) NOT NULL,  -- '(unspecified)' when the issue has no Product Affected field
+    restored_incidents INT NOT NULL,
+    mean_restore_minutes FLOAT NOT NULL,
+    p50_restore_minutes FLOAT NOT NULL,
+    p90_restore_minutes FLOAT NOT NULL,
+    max_restore_minutes INT NOT NULL,
+    calculated_at DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
+    CONSTRAINT UQ_restore_daily UNIQUE (date, repository, product),
+    INDEX IX_restore_daily_repository (repository, date)
+);
+GO
+
+-- Deployment -> incident links for Change Failure Rate
+-- Maintained at ingestion time by store_incidents and store_deployments: an incident is linked to
+-- the successful deployments of its repository within the attribution window before it;
+-- attribution_rule records the rule used, e.g. 'all/24h/production' or 'latest/24h/production'
+CREATE TABLE deployment_incidents (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    deployment_id NVARCHAR(255) NOT NULL,  -- deployments.deployment_id
+    repository NVARCHAR(255) NOT NULL,
+    issue_number INT NOT NULL,
+    deployment_created_at DATETIME2 NOT NULL,
+    incident_created_at DATETIME2 NOT NULL,
+    minutes_after_deployment INT NOT NULL,
+    attribution_rule NVARCHAR(100) NOT NULL,
+    linked_at DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
+    CONSTRAINT UQ_deployment_incident UNIQUE (deployment_id, repository, issue_number),
+    INDEX IX_deployment_incidents_incident (repository, issue_number),
+    INDEX IX_deployment_incidents_deployed_at (deployment_created_at)
 );
 GO
 
 -- ============================================================================
--- 4. POWERBI VIEWS (Optional - for easier data consumption)
+-- 4. COLLECTION STATE TABLES
 -- ============================================================================
 
--- View: Change Failure Rate analysis (deployments correlated with incidents)
-CREATE VIEW vw_cfr_analysis AS
+-- Per-repository watermarks for incremental collection
+-- Newest createdAt (deployments), mergedAt (pull_requests) or updatedAt (incidents) stored so far;
+-- repository = '*' holds the newest value seen across the whole organization
+CREATE TABLE collection_watermarks (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    repository NVARCHAR(255) NOT NULL,
+    entity_type NVARCHAR(50) NOT NULL,  -- 'deployments', 'pull_requests' or 'incidents'
+    watermark_at DATETIME2 NOT NULL,
+    updated_at DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
+    CONSTRAINT UQ_watermark_repo_entity UNIQUE (repository, entity_type)
+);
+GO
+
+-- Collector leases for SHARDING_ENABLED: 'member:<instance>' rows are instance heartbeats,
+-- 'partition:<n>' rows assign a consistent-hash repository partition to one instance
+CREATE TABLE collector_leases (
+    lease_key NVARCHAR(300) NOT NULL PRIMARY KEY,
+    owner NVARCHAR(255) NOT NULL,  -- SHARD_INSTANCE_ID of the holder
+    expires_at DATETIME2 NOT NULL,
+    renewed_at DATETIME2 NOT NULL DEFAULT GETUTCDATE()
+);
+GO
+
+-- Historical backfill checkpoints: last stored page per backfill run, entity and repository
+-- backfill_id is derived from the requested range/entities, so repeating a call resumes it
+CREATE TABLE backfill_checkpoints (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    backfill_id NVARCHAR(400) NOT NULL,
+    entity_type NVARCHAR(50) NOT NULL,  -- 'deployments', 'pull_requests' or 'incidents'
+    repository NVARCHAR(255) NOT NULL,
+    page_cursor NVARCHAR(255),  -- GraphQL endCursor of the last stored page
+    items_stored INT NOT NULL DEFAULT 0,
+    completed BIT NOT NULL DEFAULT 0,
+    updated_at DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
+    CONSTRAINT UQ_backfill_checkpoint UNIQUE (backfill_id, entity_type, repository)
+);
+GO
+
+-- ============================================================================
+-- 5. POWERBI VIEWS (Optional - for easier data consumption)
+-- ============================================================================
+
+-- View: Change Failure Rate analysis (deployments with their attributed incidents)
+-- Reads the links precomputed in deployment_incidents instead of a range join
+CREATE OR ALTER VIEW vw_cfr_analysis AS
 SELECT 
     d.id as deployment_id,
     d.deployment_id as deployment_github_id,
@@ -139,41 +252,43 @@ SELECT
     i.state as incident_state,
     i.labels as incident_labels,
     i.creator as incident_creator,
-    DATEDIFF(MINUTE, d.created_at, i.created_at) as minutes_after_deployment,
-    CAST(DATEDIFF(MINUTE, d.created_at, i.created_at) / 60.0 AS DECIMAL(10,2)) as hours_after_deployment
+    l.minutes_after_deployment,
+    CAST(l.minutes_after_deployment / 60.0 AS DECIMAL(10,2)) as hours_after_deployment,
+    l.attribution_rule
 FROM deployments d
-LEFT JOIN incidents i 
-    ON d.repository = i.repository
-    AND i.created_at >= d.created_at
-    AND i.created_at <= DATEADD(HOUR, 24, d.created_at)
+LEFT JOIN deployment_incidents l ON l.deployment_id = d.deployment_id
+LEFT JOIN incidents i ON i.repository = l.repository AND i.issue_number = l.issue_number
 WHERE d.environment = 'production' 
     AND d.status = 'SUCCESS';
 GO
 
--- View: Lead Time for Changes (PRs linked to deployments)
-CREATE VIEW vw_lead_time_analysis AS
+-- View: Lead Time for Changes (PRs linked to their first deployment per environment)
+-- Reads the facts maintained in lead_time_facts instead of joining pull_requests to deployments;
+-- pull_requests and deployments are only looked up by key, so rows survive retention
+CREATE OR ALTER VIEW vw_lead_time_analysis AS
 SELECT 
     pr.id as pr_id,
-    pr.pr_number,
-    pr.repository,
+    lt.pr_number,
+    lt.repository,
     pr.title as pr_title,
     pr.author,
-    pr.created_at as pr_created_at,
-    pr.merged_at as pr_merged_at,
-    pr.first_commit_date,
-    pr.merge_commit_sha,
+    lt.pr_created_at,
+    lt.merged_at as pr_merged_at,
+    lt.first_commit_date,
+    lt.merge_commit_sha,
     pr.base_branch,
     d.id as deployment_id,
-    d.environment,
-    d.created_at as deployed_at,
+    lt.environment,
+    lt.first_deployed_at as deployed_at,
     d.status as deployment_status,
     -- Lead time from first commit to deployment (canonical DORA)
-    DATEDIFF(MINUTE, COALESCE(pr.first_commit_date, pr.created_at), d.created_at) as lead_time_minutes,
-    CAST(DATEDIFF(MINUTE, COALESCE(pr.first_commit_date, pr.created_at), d.created_at) / 60.0 AS DECIMAL(10,2)) as lead_time_hours,
+    lt.lead_time_minutes,
+    CAST(lt.lead_time_minutes / 60.0 AS DECIMAL(10,2)) as lead_time_hours,
     -- Lead time from PR creation to deployment (alternative)
-    DATEDIFF(MINUTE, pr.created_at, d.created_at) as lead_time_from_pr_minutes
-FROM pull_requests pr
-LEFT JOIN deployments d ON pr.merge_commit_sha = d.commit_sha;
+    lt.lead_time_from_pr_minutes
+FROM lead_time_facts lt
+LEFT JOIN pull_requests pr ON pr.repository = lt.repository AND pr.pr_number = lt.pr_number
+LEFT JOIN deployments d ON d.deployment_id = lt.first_deployment_id;
 GO
 
 -- ============================================================================
@@ -187,7 +302,9 @@ SELECT
 FROM sys.objects 
 WHERE type IN ('U', 'V')  -- U = User Table, V = View
     AND name IN ('deployments', 'deployment_metrics_daily', 'repositories', 
-                 'pull_requests', 'incidents', 'vw_cfr_analysis', 'vw_lead_time_analysis')
+                 'pull_requests', 'lead_time_facts', 'incidents', 'deployment_incidents',
+                 'incident_restore_daily', 'collection_watermarks', 'backfill_checkpoints',
+                 'collector_leases', 'vw_cfr_analysis', 'vw_lead_time_analysis')
 ORDER BY type_desc, name;
 GO
 
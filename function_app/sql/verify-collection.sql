@@ -159,10 +159,8 @@ WITH deployments_with_incidents AS (
         d.id as deployment_id,
         CASE 
             WHEN EXISTS (
-                SELECT 1 FROM incidents i 
-                WHERE i.repository = d.repository
-                AND i.created_at >= d.created_at
-                AND i.created_at <= DATEADD(HOUR, 24, d.created_at)
+                SELECT 1 FROM deployment_incidents l 
+                WHERE l.deployment_id = d.deployment_id
             ) THEN 1 ELSE 0 
         END as has_incident
     FROM deployments d
@@ -200,6 +198,21 @@ GROUP BY repository
 ORDER BY avg_restore_minutes DESC;
 GO
 
+-- Restore-time distribution per day (maintained aggregate, last 30 days)
+SELECT 
+    date,
+    repository,
+    product,
+    restored_incidents,
+    CAST(mean_restore_minutes AS DECIMAL(10,1)) as mean_restore_minutes,
+    CAST(p50_restore_minutes AS DECIMAL(10,1)) as p50_restore_minutes,
+    CAST(p90_restore_minutes AS DECIMAL(10,1)) as p90_restore_minutes,
+    max_restore_minutes
+FROM incident_restore_daily
+WHERE date >= DATEADD(day, -30, CAST(GETUTCDATE() AS DATE))
+ORDER BY date DESC, repository, product;
+GO
+
 -- ============================================================================
 -- 5. OVERALL SUMMARY
 -- ============================================================================
@@ -215,12 +228,8 @@ SELECT 'Correlated PR-Deployments' as metric, COUNT(DISTINCT pr.id) as count
 FROM pull_requests pr
 INNER JOIN deployments d ON pr.merge_commit_sha = d.commit_sha
 UNION ALL
-SELECT 'Deployments with Incidents (24h)' as metric, COUNT(DISTINCT d.id) as count
-FROM deployments d
-INNER JOIN incidents i 
-    ON d.repository = i.repository
-    AND i.created_at >= d.created_at
-    AND i.created_at <= DATEADD(HOUR, 24, d.created_at);
+SELECT 'Deployments with Incidents (attributed)' as metric, COUNT(DISTINCT deployment_id) as count
+FROM deployment_incidents;
 GO
 
 PRINT 'Verification complete!'
@@ -0,0 +1,51 @@
+"""
+Retention rollups: the changed-commits query each table passes to update_lead_time_facts
+update_lead_time_facts wraps it as SELECT DISTINCT repository, commit_sha FROM (<query>), so the
+query is run the same way against an in-memory copy of the RETENTION_TABLES columns.
+
+Usage: python -m pytest tests
+"""
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import function_app  # noqa: E402
+
+
+class RecordingCursor:
+    """Cursor that records the T-SQL sent by the rollup"""
+
+    def __init__(self):
+        self.queries = []
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        self.queries.append((query, params))
+
+
+def raw_tables() -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:")
+    for table, spec in function_app.RETENTION_TABLES.items():
+        db.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {', '.join(name for name, _ in spec['columns'])})")
+    return db
+
+
+@pytest.mark.parametrize("table", list(function_app.RETENTION_TABLES))
+def test_rollup_archive_day(table, monkeypatch):
+    changed_queries = []
+    monkeypatch.setattr(function_app, "update_lead_time_facts",
+                        lambda cursor, query, params=(): changed_queries.append((query, params)) or 0)
+    cursor = RecordingCursor()
+
+    function_app.rollup_archive_day(cursor, table, datetime(2024, 1, 1), datetime(2024, 1, 2))
+
+    assert cursor.queries or changed_queries
+    db = raw_tables()
+    for query, params in changed_queries:
+        db.execute(f"SELECT DISTINCT repository, commit_sha FROM ({query}) AS changed_commits",
+                   [function_app.sqlite_datetime(value) for value in params])